@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApiKeysConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.api_keys"
+
+    def ready(self):
+        from apps.api_keys import signals  # noqa: F401
@@ -0,0 +1,184 @@
+"""
+Hot-path support for X-API-Key requests.
+
+Resolved keys are cached in Redis under their HMAC (never the plaintext),
+in a hash holding the key/org record and a live usage counter:
+
+    apikey:<hmac>          rec=<json>  used=<int>   (TTL API_KEY_CACHE_TTL_S)
+    apikey:pending:<id>    requests not yet written to APIKey.usage_count
+    apikey:dirty           ids with pending usage
+
+record_usage() only touches Redis; flush_api_key_usage (Celery beat) moves
+pending counts into the DB in one UPDATE per key. Quota checks read the
+live counter, so they do not wait for the flush. If Redis is down we fall
+back to the direct DB lookup and increment.
+"""
+import json
+import logging
+import uuid
+
+import redis
+from django.conf import settings
+from django.db.models import F
+
+from apps.api_keys.models import APIKey
+from apps.organizations.models import Organization
+
+log = logging.getLogger(__name__)
+
+DIRTY_KEY = "apikey:dirty"
+
+_KEY_FIELDS = ("id", "organization_id", "name", "status", "usage_count", "quota", "scope", "key_hmac")
+# everything the key path reads off request.organization (ann.coarse_params
+# included); a field left out is deferred and costs a query per request
+ORG_FIELDS = ("id", "name", "logo_url", "retrieval_coarse_dims", "retrieval_coarse_factor")
+
+# Increment the live counter only while the cached record exists; a bare
+# HINCRBY on an expired hash would recreate it with a bogus count.
+_INCR_LIVE = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return redis.call('HINCRBY', KEYS[1], 'used', 1)
+end
+return nil
+"""
+
+_r = None
+_incr_live = None
+
+
+def _client():
+    global _r, _incr_live
+    if _r is None:
+        _r = redis.from_url(getattr(settings, "IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"))
+        _incr_live = _r.register_script(_INCR_LIVE)
+    return _r
+
+
+def _k(key_hmac: str) -> str:
+    return f"apikey:{key_hmac}"
+
+
+def _kp(key_id) -> str:
+    return f"apikey:pending:{key_id}"
+
+
+def resolve(raw: str) -> APIKey:
+    """
+    Return the APIKey (with .organization and .live_usage set) for a
+    plaintext key. Raises APIKey.DoesNotExist.
+    """
+    key_hmac = APIKey._hmac(raw)
+    try:
+        r = _client()
+        data = r.hgetall(_k(key_hmac))
+    except redis.RedisError:
+        api_key = APIKey.get_by_plaintext(raw)
+        api_key.live_usage = api_key.usage_count
+        return api_key
+
+    if data.get(b"rec"):
+        api_key = _from_record(json.loads(data[b"rec"]))
+        api_key.live_usage = int(data.get(b"used") or api_key.usage_count)
+        return api_key
+
+    api_key = APIKey.objects.select_related("organization").get(key_hmac=key_hmac)
+    try:
+        pending = int(r.get(_kp(api_key.pk)) or 0)
+        ttl = int(getattr(settings, "API_KEY_CACHE_TTL_S", 300))
+        p = r.pipeline()
+        p.hset(_k(key_hmac), "rec", json.dumps(_to_record(api_key)))
+        p.hsetnx(_k(key_hmac), "used", api_key.usage_count + pending)
+        p.expire(_k(key_hmac), ttl)
+        p.hget(_k(key_hmac), "used")
+        used = p.execute()[-1]
+        api_key.live_usage = int(used)
+    except redis.RedisError:
+        api_key.live_usage = api_key.usage_count
+    return api_key
+
+
+def invalidate(api_key: APIKey) -> None:
+    """Drop the cached record (revoke/delete). Pending usage is kept for the flush."""
+    if not api_key.key_hmac:
+        return
+    try:
+        _client().delete(_k(api_key.key_hmac))
+    except redis.RedisError:
+        log.warning("api key cache: could not invalidate %s", api_key.pk)
+
+
+def invalidate_org(org_id) -> None:
+    """Drop the cached records of every key of an organization (org settings changed)."""
+    hmacs = APIKey.objects.filter(organization_id=org_id).exclude(key_hmac=None).values_list("key_hmac", flat=True)
+    keys = [_k(h) for h in hmacs if h]
+    if not keys:
+        return
+    try:
+        _client().delete(*keys)
+    except redis.RedisError:
+        log.warning("api key cache: could not invalidate keys of org %s", org_id)
+
+
+def record_usage(api_key: APIKey) -> None:
+    try:
+        r = _client()
+        p = r.pipeline()
+        p.incr(_kp(api_key.pk))
+        p.sadd(DIRTY_KEY, str(api_key.pk))
+        p.execute()
+        if api_key.key_hmac:
+            _incr_live(keys=[_k(api_key.key_hmac)])
+    except redis.RedisError:
+        APIKey.objects.filter(pk=api_key.pk).update(usage_count=F("usage_count") + 1)
+
+
+def flush_pending() -> int:
+    """Write pending usage to APIKey.usage_count. Returns keys flushed."""
+    r = _client()
+    flushed = 0
+    for raw_id in r.smembers(DIRTY_KEY):
+        key_id = raw_id.decode()
+        # SREM before GETDEL: an increment racing in between re-marks the key
+        r.srem(DIRTY_KEY, key_id)
+        n = int(r.getdel(_kp(key_id)) or 0)
+        if not n:
+            continue
+        try:
+            APIKey.objects.filter(pk=key_id).update(usage_count=F("usage_count") + n)
+        except Exception:
+            p = r.pipeline()
+            p.incrby(_kp(key_id), n)
+            p.sadd(DIRTY_KEY, key_id)
+            p.execute()
+            raise
+        flushed += 1
+    return flushed
+
+
+def _to_record(api_key: APIKey) -> dict:
+    org = api_key.organization
+    return {
+        "key": {f: _jsonable(getattr(api_key, f)) for f in _KEY_FIELDS},
+        "org": {f: _jsonable(getattr(org, f)) for f in ORG_FIELDS},
+    }
+
+
+def _from_record(rec: dict) -> APIKey:
+    k, o = rec["key"], rec["org"]
+    k["id"] = uuid.UUID(k["id"])
+    k["organization_id"] = uuid.UUID(k["organization_id"])
+    o["id"] = uuid.UUID(o["id"])
+    api_key = _build(APIKey, k)
+    api_key.organization = _build(Organization, o)
+    return api_key
+
+
+def _build(model, data: dict):
+    # from_db marks the remaining fields deferred (loaded lazily if touched);
+    # values must follow concrete field order.
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in data]
+    return model.from_db("default", names, [data[n] for n in names])
+
+
+def _jsonable(v):
+    return str(v) if isinstance(v, uuid.UUID) else v
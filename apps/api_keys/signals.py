@@ -0,0 +1,23 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.api_keys import cache
+from apps.api_keys.models import APIKey
+from apps.organizations.models import Organization
+
+# Invalidate after commit: dropped earlier, a concurrent resolve() could
+# re-cache the old row from the DB before the change is visible.
+
+
+@receiver([post_save, post_delete], sender=APIKey)
+def _api_key_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(cache.invalidate, instance))
+
+
+@receiver(post_save, sender=Organization)
+def _organization_changed(sender, instance, **kwargs):
+    # cached key records carry cache.ORG_FIELDS
+    transaction.on_commit(partial(cache.invalidate_org, instance.pk))
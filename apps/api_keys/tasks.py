@@ -0,0 +1,15 @@
+import logging
+
+from celery import shared_task
+
+from apps.api_keys.cache import flush_pending
+
+log = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def flush_api_key_usage():
+    """Periodic: move Redis usage counters into APIKey.usage_count."""
+    n = flush_pending()
+    if n:
+        log.info("Flushed usage for %d API keys", n)
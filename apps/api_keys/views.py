@@ -24,7 +24,7 @@ class APIKeyRevokeView(generics.UpdateAPIView):
     def patch(self, request, *args, **kwargs):
         key = self.get_object()
         key.status = APIKey.Status.REVOKED
-        key.save(update_fields=["status"])
+        key.save(update_fields=["status"])  # cached record dropped on commit (signals)
         return Response(status=204)
 
 class APIKeyDeleteView(generics.DestroyAPIView):
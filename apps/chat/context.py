@@ -0,0 +1,138 @@
+"""
+Packing retrieved chunks into the prompt context under a token budget.
+
+  1. drop chunks scoring below CHAT_CONTEXT_SCORE_RATIO x the best score
+     (relative, so it adapts to cosine and ts_rank scales). Not applied to
+     hybrid results: an RRF score only spans 1/(k+r) to 2/(k+r), so one
+     chunk found by both retrievers would push nearly every other one under
+     the ratio; fusion depth and the token budget bound those instead
+  2. merge chunks of the same document that are adjacent (chunk_index,
+     chunk_index + 1) into one block, removing the text they share
+     (chunking overlaps neighbours by CHUNK_OVERLAP_*)
+  3. add blocks best-first while they fit the model's token budget
+     (CHAT_CONTEXT_MAX_TOKENS[_BY_MODEL]) and MAX_CONTEXT_CHARS; the first
+     block that does not fit is cut to the room left, keeping only the
+     chunks whose text starts before the cut
+
+Tokens are counted with tiktoken for the chat model (common.llm.tokens).
+The returned rows are the chunks that made it into the context, so
+citations match what the model saw.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from common.llm.tokens import CHARS_PER_TOKEN, count_tokens, split_tokens
+
+SEPARATOR = "\n\n---\n\n"
+# shorter shared runs are more likely coincidence than chunk overlap
+_MIN_OVERLAP_CHARS = 16
+# a truncated block shorter than this is not worth its tokens
+_MIN_TAIL_TOKENS = 32
+
+
+@dataclass(frozen=True)
+class Packed:
+    blocks: List[str]
+    rows: List[Dict]
+    stats: Dict
+
+
+def budget_tokens(model: Optional[str]) -> int:
+    """Context token budget for a chat model: longest CHAT_CONTEXT_MAX_TOKENS_BY_MODEL prefix match."""
+    by_model = getattr(settings, "CHAT_CONTEXT_MAX_TOKENS_BY_MODEL", {}) or {}
+    matches = [name for name in by_model if model and model.startswith(name)]
+    if matches:
+        return int(by_model[max(matches, key=len)])
+    return int(getattr(settings, "CHAT_CONTEXT_MAX_TOKENS", 3000))
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is a prefix of `b`."""
+    for k in range(min(len(a), len(b)), _MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+def _merge(rows: List[Dict]) -> Tuple[List[Tuple[float, str, List[Tuple[int, Dict]]]], int]:
+    """
+    ([(score, text, [(offset, member row)])] best-first, overlap chars removed).
+    A member's offset is where its own (non-overlapping) text starts in `text`.
+    """
+    by_doc: Dict[str, List[Dict]] = {}
+    for r in rows:
+        by_doc.setdefault(str(r["document_id"]), []).append(r)
+    blocks, removed = [], 0
+    for doc_rows in by_doc.values():
+        doc_rows.sort(key=lambda r: r["chunk_index"])
+        run = [(0, doc_rows[0])]
+        text = doc_rows[0]["content"]
+        for r in doc_rows[1:]:
+            if r["chunk_index"] == run[-1][1]["chunk_index"] + 1:
+                k = _overlap(text, r["content"])
+                removed += k
+                text += r["content"][k:] if k else "\n" + r["content"]
+                run.append((len(text) - len(r["content"]) + k, r))
+                continue
+            blocks.append((max(x["score"] for _, x in run), text, run))
+            run, text = [(0, r)], r["content"]
+        blocks.append((max(x["score"] for _, x in run), text, run))
+    blocks.sort(key=lambda b: b[0], reverse=True)
+    return blocks, removed
+
+
+def pack(rows: List[Dict], model: Optional[str] = None, mode: str = "vector") -> Packed:
+    """
+    Blocks for the prompt context from retrieved rows (best first); see
+    module docstring. `mode` is the retrieval mode that produced the rows.
+    """
+    budget = budget_tokens(model)
+    max_chars = int(getattr(settings, "MAX_CONTEXT_CHARS", 12000))
+    ratio = float(getattr(settings, "CHAT_CONTEXT_SCORE_RATIO", 0.0))
+
+    kept = rows
+    if rows and ratio > 0 and mode != "hybrid":
+        top = max(r["score"] for r in rows)
+        if top > 0:
+            kept = [r for r in rows if r["score"] >= top * ratio]
+    merged, overlap_removed = _merge(kept) if kept else ([], 0)
+
+    sep_tokens = count_tokens(SEPARATOR, model)
+    blocks, used_rows = [], []
+    tokens = chars = 0
+    truncated = False
+    for _, text, members in merged:
+        sep = (sep_tokens, len(SEPARATOR)) if blocks else (0, 0)
+        cost = count_tokens(text, model) + sep[0]
+        if tokens + cost > budget or chars + len(text) + sep[1] > max_chars:
+            char_room = max_chars - chars - sep[1]
+            room = min(budget - tokens - sep[0], char_room // CHARS_PER_TOKEN)
+            if room < _MIN_TAIL_TOKENS:
+                break
+            text = split_tokens(text, room, model=model)[0][:char_room]
+            cost = count_tokens(text, model) + sep[0]
+            truncated = True
+            # cite only the chunks whose own text made it past the cut
+            members = [(offset, r) for offset, r in members if offset < len(text)]
+        blocks.append(text)
+        used_rows.extend(r for _, r in members)
+        tokens += cost
+        chars += len(text) + sep[1]
+        if truncated:
+            break
+
+    used = {(str(r["document_id"]), r["chunk_index"]) for r in used_rows}
+    stats = {
+        "chunks_retrieved": len(rows),
+        "chunks_below_cutoff": len(rows) - len(kept),
+        "chunks_over_budget": len(kept) - len(used),
+        "chunks_used": len(used),
+        "blocks": len(blocks),
+        "overlap_chars_removed": overlap_removed,
+        "truncated": truncated,
+        "tokens": tokens,
+        "budget_tokens": budget,
+    }
+    return Packed(blocks, [r for r in rows if (str(r["document_id"]), r["chunk_index"]) in used], stats)
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:11
+
+import django.db.models.deletion
+import pgvector.django.vector
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("organizations", "0001_initial"),
+        ("documents", "0001_initial"),  # creates the pgvector extension
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SemanticCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("corpus_version", models.PositiveIntegerField()),
+                ("question", models.TextField()),
+                ("embedding", pgvector.django.vector.VectorField(dimensions=1536)),
+                ("answer", models.TextField()),
+                ("citations", models.JSONField(default=list)),
+                ("model", models.CharField(max_length=100)),
+                ("usage", models.JSONField(default=dict)),
+                ("hits", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("last_hit_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="organizations.organization",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["organization", "fingerprint", "corpus_version"],
+                        name="chat_semant_organiz_95099b_idx",
+                    ),
+                    models.Index(
+                        fields=["created_at"], name="chat_semant_created_5ee5e5_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -1,3 +1,31 @@
+import uuid
+from django.conf import settings
 from django.db import models
+from pgvector.django import VectorField
 
-# Create your models here.
+
+class SemanticCacheEntry(models.Model):
+    """
+    A stored answer for a question, reusable for semantically equivalent
+    questions under the same bot config (fingerprint) and document corpus
+    version. See apps.chat.semantic_cache.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    organization = models.ForeignKey("organizations.Organization", on_delete=models.CASCADE)
+    fingerprint = models.CharField(max_length=64)
+    corpus_version = models.PositiveIntegerField()
+    question = models.TextField()
+    embedding = VectorField(dimensions=getattr(settings, "EMBEDDING_DIM", 1536))
+    answer = models.TextField()
+    citations = models.JSONField(default=list)
+    model = models.CharField(max_length=100)
+    usage = models.JSONField(default=dict)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["organization", "fingerprint", "corpus_version"]),
+            models.Index(fields=["created_at"]),
+        ]
@@ -0,0 +1,173 @@
+"""
+Opt-in per-org semantic answer cache.
+
+A cached answer is served when an incoming question's embedding is within
+Chatbot.semantic_cache_threshold (cosine similarity) of a stored question
+that was answered under the same:
+  - bot config + provider/model + retrieval knobs (fingerprint), and
+  - document corpus version ("corpus" version stamp, bumped whenever an
+    org's documents finish processing or are deleted).
+
+Only single-turn requests (no assistant messages) are cached, since the
+answer to a follow-up depends on the conversation, not just the question.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+import redis
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+from pgvector.django import CosineDistance
+
+from apps.chat.models import SemanticCacheEntry
+from apps.documents.retrieval import resolve_mode
+from common.utils import version_stamps
+
+log = logging.getLogger(__name__)
+
+CORPUS_SCOPE = "corpus"
+
+_r = None
+
+
+def _client():
+    global _r
+    if _r is None:
+        _r = redis.from_url(getattr(settings, "IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"))
+    return _r
+
+
+def _ks(org_id) -> str:
+    return f"semcache:stats:{org_id}"
+
+
+def is_cacheable(bot, payload: Dict) -> bool:
+    if not getattr(bot, "semantic_cache_enabled", False):
+        return False
+    return not any(m.get("role") == "assistant" for m in payload.get("messages", []))
+
+
+def fingerprint(bot, client, payload: Dict) -> str:
+    parts = {
+        "tone": bot.tone,
+        "instructions": bot.system_instructions or "",
+        "provider": type(client).__name__,
+        "model": client.model,
+        "top_k": payload.get("top_k"),
+        "filters": payload.get("filters") or {},
+        "retrieval_mode": resolve_mode(payload.get("retrieval_mode"), bot),
+        "max_tokens": payload.get("max_tokens"),
+        "temperature": payload.get("temperature"),
+    }
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def corpus_version(org_id) -> Optional[int]:
+    return version_stamps.get(CORPUS_SCOPE, str(org_id))
+
+
+def bump_corpus_version(org_id) -> None:
+    version_stamps.bump_on_commit(CORPUS_SCOPE, str(org_id))
+
+
+def lookup(org_id, fp: str, version: int, qvec: List[float], threshold: float) -> Optional[SemanticCacheEntry]:
+    ttl = int(getattr(settings, "SEMANTIC_CACHE_TTL_S", 7 * 24 * 3600))
+    entry = (
+        SemanticCacheEntry.objects.filter(
+            organization_id=org_id,
+            fingerprint=fp,
+            corpus_version=version,
+            created_at__gte=timezone.now() - timedelta(seconds=ttl),
+        )
+        .annotate(distance=CosineDistance("embedding", qvec))
+        .order_by("distance")
+        .first()
+    )
+    if entry is None or (1.0 - float(entry.distance)) < threshold:
+        _record(org_id, hit=False)
+        return None
+    SemanticCacheEntry.objects.filter(pk=entry.pk).update(hits=F("hits") + 1, last_hit_at=timezone.now())
+    _record(org_id, hit=True, usage=entry.usage, model=entry.model)
+    return entry
+
+
+def store(org_id, fp: str, version: int, question: str, qvec: List[float],
+          answer: str, citations: List[Dict], model: str, usage: Dict) -> None:
+    if not answer:
+        return
+    try:
+        SemanticCacheEntry.objects.create(
+            organization_id=org_id,
+            fingerprint=fp,
+            corpus_version=version,
+            question=question,
+            embedding=qvec,
+            answer=answer,
+            citations=json.loads(json.dumps(citations, default=str)),
+            model=model,
+            usage=usage or {},
+        )
+    except DatabaseError:
+        # the answer was already produced; a failed write only costs a future miss
+        log.warning("semantic cache: could not store entry for org %s", org_id, exc_info=True)
+
+
+def purge_expired() -> int:
+    ttl = int(getattr(settings, "SEMANTIC_CACHE_TTL_S", 7 * 24 * 3600))
+    deleted, _ = SemanticCacheEntry.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=ttl)
+    ).delete()
+    return deleted
+
+
+def _record(org_id, *, hit: bool, usage: Dict | None = None, model: str = "") -> None:
+    try:
+        p = _client().pipeline(transaction=False)
+        if not hit:
+            p.hincrby(_ks(org_id), "misses", 1)
+        else:
+            usage = usage or {}
+            prompt = int(usage.get("prompt_tokens") or 0)
+            completion = int(usage.get("completion_tokens") or 0)
+            p.hincrby(_ks(org_id), "hits", 1)
+            p.hincrby(_ks(org_id), "saved_prompt_tokens", prompt)
+            p.hincrby(_ks(org_id), "saved_completion_tokens", completion)
+            cost = _estimate_cost(model, prompt, completion)
+            if cost:
+                p.hincrbyfloat(_ks(org_id), "saved_cost_usd", cost)
+        p.execute()
+    except redis.RedisError:
+        pass
+
+
+def _estimate_cost(model: str, prompt: int, completion: int) -> float:
+    """LLM_TOKEN_PRICES maps model -> [usd per 1k prompt, usd per 1k completion]."""
+    prices = getattr(settings, "LLM_TOKEN_PRICES", {}) or {}
+    price = prices.get(model)
+    if not price:
+        return 0.0
+    return prompt / 1000 * float(price[0]) + completion / 1000 * float(price[1])
+
+
+def stats(org_id) -> Dict:
+    try:
+        raw = _client().hgetall(_ks(org_id)) or {}
+    except redis.RedisError:
+        raw = {}
+    data = {k.decode(): float(v) if b"." in v else int(v) for k, v in raw.items()}
+    hits, misses = data.get("hits", 0), data.get("misses", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "saved_calls": hits,
+        "saved_prompt_tokens": data.get("saved_prompt_tokens", 0),
+        "saved_completion_tokens": data.get("saved_completion_tokens", 0),
+        "saved_cost_usd": round(float(data.get("saved_cost_usd", 0.0)), 6),
+    }
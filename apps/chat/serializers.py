@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.conf import settings
+from apps.documents.retrieval import MODES
 
 MAX_MESSAGES = 40
 MAX_MESSAGE_CHARS = 8000
@@ -16,6 +17,7 @@ class ChatRequestSerializer(serializers.Serializer):
     temperature = serializers.FloatField(required=False, min_value=0.0, max_value=2.0, default=0.2)
     top_k = serializers.IntegerField(required=False, min_value=1, max_value=20, default=6)
     filters = serializers.DictField(required=False)
+    retrieval_mode = serializers.ChoiceField(choices=MODES, required=False)  # default: the chatbot's
     metadata = serializers.DictField(required=False)
 
     def validate(self, data):
@@ -40,10 +42,19 @@ class ChatRequestSerializer(serializers.Serializer):
         return data
 
 class ChatResponseCitationSerializer(serializers.Serializer):
-    doc_id = serializers.CharField()
+    doc_id = serializers.CharField(source="document_id")
     chunk_index = serializers.IntegerField()
     score = serializers.FloatField()
 
+class ChatTimingsSerializer(serializers.Serializer):
+    """Per-stage wall time. Embedding and config overlap, so stages may sum past total_ms."""
+    config_ms = serializers.IntegerField(min_value=0, required=False)
+    cache_ms = serializers.IntegerField(min_value=0, required=False)
+    embedding_ms = serializers.IntegerField(min_value=0, required=False)
+    retrieval_ms = serializers.IntegerField(min_value=0, required=False)
+    llm_ms = serializers.IntegerField(min_value=0, required=False)
+    total_ms = serializers.IntegerField(min_value=0)
+
 class ChatResponseSerializer(serializers.Serializer):
     id = serializers.CharField()
     session_id = serializers.CharField(allow_null=True)
@@ -52,4 +63,4 @@ class ChatResponseSerializer(serializers.Serializer):
     answer = serializers.CharField()
     citations = ChatResponseCitationSerializer(many=True)
     usage = serializers.DictField()
-    latency_ms = serializers.IntegerField(min_value=0)
+    timings = ChatTimingsSerializer()
@@ -1,16 +1,27 @@
+import asyncio
+import copy
 import time
-from typing import Dict, Iterable, List, Tuple
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
+from apps.chatbot import config_cache
+from apps.chatbot.config_cache import ResolvedBot
 from apps.chatbot.models import Chatbot
 from apps.chatbot_provider.models import ChatbotProvider
-from apps.documents.models import DocumentChunk  # must exist in your documents app
+from apps.chat import context, semantic_cache
+from apps.chat.stages import StageTimer, parallel_stages_enabled, submit_stage
+from apps.documents import retrieval
+from apps.documents.ann import coarse_params
 from common.llm.embeddings import get_embedding
 from common.llm.base import ChatClient
 from common.llm.openai_client import OpenAIChat
 from common.llm.gemini_client import GeminiChat
 from common.llm.deepseek_client import DeepSeekChat
+from common.llm.tokens import count_tokens
+
+class ProviderNotConfigured(RuntimeError):
+    pass
 
 def _pick_client(provider: ChatbotProvider) -> ChatClient:
     if provider.provider == "openai":
@@ -21,22 +32,25 @@ def _pick_client(provider: ChatbotProvider) -> ChatClient:
         return DeepSeekChat(model=provider.model_name, api_key=provider.api_key)
     raise ValueError("Unsupported provider")
 
-def _retrieval(org_id, query: str, top_k: int, filters: Dict | None = None) -> Tuple[List[Dict], List[str]]:
-    """Return [(doc_id, chunk_index, content, score)], and texts for prompt context."""
-    qvec = get_embedding(query)
-    qs = (DocumentChunk.objects
-          .filter(document__organization_id=org_id)
-          .extra(select={"score": "1 - (embedding <=> %s)"}, select_params=[qvec])
-          .order_by("-score")
-          )
-    if filters:
-        if ids := filters.get("document_ids"):
-            qs = qs.filter(document_id__in=ids)
-        if fts := filters.get("file_types"):
-            qs = qs.filter(document__file_type__in=fts)
-    rows = list(qs.values("document_id", "chunk_index", "content", "score")[:top_k])
-    texts = [r["content"] for r in rows]
-    return rows, texts
+def _load_bot(org) -> ResolvedBot:
+    bot = Chatbot.objects.get_or_create(
+        organization=org, defaults={"name": f"{org.name} Chatbot", "tone": "Technical", "system_instructions": ""}
+    )[0]
+    provider = ChatbotProvider.objects.filter(chatbot=bot).first()
+    return ResolvedBot(bot=bot, client=_pick_client(provider) if provider else None)
+
+def _resolve_bot(org) -> Tuple[Chatbot, ChatClient | None]:
+    """Bot + ready client from the per-org config cache (falls back to DB)."""
+    cfg = config_cache.get_or_load(org, _load_bot)
+    return cfg.bot, cfg.client
+
+def _search(org, query: str, embed, top_k: int, filters: Dict | None = None, *,
+            mode: str = "vector") -> Tuple[List[Dict], str]:
+    """Return ([{document_id, chunk_index, content, score}] best first, mode used)."""
+    dims, factor = coarse_params(org)
+    return retrieval.retrieve(
+        org.id, query, top_k, filters, mode=mode, embed=embed, coarse_dims=dims, coarse_factor=factor
+    )
 
 def _build_system_prompt(bot: Chatbot) -> str:
     tone = bot.tone or "Technical"
@@ -50,53 +64,144 @@ def _build_system_prompt(bot: Chatbot) -> str:
     return base
 
 def _build_messages(user_messages: List[Dict], system_prompt: str, context_blocks: List[str]) -> List[Dict]:
-    context = "\n\n---\n\n".join(context_blocks)
-    system = f"{system_prompt}\n\nContext:\n{context}"
+    ctx = context.SEPARATOR.join(context_blocks)
+    system = f"{system_prompt}\n\nContext:\n{ctx}"
     msgs = [{"role": "system", "content": system}]
     msgs.extend(user_messages)
     return msgs
 
-def chat_completion(*, org, payload: Dict, model_override: str | None = None) -> Dict:
+class _Prepared:
+    __slots__ = ("bot", "client", "rows", "messages", "cached", "cache_key", "context")
+
+    def __init__(self, bot: Chatbot, client: ChatClient, rows: List[Dict], messages: List[Dict],
+                 cached=None, cache_key: Tuple | None = None, context: Dict | None = None):
+        self.bot = bot
+        self.client = client
+        self.rows = rows
+        self.messages = messages
+        self.cached = cached  # SemanticCacheEntry served instead of calling the model
+        self.cache_key = cache_key  # (fingerprint, corpus_version, question, qvec) to store on a miss
+        self.context = context  # packing stats (apps.chat.context), reported in usage
+
+def _check_cache(org, bot: Chatbot, client: ChatClient, payload: Dict, query: str, qvec: List[float],
+                 timer: StageTimer) -> Tuple[object, Tuple | None]:
+    """Return (hit, cache_key). Both None when the bot/request is not cacheable."""
+    if not semantic_cache.is_cacheable(bot, payload):
+        return None, None
+    version = semantic_cache.corpus_version(org.id)
+    if version is None:  # cannot validate entries without the corpus stamp
+        return None, None
+    fp = semantic_cache.fingerprint(bot, client, payload)
+    with timer.stage("cache"):
+        hit = semantic_cache.lookup(org.id, fp, version, qvec, bot.semantic_cache_threshold)
+    return hit, (fp, version, query, qvec)
+
+def _store_answer(org, prep: _Prepared, answer: str, model_name: str, usage: Dict | None = None) -> None:
+    if prep.cache_key is None:
+        return
+    if not usage:
+        # streams carry no usage block; estimate so hit stats can report savings
+        prompt = "\n".join(m["content"] for m in prep.messages)
+        usage = {
+            "prompt_tokens": count_tokens(prompt, model_name),
+            "completion_tokens": count_tokens(answer, model_name),
+        }
+    fp, version, question, qvec = prep.cache_key
+    semantic_cache.store(org.id, fp, version, question, qvec, answer, prep.rows, model_name, usage)
+
+def _embed_early(payload: Dict, query: str) -> bool:
     """
-    Synchronous chat completion:
-    - runs retrieval
-    - calls model
-    - returns full JSON payload (answer, citations, usage, timings)
+    Whether to start the query embedding before the bot is resolved. The
+    bot's own retrieval_mode is not known yet, so this goes by the requested
+    mode or RETRIEVAL_MODE; a bot that turns out to need the vector anyway
+    (its mode, or the semantic cache) embeds after the config lookup.
     """
-    t0 = time.perf_counter()
-    bot = Chatbot.objects.get_or_create(
-        organization=org, defaults={"name": f"{org.name} Chatbot", "tone": "Technical", "system_instructions": ""}
-    )[0]
-    provider = ChatbotProvider.objects.filter(chatbot=bot).first()
-    if not provider:
-        raise RuntimeError("Chatbot provider not configured")
+    if not parallel_stages_enabled():
+        return False
+    return retrieval.needs_embedding(retrieval.resolve_mode(payload.get("retrieval_mode")), query)
 
-    top_k = int(payload.get("top_k", getattr(settings, "TOP_K", 6)))
-    rows, context_blocks = _retrieval(org.id, _join_user_text(payload["messages"]), top_k, payload.get("filters"))
-    sys_prompt = _build_system_prompt(bot)
-    msgs = _build_messages(payload["messages"], sys_prompt, context_blocks)
+def _prepare(org, payload: Dict, timer: StageTimer, model_override: str | None = None) -> _Prepared:
+    """
+    Resolve bot/provider, embed the query, retrieve and assemble the prompt.
+    With CHAT_PARALLEL_STAGES the query embedding (network only) runs on the
+    stage pool while this thread does the DB lookups and key decryption.
+    A semantic cache hit short-circuits retrieval and the model call.
+    Lexical retrieval of an uncacheable request does not embed at all: the
+    early embedding is only started when the requested (or default) mode
+    needs a vector, see _embed_early.
+    """
+    query = _join_user_text(payload["messages"])
+    embed = timer.timed("embedding", get_embedding)
+    fut = submit_stage(embed, query) if _embed_early(payload, query) else None
 
-    client = _pick_client(provider)
+    with timer.stage("config"):
+        bot, client = _resolve_bot(org)
+    if client is None:
+        if fut is not None:
+            fut.cancel()
+        raise ProviderNotConfigured("Chatbot provider not configured")
     if model_override:
+        client = copy.copy(client)  # cached instance is shared
         client.model = model_override
 
-    answer, usage, model_name = client.chat(
-        messages=msgs,
-        max_tokens=payload.get("max_tokens", 512),
-        temperature=payload.get("temperature", 0.2),
-        timeout_s=getattr(settings, "LLM_CHAT_TIMEOUT_S", 30),
-    )
+    mode = retrieval.resolve_mode(payload.get("retrieval_mode"), bot)
+    qvec = None
+    if retrieval.needs_embedding(mode, query) or semantic_cache.is_cacheable(bot, payload):
+        qvec = fut.result() if fut is not None else embed(query)
+        hit, cache_key = _check_cache(org, bot, client, payload, query, qvec, timer)
+        if hit is not None:
+            return _Prepared(bot, client, hit.citations, [], cached=hit)
+    else:
+        cache_key = None
+        if fut is not None and fut.cancel():
+            fut = None
+
+    def query_vector() -> List[float]:
+        # hybrid keyword queries only embed when the lexical side finds nothing
+        if qvec is not None:
+            return qvec
+        return fut.result() if fut is not None else embed(query)
+
+    top_k = int(payload.get("top_k", getattr(settings, "TOP_K", 6)))
+    with timer.stage("retrieval"):
+        rows, mode_used = _search(org, query, query_vector, top_k, payload.get("filters"), mode=mode)
+        packed = context.pack(rows, client.model, mode=mode_used)
+    sys_prompt = _build_system_prompt(bot)
+    msgs = _build_messages(payload["messages"], sys_prompt, packed.blocks)
+    return _Prepared(bot, client, packed.rows, msgs, cache_key=cache_key, context=packed.stats)
+
+def chat_completion(*, org, payload: Dict, model_override: str | None = None) -> Dict:
+    """
+    Synchronous chat completion:
+    - runs retrieval (overlapped with config lookup, see _prepare)
+    - calls model
+    - returns full JSON payload (answer, citations, usage, timings)
+    """
+    timer = StageTimer()
+    prep = _prepare(org, payload, timer, model_override)
+
+    if prep.cached is not None:
+        answer, usage, model_name = prep.cached.answer, {**prep.cached.usage, "cached": True}, prep.cached.model
+    else:
+        with timer.stage("llm"):
+            answer, usage, model_name = prep.client.chat(
+                messages=prep.messages,
+                max_tokens=payload.get("max_tokens", 512),
+                temperature=payload.get("temperature", 0.2),
+                timeout_s=getattr(settings, "LLM_CHAT_TIMEOUT_S", 30),
+            )
+        _store_answer(org, prep, answer, model_name, usage)
+        usage = {**(usage or {}), "context": prep.context}
 
-    latency_ms = int((time.perf_counter() - t0) * 1000)
     out = {
         "id": f"resp_{int(time.time()*1000)}",
         "session_id": payload.get("session_id"),
         "model": model_name,
         "created": timezone.now(),
         "answer": answer,
-        "citations": rows,
+        "citations": prep.rows,
         "usage": usage,
-        "latency_ms": latency_ms,
+        "timings": timer.as_dict(),
     }
     return out
 
@@ -105,36 +210,117 @@ def chat_stream(*, org, payload: Dict, model_override: str | None = None) -> Ite
     Streaming generator yielding tuples of (event, data).
     Events: message_start, delta, citation, message_end, error
     """
-    bot = Chatbot.objects.get_or_create(
-        organization=org, defaults={"name": f"{org.name} Chatbot", "tone": "Technical", "system_instructions": ""}
-    )[0]
-    provider = ChatbotProvider.objects.filter(chatbot=bot).first()
-    if not provider:
-        yield ("error", {"detail": "Chatbot provider not configured"})
+    timer = StageTimer()
+    try:
+        prep = _prepare(org, payload, timer, model_override)
+    except ProviderNotConfigured as e:
+        yield ("error", {"detail": str(e)})
         return
 
-    top_k = int(payload.get("top_k", getattr(settings, "TOP_K", 6)))
-    rows, context_blocks = _retrieval(org.id, _join_user_text(payload["messages"]), top_k, payload.get("filters"))
-    sys_prompt = _build_system_prompt(bot)
-    msgs = _build_messages(payload["messages"], sys_prompt, context_blocks)
+    if prep.cached is not None:
+        yield from _replay_cached(prep, timer)
+        return
 
-    client = _pick_client(provider)
+    yield ("message_start", {"model": prep.client.model})
+    for r in prep.rows:
+        yield ("citation", r)
+
+    parts = []
+    for delta in prep.client.stream(
+        messages=prep.messages,
+        max_tokens=payload.get("max_tokens", 512),
+        temperature=payload.get("temperature", 0.2),
+        timeout_s=getattr(settings, "LLM_CHAT_TIMEOUT_S", 30),
+    ):
+        parts.append(delta)
+        yield ("delta", delta)
+
+    _store_answer(org, prep, "".join(parts), prep.client.model)
+    yield ("message_end", {"ok": True, "usage": {"context": prep.context}, "timings": timer.as_dict()})
+
+def _replay_cached(prep: _Prepared, timer: StageTimer) -> Iterable[Tuple[str, Dict | str]]:
+    yield ("message_start", {"model": prep.cached.model, "cached": True})
+    for r in prep.rows:
+        yield ("citation", r)
+    yield ("delta", prep.cached.answer)
+    yield ("message_end", {"ok": True, "cached": True, "timings": timer.as_dict()})
+
+async def _aprepare(org, payload: Dict, timer: StageTimer, model_override: str | None = None) -> _Prepared:
+    """Async _prepare: the embedding task (see _embed_early) overlaps the config lookup."""
+    query = _join_user_text(payload["messages"])
+    embed = sync_to_async(timer.timed("embedding", get_embedding), thread_sensitive=False)
+    resolve = sync_to_async(timer.timed("config", _resolve_bot))
+    task = asyncio.ensure_future(embed(query)) if _embed_early(payload, query) else None
+    try:
+        bot, client = await resolve(org)
+        if client is None:
+            raise ProviderNotConfigured("Chatbot provider not configured")
+    except BaseException:
+        if task is not None:
+            task.cancel()
+        raise
     if model_override:
+        client = copy.copy(client)  # cached instance is shared
         client.model = model_override
 
-    yield ("message_start", {"model": client.model})
-    for r in rows:
+    mode = retrieval.resolve_mode(payload.get("retrieval_mode"), bot)
+    qvec = None
+    if retrieval.needs_embedding(mode, query) or semantic_cache.is_cacheable(bot, payload):
+        qvec = await task if task is not None else await embed(query)
+    elif task is not None:
+        task.cancel()
+    cache_key = None
+    if qvec is not None:
+        hit, cache_key = await sync_to_async(_check_cache)(org, bot, client, payload, query, qvec, timer)
+        if hit is not None:
+            return _Prepared(bot, client, hit.citations, [], cached=hit)
+
+    embed_sync = timer.timed("embedding", get_embedding)
+    top_k = int(payload.get("top_k", getattr(settings, "TOP_K", 6)))
+    search = sync_to_async(timer.timed("retrieval", _search))
+    rows, mode_used = await search(
+        org, query, (lambda: qvec) if qvec is not None else (lambda: embed_sync(query)),
+        top_k, payload.get("filters"), mode=mode,
+    )
+    packed = context.pack(rows, client.model, mode=mode_used)
+    sys_prompt = _build_system_prompt(bot)
+    msgs = _build_messages(payload["messages"], sys_prompt, packed.blocks)
+    return _Prepared(bot, client, packed.rows, msgs, cache_key=cache_key, context=packed.stats)
+
+async def achat_stream(*, org, payload: Dict, model_override: str | None = None) -> AsyncIterator[Tuple[str, Dict | str]]:
+    """
+    Async twin of chat_stream for ASGI. DB lookups and retrieval run in a
+    worker thread; the provider stream itself is awaited on the event loop,
+    so an open stream holds no thread while tokens arrive.
+    """
+    timer = StageTimer()
+    try:
+        prep = await _aprepare(org, payload, timer, model_override)
+    except ProviderNotConfigured as e:
+        yield ("error", {"detail": str(e)})
+        return
+
+    if prep.cached is not None:
+        for item in _replay_cached(prep, timer):
+            yield item
+        return
+
+    yield ("message_start", {"model": prep.client.model})
+    for r in prep.rows:
         yield ("citation", r)
 
-    for delta in client.stream(
-        messages=msgs,
+    parts = []
+    async for delta in prep.client.astream(
+        messages=prep.messages,
         max_tokens=payload.get("max_tokens", 512),
         temperature=payload.get("temperature", 0.2),
         timeout_s=getattr(settings, "LLM_CHAT_TIMEOUT_S", 30),
     ):
+        parts.append(delta)
         yield ("delta", delta)
 
-    yield ("message_end", {"ok": True})
+    await sync_to_async(_store_answer)(org, prep, "".join(parts), prep.client.model)
+    yield ("message_end", {"ok": True, "usage": {"context": prep.context}, "timings": timer.as_dict()})
 
 def _join_user_text(messages: List[Dict]) -> str:
     # combine user contents for retrieval signal — safe because we still pass per-turn to LLM
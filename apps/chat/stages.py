@@ -0,0 +1,76 @@
+"""
+Helpers for the staged chat pipeline: a per-process thread pool for
+overlapping independent I/O (query embedding vs. DB lookups) and a timer
+that records per-stage wall time for the `timings` response field.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict
+
+from django.conf import settings
+
+_pool: ThreadPoolExecutor | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+
+def parallel_stages_enabled() -> bool:
+    return bool(getattr(settings, "CHAT_PARALLEL_STAGES", True))
+
+
+def _executor() -> ThreadPoolExecutor:
+    # Lazily (re)created per process: worker threads do not survive fork.
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ThreadPoolExecutor(
+                    max_workers=int(getattr(settings, "CHAT_STAGE_WORKERS", 8)),
+                    thread_name_prefix="chat-stage",
+                )
+                _pool_pid = pid
+    return _pool
+
+
+def submit_stage(fn: Callable, *args, **kwargs) -> Future:
+    """Run a network-only stage in the background. Do not pass DB work here."""
+    return _executor().submit(fn, *args, **kwargs)
+
+
+class StageTimer:
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self._stages: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, name: str, started: float) -> None:
+        ms = int((time.perf_counter() - started) * 1000)
+        with self._lock:
+            self._stages[f"{name}_ms"] = self._stages.get(f"{name}_ms", 0) + ms
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, started)
+
+    def timed(self, name: str, fn: Callable) -> Callable:
+        """Wrap fn so each call is recorded under `name` (safe across threads)."""
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return inner
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._stages)
+        out["total_ms"] = int((time.perf_counter() - self._t0) * 1000)
+        return out
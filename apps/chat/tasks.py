@@ -0,0 +1,15 @@
+import logging
+
+from celery import shared_task
+
+from apps.chat.semantic_cache import purge_expired
+
+log = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def purge_semantic_cache():
+    """Periodic: delete semantic cache entries older than SEMANTIC_CACHE_TTL_S."""
+    n = purge_expired()
+    if n:
+        log.info("Purged %d semantic cache entries", n)
@@ -1,3 +1,140 @@
-from django.test import TestCase
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from apps.chat import context, semantic_cache
+from apps.documents.retrieval import fuse
+from common.llm.tokens import count_tokens
+
+# one document chunked with 200 chars of overlap between neighbours
+TEXT = " ".join(f"word{i}" for i in range(1000))
+C0, C1, C2 = TEXT[0:1500], TEXT[1300:2800], TEXT[2600:4100]
+
+
+def row(doc, index, content, score):
+    return {"document_id": doc, "chunk_index": index, "content": content, "score": score}
+
+
+def keys(rows):
+    return [(r["document_id"], r["chunk_index"]) for r in rows]
+
+
+@override_settings(
+    CHAT_CONTEXT_MAX_TOKENS=3000, CHAT_CONTEXT_MAX_TOKENS_BY_MODEL={},
+    CHAT_CONTEXT_SCORE_RATIO=0.5, MAX_CONTEXT_CHARS=12000,
+)
+class PackTests(SimpleTestCase):
+    def test_adjacent_chunks_merge_without_overlap(self):
+        packed = context.pack([row("d1", 1, C1, 0.8), row("d1", 0, C0, 0.7), row("d1", 2, C2, 0.6)])
+        self.assertEqual(packed.blocks, [TEXT[0:4100]])
+        self.assertEqual(packed.stats["overlap_chars_removed"], 400)
+        self.assertEqual(packed.stats["chunks_used"], 3)
+        # citations keep retrieval order
+        self.assertEqual(keys(packed.rows), [("d1", 1), ("d1", 0), ("d1", 2)])
+
+    def test_gap_in_chunk_index_keeps_blocks_apart(self):
+        packed = context.pack([row("d1", 0, C0, 0.9), row("d1", 2, C2, 0.8)])
+        self.assertEqual(packed.blocks, [C0, C2])
+        self.assertEqual(packed.stats["overlap_chars_removed"], 0)
+
+    def test_blocks_are_ordered_by_best_member(self):
+        packed = context.pack([row("d1", 0, "first " * 20, 0.6), row("d2", 0, "second " * 20, 0.9)])
+        self.assertTrue(packed.blocks[0].startswith("second"))
+
+    def test_score_cutoff_is_relative_to_best(self):
+        packed = context.pack([row("d1", 0, "strong " * 20, 0.8), row("d2", 0, "weak " * 20, 0.3)])
+        self.assertEqual(keys(packed.rows), [("d1", 0)])
+        self.assertEqual(packed.stats["chunks_below_cutoff"], 1)
+
+    @override_settings(RETRIEVAL_RRF_K=60)
+    def test_no_score_cutoff_for_fused_hybrid_scores(self):
+        lexical = [row("lex", i, f"lexical hit {i} " * 5, 1.0) for i in range(18)]
+        vector = [row("vec", i, f"vector hit {i} " * 5, 1.0) for i in range(18)]
+        vector[0] = lexical[0]  # found by both
+        fused = fuse([lexical, vector], 6)
+        packed = context.pack(fused, mode="hybrid")
+        self.assertEqual(packed.stats["chunks_below_cutoff"], 0)
+        self.assertEqual(packed.stats["chunks_used"], 6)
+        # read as similarities, the single-list hits fall under the ratio
+        self.assertLessEqual(context.pack(fused).stats["chunks_used"], 2)
+
+    def test_last_block_is_truncated_to_budget(self):
+        budget = count_tokens(C0) + 50
+        with override_settings(CHAT_CONTEXT_MAX_TOKENS=budget):
+            packed = context.pack([row("d1", 0, C0, 0.9), row("d1", 1, C1, 0.8), row("d1", 2, C2, 0.7)])
+        self.assertTrue(packed.stats["truncated"])
+        self.assertLessEqual(packed.stats["tokens"], budget)
+        self.assertTrue(TEXT.startswith(packed.blocks[0]))
+
+    def test_truncated_block_cites_only_surviving_chunks(self):
+        budget = count_tokens(C0) + 50
+        with override_settings(CHAT_CONTEXT_MAX_TOKENS=budget):
+            packed = context.pack([row("d1", 0, C0, 0.9), row("d1", 1, C1, 0.8), row("d1", 2, C2, 0.7)])
+        # C1's own text starts inside the cut block, C2's does not
+        self.assertEqual(keys(packed.rows), [("d1", 0), ("d1", 1)])
+        self.assertEqual(packed.stats["chunks_used"], 2)
+        self.assertEqual(packed.stats["chunks_over_budget"], 1)
+
+    def test_max_context_chars_is_enforced(self):
+        rows = [row(f"d{i}", 0, f"doc{i} " * 100, 0.9) for i in range(5)]
+        with override_settings(MAX_CONTEXT_CHARS=1500):
+            packed = context.pack(rows)
+        self.assertLessEqual(len(context.SEPARATOR.join(packed.blocks)), 1500)
+        self.assertLess(packed.stats["chunks_used"], 5)
+
+    def test_block_too_small_to_truncate_is_dropped(self):
+        with override_settings(CHAT_CONTEXT_MAX_TOKENS=10):
+            packed = context.pack([row("d1", 0, C0, 0.9)])
+        self.assertEqual(packed.blocks, [])
+        self.assertEqual(packed.rows, [])
+
+    def test_empty(self):
+        packed = context.pack([])
+        self.assertEqual((packed.blocks, packed.rows, packed.stats["tokens"]), ([], [], 0))
+
+    @override_settings(CHAT_CONTEXT_MAX_TOKENS=600, CHAT_CONTEXT_MAX_TOKENS_BY_MODEL={"gpt-4o": 900, "gpt-4o-mini": 300})
+    def test_budget_longest_model_prefix(self):
+        self.assertEqual(context.budget_tokens("gpt-4o-2024-08-06"), 900)
+        self.assertEqual(context.budget_tokens("gpt-4o-mini"), 300)
+        self.assertEqual(context.budget_tokens("deepseek-chat"), 600)
+        self.assertEqual(context.budget_tokens(None), 600)
+
+
+@override_settings(RETRIEVAL_MODE="vector")
+class FingerprintTests(SimpleTestCase):
+    bot = SimpleNamespace(tone="friendly", system_instructions="Be brief.", retrieval_mode="")
+    llm = SimpleNamespace(model="gpt-4o-mini")
+    payload = {"messages": [{"role": "user", "content": "hi"}], "top_k": 5, "temperature": 0.2}
+
+    def fp(self, bot=None, llm=None, **payload):
+        return semantic_cache.fingerprint(bot or self.bot, llm or self.llm, {**self.payload, **payload})
+
+    def test_stable_and_ignores_the_question(self):
+        self.assertEqual(self.fp(), self.fp(messages=[{"role": "user", "content": "something else"}]))
+        self.assertEqual(self.fp(filters={"a": 1, "b": 2}), self.fp(filters={"b": 2, "a": 1}))
+
+    def test_answer_shaping_inputs_change_it(self):
+        base = self.fp()
+        variants = [
+            self.fp(top_k=8),
+            self.fp(temperature=0.9),
+            self.fp(max_tokens=100),
+            self.fp(filters={"file_types": ["pdf"]}),
+            self.fp(retrieval_mode="hybrid"),
+            self.fp(bot=SimpleNamespace(tone="formal", system_instructions="Be brief.", retrieval_mode="")),
+            self.fp(bot=SimpleNamespace(tone="friendly", system_instructions="Be verbose.", retrieval_mode="")),
+            self.fp(llm=SimpleNamespace(model="gpt-4o")),
+        ]
+        self.assertNotIn(base, variants)
+        self.assertEqual(len(set(variants)), len(variants))
+
+    def test_default_retrieval_mode_is_resolved(self):
+        self.assertEqual(self.fp(), self.fp(retrieval_mode="vector"))
+        self.assertEqual(self.fp(), self.fp(retrieval_mode="bogus"))
+
+    def test_single_turn_only(self):
+        bot = SimpleNamespace(semantic_cache_enabled=True)
+        self.assertTrue(semantic_cache.is_cacheable(bot, self.payload))
+        follow_up = {"messages": [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]}
+        self.assertFalse(semantic_cache.is_cacheable(bot, follow_up))
+        self.assertFalse(semantic_cache.is_cacheable(SimpleNamespace(), self.payload))
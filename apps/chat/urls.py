@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import ChatCompletionsView, ChatStreamView
+from .views import ChatCompletionsView, ChatStreamView, SemanticCacheStatsView
 
 urlpatterns = [
     path("chat/completions", ChatCompletionsView.as_view()),
     path("chat/stream", ChatStreamView.as_view()),
+    path("chat/cache/stats", SemanticCacheStatsView.as_view()),
 ]
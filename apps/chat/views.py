@@ -1,9 +1,11 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.core.handlers.asgi import ASGIRequest
 from django.http import StreamingHttpResponse
 from apps.chat.serializers import ChatRequestSerializer, ChatResponseSerializer
-from apps.chat.services import chat_completion, chat_stream
+from apps.chat import semantic_cache
+from apps.chat.services import achat_stream, chat_completion, chat_stream
 from common.security.throttles import ChatRateThrottle  # Import ChatRateThrottle
 from common.utils.idempotency import (
     reserve_idempotency_key,
@@ -12,7 +14,7 @@ from common.utils.idempotency import (
 )
 from common.utils.sse import sse_event
 from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiResponse
-from django.db.models import F
+from apps.api_keys.cache import record_usage
 
 
 @extend_schema(
@@ -71,9 +73,7 @@ class ChatCompletionsView(APIView):
             # usage++
             api_key = getattr(request, "auth_api_key", None)
             if api_key:
-                type(api_key).objects.filter(pk=api_key.pk).update(
-                    usage_count=F("usage_count") + 1
-                )
+                record_usage(api_key)
             save_idempotent_result(idem_key, out)
             return Response(out)
         except Exception as e:
@@ -90,6 +90,7 @@ class ChatCompletionsView(APIView):
 class ChatStreamView(APIView):
     """
     POST /api/chat/stream  (SSE)
+    Served natively async when running under config.asgi.
     """
 
     permission_classes = [IsAuthenticated]
@@ -113,7 +114,39 @@ class ChatStreamView(APIView):
                 yield sse_event({"detail": str(e)}, event="error")
             yield "data: [DONE]\n\n"
 
-        resp = StreamingHttpResponse(gen(), content_type="text/event-stream")
+        async def agen():
+            try:
+                async for event, data in achat_stream(org=org, payload=s.validated_data):
+                    yield sse_event(data, event=event)
+            except Exception as e:
+                yield sse_event({"detail": str(e)}, event="error")
+            yield "data: [DONE]\n\n"
+
+        # Under ASGI the body is an async iterator consumed on the event loop,
+        # so a long generation does not pin a worker thread. WSGI keeps the
+        # sync generator.
+        body = agen() if isinstance(request._request, ASGIRequest) else gen()
+        resp = StreamingHttpResponse(body, content_type="text/event-stream")
         resp["Cache-Control"] = "no-cache"
         resp["X-Accel-Buffering"] = "no"
         return resp
+
+
+@extend_schema(
+    responses={200: OpenApiResponse(description="Semantic answer cache hit/miss counters and savings")},
+    description="Semantic answer cache statistics for the caller's organization.",
+)
+class SemanticCacheStatsView(APIView):
+    """
+    GET /api/chat/cache/stats
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        org = getattr(request, "organization", None) or getattr(
+            request.user, "organization", None
+        )
+        if not org:
+            return Response({"detail": "No organization context"}, status=403)
+        return Response(semantic_cache.stats(org.id))
@@ -0,0 +1,74 @@
+"""
+Per-org cache of the resolved chatbot, provider and ready-to-use client.
+
+Entries live in process memory with a short TTL and are validated against
+the org's "botcfg" version stamp on every lookup (one Redis GET), which
+the Chatbot/ChatbotProvider signals bump on save/delete. A change in any
+gunicorn worker therefore invalidates every worker's copy immediately.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from django.conf import settings
+
+from common.llm.base import ChatClient
+from common.utils import version_stamps
+
+SCOPE = "botcfg"
+
+
+@dataclass(frozen=True)
+class ResolvedBot:
+    bot: "object"  # apps.chatbot.models.Chatbot
+    client: Optional[ChatClient]  # None when no provider is configured
+
+
+class _Entry:
+    __slots__ = ("value", "version", "expires_at")
+
+    def __init__(self, value: ResolvedBot, version: int, expires_at: float):
+        self.value = value
+        self.version = version
+        self.expires_at = expires_at
+
+
+_entries: "OrderedDict[str, _Entry]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_or_load(org, loader: Callable[[object], ResolvedBot]) -> ResolvedBot:
+    ttl = float(getattr(settings, "BOT_CONFIG_CACHE_TTL_S", 60))
+    if ttl <= 0:
+        return loader(org)
+
+    key = str(org.id)
+    version = version_stamps.get(SCOPE, key)
+    if version is None:
+        # can't validate against other workers: don't trust or fill the cache
+        return loader(org)
+
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry and entry.version == version and entry.expires_at > now:
+            _entries.move_to_end(key)
+            return entry.value
+
+    value = loader(org)
+    cap = int(getattr(settings, "BOT_CONFIG_CACHE_MAX", 1024))
+    with _lock:
+        _entries[key] = _Entry(value, version, now + ttl)
+        _entries.move_to_end(key)
+        while len(_entries) > cap:
+            _entries.popitem(last=False)
+    return value
+
+
+def invalidate(org_id) -> None:
+    """Bump the org's stamp (after commit) so every process reloads."""
+    with _lock:
+        _entries.pop(str(org_id), None)
+    version_stamps.bump_on_commit(SCOPE, str(org_id))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chatbot", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatbot",
+            name="semantic_cache_enabled",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="chatbot",
+            name="semantic_cache_threshold",
+            field=models.FloatField(default=0.95),
+        ),
+    ]
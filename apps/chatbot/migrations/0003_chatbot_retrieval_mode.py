@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chatbot", "0002_chatbot_semantic_cache_enabled_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatbot",
+            name="retrieval_mode",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("vector", "vector"),
+                    ("lexical", "lexical"),
+                    ("hybrid", "hybrid"),
+                ],
+                default="",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -7,5 +7,10 @@ class Chatbot(models.Model):
     name = models.CharField(max_length=100)
     tone = models.CharField(max_length=20, choices=[("Friendly","Friendly"),("Technical","Technical"),("Formal","Formal")], default="Technical")
     system_instructions = models.TextField()
+    # Opt-in reuse of answers for near-identical questions (apps.chat.semantic_cache)
+    semantic_cache_enabled = models.BooleanField(default=False)
+    semantic_cache_threshold = models.FloatField(default=0.95)  # min cosine similarity
+    # vector | lexical | hybrid (apps.documents.retrieval); blank = RETRIEVAL_MODE
+    retrieval_mode = models.CharField(max_length=10, choices=[("vector","vector"),("lexical","lexical"),("hybrid","hybrid")], blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
\ No newline at end of file
@@ -4,9 +4,10 @@ from .models import Chatbot
 class ChatbotSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chatbot
-        fields = ["id","name","tone","system_instructions","created_at","updated_at"]
+        fields = ["id","name","tone","system_instructions","semantic_cache_enabled","semantic_cache_threshold","retrieval_mode","created_at","updated_at"]
 
 class ChatbotUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chatbot
-        fields = ["name","tone","system_instructions"]
+        fields = ["name","tone","system_instructions","semantic_cache_enabled","semantic_cache_threshold","retrieval_mode"]
+        extra_kwargs = {"semantic_cache_threshold": {"min_value": 0.5, "max_value": 1.0}}
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.chatbot.config_cache import invalidate
+from apps.chatbot.models import Chatbot
+from apps.chatbot_provider.models import ChatbotProvider
+
+
+@receiver([post_save, post_delete], sender=Chatbot)
+def _chatbot_changed(sender, instance, **kwargs):
+    invalidate(instance.organization_id)
+
+
+@receiver([post_save, post_delete], sender=ChatbotProvider)
+def _provider_changed(sender, instance, **kwargs):
+    org_id = (
+        Chatbot.objects.filter(pk=instance.chatbot_id)
+        .values_list("organization_id", flat=True)
+        .first()
+    )
+    if org_id:  # chatbot already gone on cascade delete; its own signal bumped
+        invalidate(org_id)
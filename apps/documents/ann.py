@@ -0,0 +1,346 @@
+"""
+pgvector ANN index management for DocumentChunk.embedding.
+
+The index itself lives outside the Django model state (like the original
+IVFFlat index in 0001) so it can be rebuilt with different parameters by
+`manage.py ann_index` without a schema migration.
+
+EMBEDDING_STORAGE picks what the index holds. The full-precision column
+stays the only stored copy either way:
+  full     vector(dim), cosine ops (original layout)
+  halfvec  expression index on embedding::halfvec(dim), inner-product ops;
+           half the size of the full index
+  binary   expression index on binary_quantize(embedding)::bit(dim),
+           Hamming ops; 1 bit per dimension (32x smaller)
+The compact storages return top_k * EMBEDDING_RERANK_FACTOR candidates,
+which retrieval reranks exactly against the full vectors. Stored vectors are
+unit length (0010), so inner product equals cosine similarity.
+
+Orgs with retrieval_coarse_dims = N use a Matryoshka coarse index instead:
+the first N components, renormalized,
+l2_normalize(subvector(embedding, 1, N))::vector(N), inner-product ops.
+There is one index per size in RETRIEVAL_COARSE_DIMS_CHOICES
+(`ann_index build --dims N`).
+
+When the chunk table is partitioned (apps.documents.partitions) every
+partition gets its own piece of each index, built concurrently and attached
+to the parent: a dedicated tenant's searches walk a graph of its own rows only.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+
+TABLE = "documents_documentchunk"
+COLUMN = "embedding"
+INDEX_NAME = "docchunk_embedding_ann"
+LEGACY_INDEX_NAMES = ("docchunk_embedding_ivfflat",)
+OPCLASS = "vector_cosine_ops"
+
+METHODS = ("hnsw", "ivfflat")
+STORAGES = ("full", "halfvec", "binary")
+_DEFAULT_RERANK_FACTOR = {"full": 1, "halfvec": 4, "binary": 10}
+
+
+def default_storage() -> str:
+    storage = getattr(settings, "EMBEDDING_STORAGE", "full").lower()
+    if storage not in STORAGES:
+        raise ValueError(f"Unsupported EMBEDDING_STORAGE: {storage}")
+    return storage
+
+
+def rerank_factor(storage: str) -> int:
+    return int(getattr(settings, "EMBEDDING_RERANK_FACTOR", 0) or _DEFAULT_RERANK_FACTOR[storage])
+
+
+def coarse_params(org) -> tuple[int, int]:
+    """(dims, candidates per result) of an org's Matryoshka coarse stage; dims 0 = off."""
+    dims = getattr(org, "retrieval_coarse_dims", None)
+    factor = getattr(org, "retrieval_coarse_factor", None)
+    if dims is None:
+        dims = int(getattr(settings, "RETRIEVAL_COARSE_DIMS", 0))
+    if dims and (dims >= _dim() or dims not in getattr(settings, "RETRIEVAL_COARSE_DIMS_CHOICES", [])):
+        dims = 0  # no index for it
+    return dims, max(1, int(factor or getattr(settings, "RETRIEVAL_COARSE_FACTOR", 8)))
+
+
+def index_name(storage: str = "full", dims: int = 0) -> str:
+    if dims:
+        return f"{INDEX_NAME}_mrl{int(dims)}"
+    return INDEX_NAME if storage == "full" else f"{INDEX_NAME}_{storage}"
+
+
+def index_kind(name: str) -> str:
+    """Short form of an ANN index name; names its per-partition pieces."""
+    return name.removeprefix("docchunk_embedding_")
+
+
+def _dim() -> int:
+    return int(getattr(settings, "EMBEDDING_DIM", 1536))
+
+
+def _truncated_sql(column: str, dims: int) -> str:
+    dims = int(dims)
+    return f"l2_normalize(subvector({column}, 1, {dims}))::vector({dims})"
+
+
+def index_target(storage: str, dims: int = 0) -> tuple[str, str]:
+    """(indexed expression, operator class) for a storage, or a coarse size."""
+    if dims:
+        return f"({_truncated_sql(COLUMN, dims)})", "vector_ip_ops"
+    if storage == "halfvec":
+        return f"({COLUMN}::halfvec({_dim()}))", "halfvec_ip_ops"
+    if storage == "binary":
+        return f"(binary_quantize({COLUMN})::bit({_dim()}))", "bit_hamming_ops"
+    return COLUMN, OPCLASS
+
+
+def coarse_distance(storage: str, qvec: list[float], dims: int = 0):
+    """ORM twin of coarse_distance_sql() for `qvec`, relabelled correctly inside subqueries."""
+    from django.db.models import F, Func, Value
+    from django.db.models.functions import Cast
+    from pgvector import HalfVector
+    from pgvector.django import (
+        BitField, CosineDistance, HalfVectorField, HammingDistance, MaxInnerProduct, VectorField,
+    )
+    from common.llm.embeddings import unit_vector
+
+    if dims:
+        dims = int(dims)  # inlined, so the expression matches the index
+        head = Func(F(COLUMN), function="subvector", template=f"%(function)s(%(expressions)s, 1, {dims})")
+        truncated = Cast(Func(head, function="l2_normalize", output_field=VectorField()), VectorField(dimensions=dims))
+        return MaxInnerProduct(truncated, unit_vector(qvec[:dims]))
+    if storage == "halfvec":
+        return MaxInnerProduct(Cast(F(COLUMN), HalfVectorField(dimensions=_dim())), HalfVector(qvec))
+    if storage == "binary":
+        bits = Cast(Func(F(COLUMN), function="binary_quantize", output_field=BitField()), BitField(length=_dim()))
+        # binary_quantize(): 1 where the component is > 0
+        return HammingDistance(bits, Value("".join("1" if x > 0 else "0" for x in qvec)))
+    return CosineDistance(F(COLUMN), qvec)
+
+
+def coarse_distance_sql(storage: str, column: str = f"{TABLE}.{COLUMN}", dims: int = 0) -> str:
+    """
+    Distance to the query (one %s, a vector literal) in the form the
+    storage's index can serve; must match index_target().
+    """
+    if dims:
+        return f"{_truncated_sql(column, dims)} <#> {_truncated_sql('%s::vector', dims)}"
+    if storage == "halfvec":
+        return f"{column}::halfvec({_dim()}) <#> %s::halfvec({_dim()})"
+    if storage == "binary":
+        return f"binary_quantize({column})::bit({_dim()}) <~> binary_quantize(%s::vector)::bit({_dim()})"
+    return f"{column} <=> %s::vector"
+
+
+def default_method() -> str:
+    method = getattr(settings, "ANN_INDEX_METHOD", "hnsw").lower()
+    if method not in METHODS:
+        raise ValueError(f"Unsupported ANN index method: {method}")
+    return method
+
+
+def auto_lists(row_count: int) -> int:
+    """pgvector guidance: rows/1000 up to 1M rows, sqrt(rows) above."""
+    if row_count <= 1_000_000:
+        return max(row_count // 1000, 10)
+    return int(row_count ** 0.5)
+
+
+def count_rows() -> int:
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT count(*) FROM {TABLE}")
+        return int(cur.fetchone()[0])
+
+
+def index_spec(
+    method: str,
+    *,
+    storage: str = "full",
+    dims: int = 0,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    lists: Optional[int] = None,
+) -> str:
+    """The "USING method (expr opclass) WITH (...)" part of the index definition."""
+    if method == "hnsw":
+        m = int(m or getattr(settings, "ANN_HNSW_M", 16))
+        ef_construction = int(ef_construction or getattr(settings, "ANN_HNSW_EF_CONSTRUCTION", 64))
+        with_clause = f"m = {m}, ef_construction = {ef_construction}"
+    elif method == "ivfflat":
+        lists = int(lists or getattr(settings, "ANN_IVFFLAT_LISTS", 0) or auto_lists(count_rows()))
+        with_clause = f"lists = {lists}"
+    else:
+        raise ValueError(f"Unsupported ANN index method: {method}")
+    expr, opclass = index_target(storage, dims)
+    return f"USING {method} ({expr} {opclass}) WITH ({with_clause})"
+
+
+def create_index_sql(
+    method: str,
+    *,
+    storage: str = "full",
+    dims: int = 0,
+    name: Optional[str] = None,
+    concurrently: bool = True,
+    **params,
+) -> str:
+    conc = "CONCURRENTLY " if concurrently else ""
+    spec = index_spec(method, storage=storage, dims=dims, **params)
+    return f"CREATE INDEX {conc}IF NOT EXISTS {name or index_name(storage, dims)} ON {TABLE} {spec}"
+
+
+def existing_indexes() -> list[dict]:
+    """Return [{name, definition}] for every ANN index on the chunk table."""
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE tablename = %s AND (indexdef ILIKE %s OR indexdef ILIKE %s)",
+            [TABLE, "%USING hnsw%", "%USING ivfflat%"],
+        )
+        return [{"name": r[0], "definition": r[1]} for r in cur.fetchall()]
+
+
+def build_on_partitions(table: str, name: str, kind: str, spec: str) -> None:
+    """
+    Partitioned tables cannot CREATE INDEX CONCURRENTLY: create the index ON
+    ONLY each partitioned level, build it concurrently on every leaf and
+    attach the pieces bottom-up. It becomes valid once all are attached.
+    """
+    from apps.documents import partitions
+
+    names = {}
+    with connection.cursor() as cur:
+        _set_build_memory(cur)
+        for rel in partitions.tree(table):
+            idx = name if rel["parent"] is None else f"{rel['name']}_{kind}"
+            names[rel["name"]] = idx
+            if rel["leaf"]:
+                cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {idx} ON {rel['name']} {spec}")
+            else:
+                cur.execute(f"CREATE INDEX IF NOT EXISTS {idx} ON ONLY {rel['name']} {spec}")
+            if rel["parent"] is not None:
+                cur.execute(f"ALTER INDEX {names[rel['parent']]} ATTACH PARTITION {idx}")
+
+
+def build_index(method: str, **params) -> str:
+    """Create the ANN index if it does not exist. Must run outside a transaction."""
+    from apps.documents import partitions
+
+    if partitions.is_partitioned():
+        name = index_name(params.get("storage", "full"), params.get("dims", 0))
+        spec = index_spec(method, **params)
+        build_on_partitions(TABLE, name, index_kind(name), spec)
+        return f"CREATE INDEX {name} ON {TABLE} {spec} (per partition)"
+    sql = create_index_sql(method, **params)
+    with connection.cursor() as cur:
+        _set_build_memory(cur)
+        cur.execute(sql)
+    return sql
+
+
+def _names(storage: str, dims: int = 0) -> tuple[str, ...]:
+    if storage == "full" and not dims:
+        return (INDEX_NAME, *LEGACY_INDEX_NAMES)
+    return (index_name(storage, dims),)
+
+
+def rebuild_index(method: str, storage: str = "full", dims: int = 0, **params) -> str:
+    """
+    Online rebuild: build a new index concurrently under a temporary name,
+    then drop the old one(s) and rename. Queries keep using the old index
+    until the swap.
+    """
+    from apps.documents import partitions
+
+    if partitions.is_partitioned():
+        return _rebuild_partitioned(method, storage, dims, **params)
+    tmp = f"{index_name(storage, dims)}_new"
+    sql = create_index_sql(method, storage=storage, dims=dims, name=tmp, **params)
+    with connection.cursor() as cur:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {tmp}")
+        _set_build_memory(cur)
+        cur.execute(sql)
+        for name in _names(storage, dims):
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        cur.execute(f"ALTER INDEX {tmp} RENAME TO {index_name(storage, dims)}")
+    return sql
+
+
+def _rebuild_partitioned(method: str, storage: str, dims: int, **params) -> str:
+    # the swap drops a partitioned index, which takes a brief exclusive lock
+    from apps.documents import partitions
+
+    name = index_name(storage, dims)
+    kind = index_kind(name)
+    spec = index_spec(method, storage=storage, dims=dims, **params)
+    with connection.cursor() as cur:
+        cur.execute(f"DROP INDEX IF EXISTS {name}_new")
+    build_on_partitions(TABLE, f"{name}_new", f"{kind}_new", spec)
+    with transaction.atomic(), connection.cursor() as cur:
+        for old in _names(storage, dims):
+            cur.execute(f"DROP INDEX IF EXISTS {old}")
+        cur.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+        for rel in partitions.tree(TABLE)[1:]:
+            cur.execute(f"ALTER INDEX IF EXISTS {rel['name']}_{kind}_new RENAME TO {rel['name']}_{kind}")
+    return f"CREATE INDEX {name} ON {TABLE} {spec} (per partition)"
+
+
+def drop_index(storage: str = "full", dims: int = 0) -> None:
+    from apps.documents import partitions
+
+    # indexes of a partitioned table cannot be dropped concurrently
+    conc = "" if partitions.is_partitioned() else "CONCURRENTLY "
+    with connection.cursor() as cur:
+        for name in _names(storage, dims):
+            cur.execute(f"DROP INDEX {conc}IF EXISTS {name}")
+
+
+def relation_sizes() -> dict:
+    """
+    Bytes on disk of the chunk table (heap, TOAST) and each of its indexes,
+    summed over partitions when it is partitioned.
+    """
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT COALESCE(sum(pg_relation_size(c.oid)), 0), "
+            "COALESCE(sum(pg_total_relation_size(NULLIF(c.reltoastrelid, 0))), 0) "
+            "FROM pg_partition_tree(%s::regclass) t JOIN pg_class c ON c.oid = t.relid",
+            [TABLE],
+        )
+        heap, toast = (int(v) for v in cur.fetchone())
+        cur.execute(
+            "SELECT i.indexrelid::regclass::text, "
+            "(SELECT COALESCE(sum(pg_relation_size(t.relid)), 0) FROM pg_partition_tree(i.indexrelid) t)::bigint "
+            "FROM pg_index i WHERE i.indrelid = %s::regclass ORDER BY 2 DESC",
+            [TABLE],
+        )
+        indexes = {name: size for name, size in cur.fetchall()}
+    return {"heap": heap, "toast": toast, "indexes": indexes}
+
+
+def apply_search_params(
+    cursor, *, ef_search: Optional[int] = None, probes: Optional[int] = None
+) -> None:
+    """
+    Set per-query ANN knobs for the current transaction (SET LOCAL semantics).
+    Callers must be inside transaction.atomic() for the values to apply.
+    """
+    ef = int(ef_search or getattr(settings, "ANN_HNSW_EF_SEARCH", 40))
+    pr = int(probes or getattr(settings, "ANN_IVFFLAT_PROBES", 10))
+    cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef)])
+    cursor.execute("SELECT set_config('ivfflat.probes', %s, true)", [str(pr)])
+    iterative = getattr(settings, "ANN_ITERATIVE_SCAN", "")
+    if iterative:
+        # pgvector >= 0.8 only: keep scanning the index when the org filter
+        # discards candidates, instead of returning fewer than top_k rows.
+        cursor.execute("SELECT set_config('hnsw.iterative_scan', %s, true)", [iterative])
+        cursor.execute("SELECT set_config('ivfflat.iterative_scan', %s, true)", [iterative])
+
+
+def _set_build_memory(cursor) -> None:
+    mem = getattr(settings, "ANN_BUILD_MAINTENANCE_WORK_MEM", "")
+    if mem:
+        cursor.execute("SELECT set_config('maintenance_work_mem', %s, false)", [mem])
@@ -0,0 +1,243 @@
+"""
+Generation-based writes for DocumentChunk.
+
+Each (re)ingest writes a complete new generation of a document's chunks
+next to the live one, then flips Document.live_generation in a single
+UPDATE. Retrieval only reads the live generation, so a document never
+returns partial results while it is being reprocessed. Rows of older
+generations are deleted afterwards by gc_chunk_generations.
+
+New rows are streamed with COPY ... (FORMAT BINARY): vectors go over the
+wire as packed float4 instead of 1536-number text literals, normalized to
+unit length (see apps.documents.ann). Chunks reused
+from the previous generation are cloned server-side (INSERT ... SELECT),
+so their embeddings never leave the database.
+"""
+from __future__ import annotations
+
+import uuid
+from typing import Iterable, List, Sequence, Tuple
+
+from django.db import connection, transaction
+from pgvector import Vector
+from pgvector.psycopg.vector import register_vector_info
+from psycopg.types import TypeInfo
+
+from apps.documents.models import Document, DocumentChunk, IngestSlice
+from common.llm.embeddings import unit_vector
+
+TABLE = DocumentChunk._meta.db_table
+COPY_COLUMNS = (
+    "id", "document_id", "organization_id", "generation", "chunk_index", "content", "content_hash", "embedding",
+)
+_COPY_TYPES = ("uuid", "uuid", "uuid", "int4", "int4", "text", "text", "vector")
+
+# chunk_index offset between slices of a fanned-out ingest; see renumber()
+SLICE_INDEX_STRIDE = 1_000_000
+
+# (chunk_index, content, content_hash, embedding)
+NewChunk = Tuple[int, str, str, Sequence[float]]
+
+
+def live_generation(doc_id) -> int:
+    return Document.objects.filter(pk=doc_id).values_list("live_generation", flat=True).get()
+
+
+def next_generation(doc_id) -> int:
+    """
+    Allocate a new generation: one past every generation handed out or
+    present, so an abandoned shadow is never reused. The UPDATE row lock
+    serializes concurrent runs for the document (a reprocess racing a retry,
+    dedupe racing ingest), so each gets its own.
+    """
+    doc_table = Document._meta.db_table
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            UPDATE {doc_table} d SET last_generation = GREATEST(
+                d.last_generation, d.live_generation,
+                (SELECT coalesce(max(c.generation), 0) FROM {TABLE} c
+                 WHERE c.organization_id = d.organization_id AND c.document_id = d.id)
+            ) + 1, last_generation_at = now()
+            WHERE d.id = %s
+            RETURNING last_generation
+            """,
+            [doc_id],
+        )
+        row = cur.fetchone()
+    if row is None:
+        raise Document.DoesNotExist(doc_id)
+    return row[0]
+
+
+def copy_chunks(doc_id, org_id, generation: int, rows: Iterable[NewChunk]) -> int:
+    """Stream new chunk rows into `generation` with binary COPY. Returns rows written."""
+    sql = f"COPY {TABLE} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT BINARY)"
+    n = 0
+    with connection.cursor() as c:
+        cur = c.cursor  # underlying psycopg cursor
+        register_vector_info(cur, TypeInfo.fetch(cur.connection, "vector"))
+        with cur.copy(sql) as copy:
+            copy.set_types(list(_COPY_TYPES))
+            for chunk_index, content, content_hash, embedding in rows:
+                copy.write_row(
+                    (
+                        uuid.uuid4(), doc_id, org_id, generation, chunk_index, content, content_hash,
+                        Vector(unit_vector(embedding)),
+                    )
+                )
+                n += 1
+    return n
+
+
+def clone_chunks(doc_id, generation: int, moves: List[Tuple[uuid.UUID, int]]) -> int:
+    """Copy existing rows (id -> new chunk_index) into `generation`, server-side."""
+    if not moves:
+        return 0
+    ids = [m[0] for m in moves]
+    positions = [m[1] for m in moves]
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            INSERT INTO {TABLE} ({', '.join(COPY_COLUMNS)})
+            SELECT gen_random_uuid(), c.document_id, c.organization_id, %s, m.chunk_index,
+                   c.content, c.content_hash, c.embedding
+            FROM {TABLE} c
+            JOIN unnest(%s::uuid[], %s::int[]) AS m(id, chunk_index) ON m.id = c.id
+            WHERE c.document_id = %s
+            """,
+            [generation, ids, positions, doc_id],
+        )
+        return cur.rowcount
+
+
+def clone_document(src_id, dst_id, generation: int) -> int:
+    """Copy the live generation of another document into `generation` of dst, server-side."""
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            INSERT INTO {TABLE} ({', '.join(COPY_COLUMNS)})
+            SELECT gen_random_uuid(), %s, c.organization_id, %s, c.chunk_index, c.content, c.content_hash, c.embedding
+            FROM {TABLE} c
+            JOIN {Document._meta.db_table} d ON d.id = c.document_id
+            WHERE c.document_id = %s AND c.generation = d.live_generation
+            """,
+            [dst_id, generation, src_id],
+        )
+        return cur.rowcount
+
+
+def renumber(doc_id, generation: int) -> int:
+    """
+    Close the gaps in chunk_index of a generation written in slices (slice
+    i writes from i * SLICE_INDEX_STRIDE), keeping the order.
+    """
+    # Every row that moves comes from >= SLICE_INDEX_STRIDE and lands below
+    # it, above slice 0's rows, so the unique index is never hit mid-update.
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            UPDATE {TABLE} t SET chunk_index = r.pos
+            FROM (
+                SELECT id, row_number() OVER (ORDER BY chunk_index) - 1 AS pos
+                FROM {TABLE} WHERE document_id = %s AND generation = %s
+            ) r
+            WHERE t.id = r.id AND t.chunk_index <> r.pos
+            """,
+            [doc_id, generation],
+        )
+        return cur.rowcount
+
+
+def flip_generation(doc_id, generation: int) -> None:
+    """Make `generation` live and schedule cleanup of the ones it replaced."""
+    from apps.documents.tasks import gc_chunk_generations
+
+    with transaction.atomic():
+        Document.objects.filter(pk=doc_id).update(live_generation=generation)
+        transaction.on_commit(lambda: gc_chunk_generations.delay(str(doc_id)))
+
+
+def delete_stale(doc_id, batch_size: int = 5000) -> int:
+    """Delete chunk rows older than the live generation, in short batches."""
+    deleted = 0
+    while True:
+        with connection.cursor() as cur:
+            cur.execute(
+                f"""
+                DELETE FROM {TABLE} WHERE id IN (
+                    SELECT c.id FROM {TABLE} c
+                    JOIN {Document._meta.db_table} d ON d.id = c.document_id
+                    WHERE c.document_id = %s AND c.generation < d.live_generation
+                    LIMIT %s
+                )
+                """,
+                [doc_id, batch_size],
+            )
+            n = cur.rowcount
+        deleted += n
+        if n < batch_size:
+            return deleted
+
+
+# Shadow generation (above live) that no run will finish: not a fanned-out
+# run's checkpointed generation (those resume), and no generation was handed
+# out for the document within the grace period (a run could still be writing).
+_ABANDONED = f"""
+    c.generation > d.live_generation
+    AND coalesce(d.last_generation_at, '-infinity') < now() - make_interval(secs => %s)
+    AND NOT EXISTS (
+        SELECT 1 FROM {IngestSlice._meta.db_table} s
+        WHERE s.document_id = c.document_id AND s.generation = c.generation
+    )
+"""
+
+
+def delete_abandoned(doc_id, grace_s: int, batch_size: int = 5000) -> int:
+    """Delete chunk rows of abandoned shadow generations (failed runs), in short batches."""
+    deleted = 0
+    while True:
+        with connection.cursor() as cur:
+            cur.execute(
+                f"""
+                DELETE FROM {TABLE} WHERE id IN (
+                    SELECT c.id FROM {TABLE} c
+                    JOIN {Document._meta.db_table} d ON d.id = c.document_id
+                    WHERE c.document_id = %s AND {_ABANDONED}
+                    LIMIT %s
+                )
+                """,
+                [doc_id, grace_s, batch_size],
+            )
+            n = cur.rowcount
+        deleted += n
+        if n < batch_size:
+            return deleted
+
+
+def documents_with_abandoned_chunks(grace_s: int) -> List[str]:
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT d.id FROM {Document._meta.db_table} d
+            WHERE (d.last_generation > d.live_generation OR d.last_generation = 0)
+            AND EXISTS (
+                SELECT 1 FROM {TABLE} c
+                WHERE c.organization_id = d.organization_id AND c.document_id = d.id AND {_ABANDONED}
+            )
+            """,
+            [grace_s],
+        )
+        return [str(r[0]) for r in cur.fetchall()]
+
+
+def documents_with_stale_chunks() -> List[str]:
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT DISTINCT c.document_id FROM {TABLE} c
+            JOIN {Document._meta.db_table} d ON d.id = c.document_id
+            WHERE c.generation < d.live_generation
+            """
+        )
+        return [str(r[0]) for r in cur.fetchall()]
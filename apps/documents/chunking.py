@@ -0,0 +1,250 @@
+"""
+Chunkers turn a stream of extracted text sections into embedding inputs.
+
+    get_chunker(mime).chunks(sections) -> Iterator[str]
+
+"token" (default, CHUNKER setting) packs whole structural units up to
+CHUNK_MAX_TOKENS tokens of the embedding model:
+  - text/PDF/DOCX: paragraphs, then sentences for paragraphs over budget
+  - Markdown: as text, but a heading always starts a new chunk
+  - CSV: whole rows, the header row repeated at the top of every chunk
+Consecutive chunks share up to CHUNK_OVERLAP_TOKENS tokens of trailing
+sentences (never partial words). Only a single sentence/row longer than the
+budget is cut by token windows.
+
+"chars" is the previous fixed-size character window, kept for comparison.
+
+Input is consumed incrementally: complete blocks are split off the buffer
+as sections arrive, and every unit is tokenized once with the cached
+encoder, so work is linear in document size.
+"""
+from __future__ import annotations
+
+import re
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Type
+
+from django.conf import settings
+
+from common.llm.tokens import count_tokens, split_tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_MD_HEADING = re.compile(r"^#{1,6}\s")
+# a block with no blank line in this many chars is split on single newlines
+_BLOCK_SCAN_CHARS = 32 * 1024
+
+
+class Chunker:
+    def chunks(self, sections: Iterable[str]) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class CharChunker(Chunker):
+    """Fixed-size character chunks with overlap (legacy behaviour)."""
+
+    def __init__(self, size: int, overlap: int):
+        self.size = size
+        self.overlap = overlap
+
+    def chunks(self, sections: Iterable[str]) -> Iterator[str]:
+        if self.size <= 0:
+            yield "".join(sections)
+            return
+        step = max(self.size - self.overlap, 1)
+        buf = ""
+        for section in sections:
+            buf += section
+            i = 0
+            while len(buf) - i > self.size:
+                yield buf[i : i + self.size]
+                i += step
+            buf = buf[i:]  # trim once per section, not per chunk
+        if buf:
+            yield buf
+
+
+class _Packer:
+    """Greedy packing of (text, tokens) units into chunks with sentence overlap."""
+
+    def __init__(self, max_tokens: int, overlap_tokens: int, sep: str, prefix: str = ""):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.sep = sep
+        self.prefix = prefix
+        self.prefix_tokens = 0
+        self.units: List[Tuple[str, int]] = []
+        self.tokens = 0
+        self.fresh = 0  # units not yet emitted in a previous chunk
+
+    def set_prefix(self, prefix: str, tokens: int) -> None:
+        self.prefix, self.prefix_tokens = prefix, tokens
+
+    def add(self, text: str, tokens: int) -> Iterator[str]:
+        budget = self.max_tokens - self.prefix_tokens
+        if self.units and self.tokens + tokens + 1 > budget:
+            yield from self.flush(keep_overlap=True)
+            while self.units and self.tokens + tokens + 1 > budget:
+                self.tokens -= self.units.pop(0)[1] + 1  # shrink overlap to fit
+        self.units.append((text, tokens))
+        self.tokens += tokens + 1
+        self.fresh += 1
+
+    def flush(self, keep_overlap: bool = False) -> Iterator[str]:
+        if self.fresh:
+            body = self.sep.join(t for t, _ in self.units)
+            yield f"{self.prefix}{self.sep}{body}" if self.prefix else body
+        carry: List[Tuple[str, int]] = []
+        if keep_overlap and self.overlap_tokens > 0:
+            used = 0
+            for text, tokens in reversed(self.units):
+                if used + tokens > self.overlap_tokens:
+                    break
+                carry.insert(0, (text, tokens))
+                used += tokens + 1
+        self.units = carry
+        self.tokens = sum(t + 1 for _, t in carry)
+        self.fresh = 0
+
+
+class TokenChunker(Chunker):
+    """Paragraph → sentence → token-window packing within a token budget."""
+
+    block_sep = "\n\n"
+
+    def __init__(self, max_tokens: int, overlap_tokens: int, model: str | None = None):
+        self.max_tokens = max(max_tokens, 16)
+        self.overlap_tokens = min(overlap_tokens, self.max_tokens // 2)
+        self.model = model
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def blocks(self, sections: Iterable[str]) -> Iterator[str]:
+        """Split the stream into blocks (paragraphs) without holding it all."""
+        buf = ""
+        for section in sections:
+            buf += section
+            cut = buf.rfind("\n\n")
+            if cut < 0 and len(buf) > _BLOCK_SCAN_CHARS:
+                cut = buf.rfind("\n")
+                if cut < 0:  # no line breaks at all: end the block at a word
+                    cut = buf.rfind(" ")
+                    cut = cut if cut > 0 else len(buf)
+            if cut < 0:
+                continue
+            yield from self._split_blocks(buf[:cut])
+            buf = buf[cut:]
+        yield from self._split_blocks(buf)
+
+    def _split_blocks(self, text: str) -> Iterator[str]:
+        for block in re.split(r"\n\s*\n", text):
+            block = block.strip()
+            if block:
+                yield block
+
+    def units(self, block: str) -> Iterator[Tuple[str, int]]:
+        """Yield (text, tokens) pieces of a block, each within the budget."""
+        n = self.count(block)
+        if n <= self.max_tokens:
+            yield block, n
+            return
+        for sentence in _SENTENCE_END.split(block):
+            if not sentence:
+                continue
+            n = self.count(sentence)
+            if n <= self.max_tokens:
+                yield sentence, n
+                continue
+            for piece in split_tokens(sentence, self.max_tokens, 0, self.model):
+                yield piece, self.count(piece)
+
+    def chunks(self, sections: Iterable[str]) -> Iterator[str]:
+        packer = _Packer(self.max_tokens, self.overlap_tokens, self.block_sep)
+        for block in self.blocks(sections):
+            for text, tokens in self.units(block):
+                yield from packer.add(text, tokens)
+        yield from packer.flush()
+
+
+class MarkdownChunker(TokenChunker):
+    """TokenChunker that starts a new chunk at every heading."""
+
+    def _split_blocks(self, text: str) -> Iterator[str]:
+        # headings are blocks of their own even without surrounding blank lines
+        for block in super()._split_blocks(text):
+            para: List[str] = []
+            for line in block.split("\n"):
+                if _MD_HEADING.match(line) and para:
+                    yield "\n".join(para)
+                    para = []
+                para.append(line)
+            if para:
+                yield "\n".join(para)
+
+    def chunks(self, sections: Iterable[str]) -> Iterator[str]:
+        packer = _Packer(self.max_tokens, self.overlap_tokens, self.block_sep)
+        for block in self.blocks(sections):
+            if _MD_HEADING.match(block):
+                yield from packer.flush()  # no overlap across sections
+            for text, tokens in self.units(block):
+                yield from packer.add(text, tokens)
+        yield from packer.flush()
+
+
+class CsvChunker(TokenChunker):
+    """Whole rows per chunk, header repeated; rows have no overlap."""
+
+    def rows(self, sections: Iterable[str]) -> Iterator[str]:
+        # a row ends at a newline outside quotes (quoted fields may span lines)
+        buf, quotes = "", 0
+        for section in sections:
+            for line in section.splitlines(keepends=True):
+                buf += line
+                quotes += line.count('"')
+                if line.endswith("\n") and quotes % 2 == 0:
+                    row = buf.rstrip("\r\n")
+                    if row:
+                        yield row
+                    buf, quotes = "", 0
+        if buf.strip():
+            yield buf.rstrip("\r\n")
+
+    def chunks(self, sections: Iterable[str]) -> Iterator[str]:
+        packer = _Packer(self.max_tokens, 0, "\n")
+        for i, row in enumerate(self.rows(sections)):
+            n = self.count(row)
+            if i == 0 and n <= self.max_tokens // 2:
+                packer.set_prefix(row, n + 1)
+                continue
+            if n > self.max_tokens - packer.prefix_tokens:
+                for piece in split_tokens(row, self.max_tokens - packer.prefix_tokens, 0, self.model):
+                    yield from packer.add(piece, self.count(piece))
+                continue
+            yield from packer.add(row, n)
+        yield from packer.flush()
+
+
+_TOKEN_CHUNKERS: Dict[str, Type[TokenChunker]] = {
+    "text/markdown": MarkdownChunker,
+    "text/csv": CsvChunker,
+}
+
+CHUNKERS: Dict[str, Callable[[str], Chunker]] = {
+    "token": lambda mime: _TOKEN_CHUNKERS.get(mime, TokenChunker)(
+        int(getattr(settings, "CHUNK_MAX_TOKENS", 512)),
+        int(getattr(settings, "CHUNK_OVERLAP_TOKENS", 48)),
+        getattr(settings, "EMBEDDING_MODEL", None),
+    ),
+    "chars": lambda mime: CharChunker(
+        int(getattr(settings, "CHUNK_SIZE_CHARS", 1500)),
+        int(getattr(settings, "CHUNK_OVERLAP_CHARS", 200)),
+    ),
+}
+
+
+def get_chunker(mime: str) -> Chunker:
+    name = getattr(settings, "CHUNKER", "token")
+    try:
+        factory = CHUNKERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown CHUNKER: {name}")
+    return factory(mime)
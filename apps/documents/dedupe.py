@@ -0,0 +1,115 @@
+"""
+Per-org content-addressed deduplication of uploads.
+
+Documents are indexed by (organization, content_hash). When a new upload
+has the same file hash as a READY document of the same org, its chunks and
+embeddings are cloned server-side from the source's live generation and
+the document goes straight to READY without extraction or embedding.
+Document.deduplicated_from records the source. This runs in the ingest
+worker; an upload whose identical predecessor is still PROCESSING waits
+for it (pending_source) instead of embedding the same file twice.
+
+Counters (Redis hash ingest:dedupe) feed the ops metrics endpoint:
+documents deduplicated and chunk embeddings not recomputed.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, Optional
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from apps.documents import chunk_store
+from apps.documents.models import Document
+
+log = logging.getLogger(__name__)
+
+STATS_KEY = "ingest:dedupe"
+
+_r = None
+
+
+def _client():
+    global _r
+    if _r is None:
+        _r = redis.from_url(getattr(settings, "IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"))
+    return _r
+
+
+def enabled() -> bool:
+    return bool(settings.DOCUMENT_DEDUPE_ENABLED)
+
+
+def find_source(doc: Document) -> Optional[Document]:
+    if not doc.content_hash:
+        return None
+    return (
+        Document.objects.filter(
+            organization_id=doc.organization_id,
+            content_hash=doc.content_hash,
+            status=Document.Status.READY,
+        )
+        .exclude(pk=doc.pk)
+        .order_by("upload_date")
+        .first()
+    )
+
+
+def pending_source(doc: Document) -> Optional[Document]:
+    """
+    An earlier upload of the same file that is still being processed, so
+    `doc` should wait and clone it. None once `doc` has waited
+    DOCUMENT_DEDUPE_MAX_WAIT_S, so a stuck source never blocks it for good.
+    """
+    if not enabled() or not doc.content_hash:
+        return None
+    if (timezone.now() - doc.upload_date).total_seconds() > settings.DOCUMENT_DEDUPE_MAX_WAIT_S:
+        return None
+    return (
+        Document.objects.filter(
+            organization_id=doc.organization_id,
+            content_hash=doc.content_hash,
+            status=Document.Status.PROCESSING,
+            upload_date__lt=doc.upload_date,
+        )
+        .order_by("upload_date")
+        .first()
+    )
+
+
+def try_dedupe(doc: Document) -> Optional[Dict]:
+    """Clone chunks from an identical READY document; None if there is none."""
+    if not enabled():
+        return None
+    source = find_source(doc)
+    if source is None:
+        return None
+    generation = chunk_store.next_generation(doc.id)
+    cloned = chunk_store.clone_document(source.id, doc.id, generation)
+    chunk_store.flip_generation(doc.id, generation)
+    doc.deduplicated_from = source
+    doc.status = Document.Status.READY
+    doc.save(update_fields=["deduplicated_from", "status"])
+    _count(cloned)
+    log.info("Document %s deduplicated from %s: %d chunks cloned", doc.id, source.id, cloned)
+    return {"deduplicated_from": str(source.id), "cloned": cloned, "generation": generation}
+
+
+def _count(chunks: int) -> None:
+    try:
+        p = _client().pipeline(transaction=False)
+        p.hincrby(STATS_KEY, "documents", 1)
+        p.hincrby(STATS_KEY, "chunks_not_embedded", chunks)
+        p.execute()
+    except redis.RedisError:
+        pass
+
+
+def stats() -> Optional[Dict]:
+    try:
+        raw = _client().hgetall(STATS_KEY) or {}
+    except redis.RedisError:
+        return None
+    return {k.decode(): int(v) for k, v in raw.items()}
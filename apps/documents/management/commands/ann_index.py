@@ -0,0 +1,180 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.documents import ann
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage the pgvector ANN index on DocumentChunk.embedding.\n"
+        "  build    create the index if missing\n"
+        "  rebuild  build a replacement concurrently and swap it in\n"
+        "  drop     remove the index (queries fall back to exact scans)\n"
+        "  status   show ANN indexes currently defined\n"
+        "  sizes    on-disk size of the chunk table, its TOAST and indexes\n"
+        "  report   recall-vs-latency sweep over ef_search / probes\n"
+        "--storage halfvec|binary targets the compact index (see apps.documents.ann).\n"
+        "--dims N targets the truncated Matryoshka coarse index; report then sweeps --factors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["build", "rebuild", "drop", "status", "sizes", "report"])
+        parser.add_argument("--method", choices=ann.METHODS, default=None)
+        parser.add_argument("--storage", choices=ann.STORAGES, default=None,
+                            help="index representation (default: EMBEDDING_STORAGE)")
+        parser.add_argument("--dims", type=int, default=0, help="Matryoshka coarse index over the first N dims")
+        parser.add_argument("--m", type=int, default=None, help="HNSW max connections per layer")
+        parser.add_argument("--ef-construction", type=int, default=None, help="HNSW build candidate list size")
+        parser.add_argument("--lists", type=int, default=None, help="IVFFlat list count (default: derived from rows)")
+        # report options
+        parser.add_argument("--sample", type=int, default=100, help="number of query vectors to sample")
+        parser.add_argument("--top-k", type=int, default=10)
+        parser.add_argument("--org", default=None, help="restrict report to one organization id")
+        parser.add_argument("--ef-search", default="10,20,40,80,160", help="comma-separated HNSW ef_search values")
+        parser.add_argument("--probes", default="1,5,10,20,50", help="comma-separated IVFFlat probes values")
+        parser.add_argument("--factors", default="2,4,8,16",
+                            help="comma-separated candidate multipliers swept with --dims")
+
+    def handle(self, *args, **opts):
+        action = opts["action"]
+        storage = opts["storage"] or ann.default_storage()
+        dims = opts["dims"]
+        if dims and not 0 < dims < ann._dim():
+            raise CommandError(f"--dims must be between 1 and {ann._dim() - 1}")
+        if action == "status":
+            return self._status()
+        if action == "sizes":
+            return self._sizes()
+        if action == "drop":
+            ann.drop_index(storage, dims)
+            self.stdout.write(self.style.SUCCESS(f"ANN index dropped ({ann.index_name(storage, dims)})"))
+            return
+        if action == "report":
+            return self._report(opts)
+
+        method = opts["method"] or ann.default_method()
+        params = {"m": opts["m"], "ef_construction": opts["ef_construction"], "lists": opts["lists"],
+                  "storage": storage, "dims": dims}
+        started = time.perf_counter()
+        if action == "build":
+            sql = ann.build_index(method, **params)
+        else:
+            sql = ann.rebuild_index(method, **params)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(sql)
+        self.stdout.write(self.style.SUCCESS(f"{action} finished in {elapsed:.1f}s"))
+
+    def _status(self):
+        rows = ann.existing_indexes()
+        if not rows:
+            self.stdout.write("No ANN index on %s (exact scans only)" % ann.TABLE)
+        for r in rows:
+            self.stdout.write(f"{r['name']}: {r['definition']}")
+
+    def _sizes(self):
+        sizes = ann.relation_sizes()
+        self.stdout.write(f"{'heap':<40} {_mb(sizes['heap']):>10}")
+        self.stdout.write(f"{'toast':<40} {_mb(sizes['toast']):>10}")
+        for name, size in sizes["indexes"].items():
+            self.stdout.write(f"{name:<40} {_mb(size):>10}")
+
+    def _report(self, opts):
+        storage = opts["storage"] or ann.default_storage()
+        dims = opts["dims"]
+        indexes = [i for i in ann.existing_indexes() if i["name"] == ann.index_name(storage, dims)]
+        if not indexes and dims:
+            raise CommandError(f"No coarse index for {dims} dims; run `ann_index build --dims {dims}` first")
+        indexes = indexes or ann.existing_indexes()
+        if not indexes:
+            raise CommandError("No ANN index present; run `ann_index build` first")
+        method = opts["method"] or ("hnsw" if "USING hnsw" in indexes[0]["definition"] else "ivfflat")
+        knob = "ef_search" if method == "hnsw" else "probes"
+        values = [int(v) for v in opts[knob].split(",") if v.strip()]
+        factors = [int(f) for f in opts["factors"].split(",") if f.strip()] if dims else [None]
+        k = opts["top_k"]
+        org_id = opts["org"]
+
+        queries = self._sample_queries(opts["sample"], org_id)
+        if not queries:
+            raise CommandError("No chunks to sample")
+
+        exact, exact_ms = [], []
+        for q in queries:
+            ids, ms = self._knn(q, k, org_id, exact=True)
+            exact.append(set(ids))
+            exact_ms.append(ms)
+
+        self.stdout.write(
+            f"method={method} storage={storage} queries={len(queries)} k={k}"
+            + (f" dims={dims}" if dims else "") + (f" org={org_id}" if org_id else "")
+        )
+        self.stdout.write(f"{'factor':>7} {knob:>10} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        self.stdout.write(f"{'-':>7} {'exact':>10} {1.0:>9.3f} {_pct(exact_ms, 50):>8.2f} {_pct(exact_ms, 95):>8.2f}")
+        for factor in factors:
+            for v in values:
+                recalls, lat = [], []
+                for q, truth in zip(queries, exact):
+                    ids, ms = self._knn(q, k, org_id, storage=storage, dims=dims, factor=factor, **{knob: v})
+                    lat.append(ms)
+                    recalls.append(len(truth.intersection(ids)) / max(len(truth), 1))
+                self.stdout.write(
+                    f"{factor or '-':>7} {v:>10} {statistics.mean(recalls):>9.3f}"
+                    f" {_pct(lat, 50):>8.2f} {_pct(lat, 95):>8.2f}"
+                )
+
+    def _sample_queries(self, n, org_id):
+        sql = f"SELECT c.embedding::text FROM {ann.TABLE} c"
+        params = []
+        if org_id:
+            sql += " WHERE c.organization_id = %s"
+            params.append(org_id)
+        sql += " ORDER BY random() LIMIT %s"
+        params.append(n)
+        with connection.cursor() as cur:
+            cur.execute(sql, params)
+            return [r[0] for r in cur.fetchall()]
+
+    def _knn(self, qvec_text, k, org_id, *, exact=False, storage="full", dims=0, factor=None,
+             ef_search=None, probes=None):
+        where, params = "", []
+        if org_id:
+            where = " WHERE c.organization_id = %s"
+            params.append(org_id)
+        if exact or (storage == "full" and not dims):
+            sql = f"SELECT c.id FROM {ann.TABLE} c{where} ORDER BY c.embedding <=> %s::vector LIMIT %s"
+            params.extend([qvec_text, k])
+        else:
+            # same shape as retrieval.search_chunks: compact candidates, exact rerank
+            n = k * (factor if dims else ann.rerank_factor(storage))
+            sql = (
+                f"SELECT r.id FROM (SELECT c.id, c.embedding FROM {ann.TABLE} c{where}"
+                f" ORDER BY {ann.coarse_distance_sql(storage, 'c.embedding', dims)} LIMIT %s) r"
+                " ORDER BY r.embedding <#> %s::vector LIMIT %s"
+            )
+            params.extend([qvec_text, n, qvec_text, k])
+            ef_search = max(ef_search or 0, n)
+        with transaction.atomic(), connection.cursor() as cur:
+            if exact:
+                cur.execute("SELECT set_config('enable_indexscan', 'off', true)")
+            else:
+                ann.apply_search_params(cur, ef_search=ef_search, probes=probes)
+            started = time.perf_counter()
+            cur.execute(sql, params)
+            ids = [r[0] for r in cur.fetchall()]
+            ms = (time.perf_counter() - started) * 1000
+        return ids, ms
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _mb(n):
+    return f"{n / (1024 * 1024):.1f} MB"
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.documents import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage per-tenant partitioning of the chunk table (see apps.documents.partitions).\n"
+        "  status       partitions with row estimates and sizes\n"
+        "  repartition  move to a new layout online: hash buckets for most orgs,\n"
+        "               dedicated partitions (with their own ANN indexes) for big ones\n"
+        "  cleanup      drop chunk tables retired by earlier repartitions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["status", "repartition", "cleanup"])
+        parser.add_argument("--buckets", type=int, default=None,
+                            help="hash partitions for shared tenants (default: CHUNK_PARTITION_BUCKETS)")
+        parser.add_argument("--dedicated", default="", help="comma-separated organization ids to give a partition")
+        parser.add_argument("--min-rows", type=int, default=None,
+                            help="also dedicate orgs with at least this many chunks "
+                                 "(default: CHUNK_DEDICATED_MIN_ROWS, 0 = off)")
+        parser.add_argument("--undedicate", default="", help="comma-separated organization ids to move back to shared")
+        parser.add_argument("--batch", type=int, default=5000, help="rows copied per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="print the new layout's DDL and stop")
+        parser.add_argument("--table", default=None, help="cleanup: drop only this retired table")
+
+    def handle(self, *args, **opts):
+        action = opts["action"]
+        if action == "status":
+            return self._status()
+        if action == "cleanup":
+            dropped = partitions.cleanup(opts["table"])
+            self.stdout.write(self.style.SUCCESS(f"Dropped {', '.join(dropped) or 'nothing'}"))
+            return
+
+        buckets = opts["buckets"] or int(getattr(settings, "CHUNK_PARTITION_BUCKETS", 16))
+        min_rows = opts["min_rows"]
+        if min_rows is None:
+            min_rows = int(getattr(settings, "CHUNK_DEDICATED_MIN_ROWS", 0))
+        # keep current dedicated partitions unless told otherwise
+        dedicated = set(partitions.dedicated_orgs()) | set(_ids(opts["dedicated"]))
+        if min_rows:
+            dedicated |= set(partitions.large_orgs(min_rows))
+        dedicated -= set(_ids(opts["undedicate"]))
+
+        if opts["dry_run"]:
+            for sql in partitions.create_sql(partitions._next_version(), buckets, sorted(dedicated)):
+                self.stdout.write(sql + ";")
+            return
+        try:
+            retired = partitions.repartition(buckets, dedicated, batch=opts["batch"], log=self.stdout.write)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Repartitioned: {len(dedicated)} dedicated, {buckets} shared buckets. "
+            f"Previous table kept as {retired}; drop it with `chunk_partitions cleanup`."
+        ))
+
+    def _status(self):
+        rows = partitions.layout()
+        if not rows:
+            self.stdout.write(f"{partitions.TABLE} is not partitioned")
+        for r in rows:
+            self.stdout.write(f"{r['name']:<48} {r['rows']:>12} rows {r['bytes'] / (1024 * 1024):>10.1f} MB  {r['bound']}")
+        for name in partitions.retired_tables():
+            self.stdout.write(f"retired: {name}")
+
+
+def _ids(raw):
+    return [i.strip() for i in raw.split(",") if i.strip()]
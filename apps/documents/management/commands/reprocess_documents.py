@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from apps.documents import progress
+from apps.documents.models import Document
+from apps.documents.tasks import enqueue_processing
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue documents for reprocessing on the bulk ingest lane "
+        "(CELERY_QUEUE_INGEST_BULK), leaving interactive uploads unaffected."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--org", default=None, help="restrict to one organization id")
+        parser.add_argument("--mode", choices=["incremental", "full"], default="incremental")
+        parser.add_argument("--status", choices=[s.value for s in Document.Status], default=None,
+                            help="only documents currently in this status")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        docs = Document.objects.all()
+        if opts["org"]:
+            docs = docs.filter(organization_id=opts["org"])
+        if opts["status"]:
+            docs = docs.filter(status=opts["status"])
+        n = skipped = 0
+        for doc in docs.only("id", "organization_id", "size_bytes", "status").iterator(chunk_size=500):
+            if doc.status == Document.Status.PROCESSING:
+                skipped += 1  # already queued or running
+                continue
+            if opts["dry_run"]:
+                n += 1
+                continue
+            claimed = (
+                Document.objects.filter(pk=doc.pk)
+                .exclude(status=Document.Status.PROCESSING)
+                .update(status=Document.Status.PROCESSING)
+            )
+            if not claimed:  # picked up since it was read
+                skipped += 1
+                continue
+            n += 1
+            progress.set_status(doc.id, doc.organization_id, Document.Status.PROCESSING)
+            enqueue_processing(doc, mode=opts["mode"], bulk=True)
+        verb = "Would queue" if opts["dry_run"] else "Queued"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {n} documents ({opts['mode']}) on the bulk lane"))
+        if skipped:
+            self.stdout.write(f"Skipped {skipped} documents that are already processing")
@@ -0,0 +1,31 @@
+# Replace the fixed IVFFlat index from 0001 with an HNSW index built online.
+# Parameters can be changed later with `manage.py ann_index rebuild`.
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("documents", "0002_rename_doc_org_uploaddate_idx_documents_d_organiz_428f7c_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS docchunk_embedding_ann "
+                "ON documents_documentchunk USING hnsw (embedding vector_cosine_ops) "
+                "WITH (m = 16, ef_construction = 64);"
+            ),
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS docchunk_embedding_ann;",
+        ),
+        migrations.RunSQL(
+            sql="DROP INDEX CONCURRENTLY IF EXISTS docchunk_embedding_ivfflat;",
+            reverse_sql=(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS docchunk_embedding_ivfflat "
+                "ON documents_documentchunk USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);"
+            ),
+        ),
+    ]
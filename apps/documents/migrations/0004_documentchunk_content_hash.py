@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:16
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    # Same formula as apps.documents.tasks.chunk_hash. Stored content is the
+    # full chunk text as long as chunks stay under the 5000-char cap.
+    DocumentChunk = apps.get_model("documents", "DocumentChunk")
+    model = getattr(settings, "EMBEDDING_MODEL", "")
+    batch = []
+    for row in DocumentChunk.objects.filter(content_hash="").only("id", "content").iterator(chunk_size=2000):
+        row.content_hash = hashlib.sha256(f"{model}\x00{row.content}".encode("utf-8")).hexdigest()
+        batch.append(row)
+        if len(batch) >= 2000:
+            DocumentChunk.objects.bulk_update(batch, ["content_hash"])
+            batch = []
+    if batch:
+        DocumentChunk.objects.bulk_update(batch, ["content_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0003_documentchunk_hnsw_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentchunk",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0004_documentchunk_content_hash"),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name="documentchunk",
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name="document",
+            name="live_generation",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="generation",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name="documentchunk",
+            unique_together={("document", "generation", "chunk_index")},
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:21
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0005_chunk_generations"),
+        ("organizations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AlterField(
+            model_name="document",
+            name="url",
+            field=models.URLField(max_length=1024),
+        ),
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("name", models.CharField(max_length=200)),
+                ("filename", models.CharField(max_length=255)),
+                (
+                    "file_type",
+                    models.CharField(
+                        choices=[
+                            ("pdf", "pdf"),
+                            ("docx", "docx"),
+                            ("txt", "txt"),
+                            ("md", "md"),
+                            ("csv", "csv"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("size_bytes", models.PositiveIntegerField()),
+                ("part_size", models.PositiveIntegerField()),
+                (
+                    "backend",
+                    models.CharField(
+                        choices=[("local", "local"), ("s3", "s3")],
+                        default="local",
+                        max_length=10,
+                    ),
+                ),
+                ("storage_key", models.CharField(max_length=512)),
+                (
+                    "s3_upload_id",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("parts", models.JSONField(default=dict)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "pending"),
+                            ("complete", "complete"),
+                            ("aborted", "aborted"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("expires_at", models.DateTimeField()),
+                (
+                    "document",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="documents.document",
+                    ),
+                ),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="organizations.organization",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "expires_at"],
+                        name="documents_u_status_0ff690_idx",
+                    )
+                ],
+            },
+        ),
+    ]
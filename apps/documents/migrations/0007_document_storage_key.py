@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_storage_key(apps, schema_editor):
+    # Rows created before storage_key only have a MEDIA_URL-relative url
+    media_url = getattr(settings, "MEDIA_URL", "")
+    if not media_url:
+        return
+    Document = apps.get_model("documents", "Document")
+    batch = []
+    for doc in Document.objects.filter(storage_key="", url__startswith=media_url).only("id", "url").iterator():
+        doc.storage_key = doc.url[len(media_url) :].lstrip("/")
+        batch.append(doc)
+        if len(batch) >= 1000:
+            Document.objects.bulk_update(batch, ["storage_key"])
+            batch = []
+    if batch:
+        Document.objects.bulk_update(batch, ["storage_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0006_upload_sessions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="storage_key",
+            field=models.CharField(blank=True, default="", max_length=512),
+        ),
+        migrations.RunPython(backfill_storage_key, migrations.RunPython.noop),
+    ]
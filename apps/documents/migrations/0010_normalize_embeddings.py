@@ -0,0 +1,42 @@
+# Scale stored embeddings to unit length, so inner-product operators (the
+# halfvec/binary ANN indexes, full-precision rerank) rank like cosine.
+# New rows are normalized on write (chunk_store.copy_chunks). Runs in
+# committed batches; rows that are already unit length (OpenAI embeddings)
+# are not rewritten. Needs pgvector >= 0.7 for l2_normalize().
+from django.db import migrations
+
+BATCH = 2000
+
+
+def normalize(apps, schema_editor):
+    table = "documents_documentchunk"
+    last = None
+    with schema_editor.connection.cursor() as cur:
+        while True:
+            if last is None:
+                cur.execute(f"SELECT id FROM {table} ORDER BY id LIMIT %s", [BATCH])
+            else:
+                cur.execute(f"SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s", [last, BATCH])
+            ids = [r[0] for r in cur.fetchall()]
+            if not ids:
+                return
+            cur.execute(
+                f"UPDATE {table} SET embedding = l2_normalize(embedding) "
+                "WHERE id = ANY(%s) AND abs(vector_norm(embedding) - 1) > 1e-6",
+                [ids],
+            )
+            last = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    # each batch commits on its own instead of one long-running transaction
+    atomic = False
+
+    dependencies = [
+        ("documents", "0009_ingest_slices"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize, migrations.RunPython.noop),
+    ]
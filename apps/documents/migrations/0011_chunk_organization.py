@@ -0,0 +1,115 @@
+# Copy Document.organization_id onto DocumentChunk, online:
+#   1. add the column nullable (no rewrite), plus a BEFORE INSERT trigger that
+#      fills it from the document for writers that predate this change
+#   2. backfill in committed keyset batches
+#   3. FK and NOT NULL via NOT VALID constraints validated afterwards, so the
+#      table is never scanned under an exclusive lock
+#   4. the composite index, built concurrently
+# Repartitioning by organization is a separate, online step:
+# `manage.py chunk_partitions repartition` (apps.documents.partitions).
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+TABLE = "documents_documentchunk"
+BATCH = 2000
+
+
+def backfill(apps, schema_editor):
+    last = None
+    with schema_editor.connection.cursor() as cur:
+        while True:
+            if last is None:
+                cur.execute(f"SELECT id FROM {TABLE} ORDER BY id LIMIT %s", [BATCH])
+            else:
+                cur.execute(f"SELECT id FROM {TABLE} WHERE id > %s ORDER BY id LIMIT %s", [last, BATCH])
+            ids = [r[0] for r in cur.fetchall()]
+            if not ids:
+                return
+            cur.execute(
+                f"UPDATE {TABLE} c SET organization_id = d.organization_id "
+                "FROM documents_document d "
+                "WHERE c.id = ANY(%s) AND d.id = c.document_id AND c.organization_id IS NULL",
+                [ids],
+            )
+            last = ids[-1]
+
+
+FILL_TRIGGER = f"""
+CREATE OR REPLACE FUNCTION docchunk_fill_organization() RETURNS trigger AS $$
+BEGIN
+    IF NEW.organization_id IS NULL THEN
+        SELECT organization_id INTO NEW.organization_id FROM documents_document WHERE id = NEW.document_id;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER docchunk_fill_organization BEFORE INSERT ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION docchunk_fill_organization();
+"""
+
+
+class Migration(migrations.Migration):
+
+    # batches commit on their own; required by AddIndexConcurrently
+    atomic = False
+
+    dependencies = [
+        ("documents", "0010_normalize_embeddings"),
+        ("organizations", "0002_retrieval_coarse"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name="documentchunk",
+                    name="organization",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="organizations.organization",
+                    ),
+                    preserve_default=False,
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    f"ALTER TABLE {TABLE} ADD COLUMN organization_id uuid NULL;" + FILL_TRIGGER,
+                    reverse_sql=(
+                        f"DROP TRIGGER IF EXISTS docchunk_fill_organization ON {TABLE};"
+                        "DROP FUNCTION IF EXISTS docchunk_fill_organization();"
+                        f"ALTER TABLE {TABLE} DROP COLUMN organization_id;"
+                    ),
+                ),
+                migrations.RunPython(backfill, migrations.RunPython.noop),
+                migrations.RunSQL(
+                    f"ALTER TABLE {TABLE} ADD CONSTRAINT docchunk_organization_id_fk "
+                    "FOREIGN KEY (organization_id) REFERENCES organizations_organization (id) "
+                    "DEFERRABLE INITIALLY DEFERRED NOT VALID;",
+                    reverse_sql=f"ALTER TABLE {TABLE} DROP CONSTRAINT IF EXISTS docchunk_organization_id_fk;",
+                ),
+                migrations.RunSQL(
+                    f"ALTER TABLE {TABLE} VALIDATE CONSTRAINT docchunk_organization_id_fk;",
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+                # SET NOT NULL skips its scan when a valid CHECK already proves it (PG 12+)
+                migrations.RunSQL(
+                    f"ALTER TABLE {TABLE} ADD CONSTRAINT docchunk_organization_id_nn "
+                    "CHECK (organization_id IS NOT NULL) NOT VALID;",
+                    reverse_sql=f"ALTER TABLE {TABLE} ALTER COLUMN organization_id DROP NOT NULL;",
+                ),
+                migrations.RunSQL(
+                    f"ALTER TABLE {TABLE} VALIDATE CONSTRAINT docchunk_organization_id_nn;"
+                    f"ALTER TABLE {TABLE} ALTER COLUMN organization_id SET NOT NULL;"
+                    f"ALTER TABLE {TABLE} DROP CONSTRAINT docchunk_organization_id_nn;",
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name="documentchunk",
+            index=models.Index(fields=["organization", "document", "generation"], name="docchunk_org_doc_gen_idx"),
+        ),
+    ]
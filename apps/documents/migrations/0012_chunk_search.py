@@ -0,0 +1,96 @@
+# Full-text column for lexical / hybrid retrieval (apps.documents.retrieval).
+# A BEFORE INSERT/UPDATE trigger fills it, so COPY and the server-side clone
+# paths in chunk_store need no change; existing rows are backfilled in
+# committed batches and the GIN index is built concurrently (per partition
+# when the chunk table is partitioned).
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+TABLE = "documents_documentchunk"
+INDEX = "docchunk_search_gin"
+BATCH = 2000
+
+# must match retrieval.TEXT_SEARCH_CONFIG
+SEARCH_TRIGGER = f"""
+CREATE OR REPLACE FUNCTION docchunk_search_vector() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' OR NEW.search IS NULL THEN
+        NEW.search := to_tsvector('english'::regconfig, coalesce(NEW.content, ''));
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER docchunk_search_vector BEFORE INSERT OR UPDATE OF content ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION docchunk_search_vector();
+"""
+
+
+def backfill(apps, schema_editor):
+    last = None
+    with schema_editor.connection.cursor() as cur:
+        while True:
+            if last is None:
+                cur.execute(f"SELECT id FROM {TABLE} ORDER BY id LIMIT %s", [BATCH])
+            else:
+                cur.execute(f"SELECT id FROM {TABLE} WHERE id > %s ORDER BY id LIMIT %s", [last, BATCH])
+            ids = [r[0] for r in cur.fetchall()]
+            if not ids:
+                return
+            cur.execute(
+                f"UPDATE {TABLE} SET search = to_tsvector('english'::regconfig, coalesce(content, '')) "
+                "WHERE id = ANY(%s) AND search IS NULL",
+                [ids],
+            )
+            last = ids[-1]
+
+
+def create_index(apps, schema_editor):
+    from apps.documents import ann, partitions
+
+    spec = "USING gin (search)"
+    if partitions.is_partitioned():
+        ann.build_on_partitions(TABLE, INDEX, "search", spec)
+    else:
+        schema_editor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX} ON {TABLE} {spec}")
+
+
+def drop_index(apps, schema_editor):
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    # batches commit on their own; concurrent index build
+    atomic = False
+
+    dependencies = [
+        ("documents", "0011_chunk_organization"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentchunk",
+            name="search",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            SEARCH_TRIGGER,
+            reverse_sql=(
+                f"DROP TRIGGER IF EXISTS docchunk_search_vector ON {TABLE};"
+                "DROP FUNCTION IF EXISTS docchunk_search_vector();"
+            ),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="documentchunk",
+                    index=django.contrib.postgres.indexes.GinIndex(fields=["search"], name=INDEX),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_index, drop_index),
+            ],
+        ),
+    ]
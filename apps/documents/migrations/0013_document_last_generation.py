@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0012_chunk_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="last_generation",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0013_document_last_generation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="last_generation_at",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
@@ -1,6 +1,8 @@
 import uuid
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from pgvector.django import VectorField
 
 class Document(models.Model):
@@ -22,24 +24,127 @@ class Document(models.Model):
     size_bytes = models.PositiveIntegerField()
     upload_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.PROCESSING)
-    url = models.URLField()
+    # signed storage URLs (S3) run well past the default 200 chars
+    url = models.URLField(max_length=1024)
+    # name in default_storage; workers read the file from here, not from url
+    storage_key = models.CharField(max_length=512, blank=True, default="")
+    # sha256 of the stored file; computed while uploading, or at ingest for
+    # direct-to-storage uploads
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    # READY document of the same org whose chunks were cloned (apps.documents.dedupe)
+    deduplicated_from = models.ForeignKey(
+        "self", null=True, blank=True, on_delete=models.SET_NULL, related_name="duplicates"
+    )
+    # Chunk generation served by retrieval; see apps.documents.chunk_store
+    live_generation = models.PositiveIntegerField(default=0)
+    # highest generation handed out by chunk_store.next_generation, and when
+    last_generation = models.PositiveIntegerField(default=0, editable=False)
+    last_generation_at = models.DateTimeField(null=True, editable=False)
 
     class Meta:
         indexes = [
             models.Index(fields=["organization", "upload_date"]),
             models.Index(fields=["organization", "name"]),
+            models.Index(fields=["organization", "content_hash"]),
         ]
 
 class DocumentChunk(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     document = models.ForeignKey("documents.Document", on_delete=models.CASCADE, related_name="chunks")
+    # copy of document.organization: retrieval filters on it without the join,
+    # and it is the partition key (apps.documents.partitions)
+    organization = models.ForeignKey(
+        "organizations.Organization", on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    generation = models.PositiveIntegerField(default=0)
     chunk_index = models.PositiveIntegerField()
     content = models.TextField()
+    # sha256 of embedding model + full chunk text; lets reprocessing keep the
+    # embedding of unchanged chunks (see apps.documents.tasks.chunk_hash)
+    content_hash = models.CharField(max_length=64, blank=True, default="")
     # VectorField requires dimension known at model import time
     embedding = VectorField(dimensions=getattr(settings, "EMBEDDING_DIM", 1536))
+    # to_tsvector(content), set by a BEFORE INSERT/UPDATE trigger (0012); see retrieval.lexical_chunks
+    search = SearchVectorField(null=True, editable=False)
 
     class Meta:
-        unique_together = [("document", "chunk_index")]
+        unique_together = [("document", "generation", "chunk_index")]
         indexes = [
             models.Index(fields=["document", "chunk_index"]),
-        ]
\ No newline at end of file
+            models.Index(fields=["organization", "document", "generation"], name="docchunk_org_doc_gen_idx"),
+            GinIndex(fields=["search"], name="docchunk_search_gin"),
+        ]
+
+class IngestSlice(models.Model):
+    """
+    Checkpoint of one page range of a fanned-out ingest (see
+    apps.documents.tasks.process_document). A slice is DONE once its chunks
+    are committed to the shadow generation; rerunning the ingest dispatches
+    only the slices that are not.
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending", "pending"
+        DONE = "done", "done"
+        FAILED = "failed", "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    document = models.ForeignKey("documents.Document", on_delete=models.CASCADE, related_name="ingest_slices")
+    generation = models.PositiveIntegerField()
+    mode = models.CharField(max_length=20)
+    index = models.PositiveIntegerField()
+    page_start = models.PositiveIntegerField()
+    page_stop = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    chunks = models.PositiveIntegerField(default=0)
+    reused = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [("document", "generation", "index")]
+
+class UploadSession(models.Model):
+    """
+    A multipart/resumable upload in progress. Parts go either through the
+    API into default_storage ("local") or straight to S3 with presigned
+    part URLs ("s3"). See apps.documents.uploads.
+    """
+    class Backend(models.TextChoices):
+        LOCAL = "local", "local"
+        S3 = "s3", "s3"
+    class Status(models.TextChoices):
+        PENDING = "pending", "pending"
+        COMPLETE = "complete", "complete"
+        ABORTED = "aborted", "aborted"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    organization = models.ForeignKey("organizations.Organization", on_delete=models.CASCADE)
+    name = models.CharField(max_length=200)
+    filename = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=10, choices=Document.FileType.choices)
+    size_bytes = models.PositiveIntegerField()
+    part_size = models.PositiveIntegerField()
+    backend = models.CharField(max_length=10, choices=Backend.choices, default=Backend.LOCAL)
+    storage_key = models.CharField(max_length=512)
+    s3_upload_id = models.CharField(max_length=255, blank=True, default="")
+    # {"<part number>": {"size": int, "sha256": str}} for local parts
+    parts = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    document = models.ForeignKey("documents.Document", null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "expires_at"]),
+        ]
+
+    @property
+    def part_count(self) -> int:
+        return max(1, -(-self.size_bytes // self.part_size))
+
+    def expected_part_size(self, number: int) -> int:
+        if number < self.part_count:
+            return self.part_size
+        return self.size_bytes - self.part_size * (self.part_count - 1)
@@ -0,0 +1,332 @@
+"""
+Per-tenant partitioning of the DocumentChunk table.
+
+Layout (Postgres declarative partitioning on organization_id):
+
+    documents_documentchunk            PARTITION BY LIST (organization_id)
+      docchunk_v<n>_o<org hex>         one per dedicated (big) tenant
+      docchunk_v<n>_shared             DEFAULT, PARTITION BY HASH (organization_id)
+        docchunk_v<n>_h00 .. h<N-1>    CHUNK_PARTITION_BUCKETS buckets
+
+Retrieval filters on organization_id, so the planner prunes to one
+partition: a small tenant's search never reads a big tenant's heap or index
+pages, and each dedicated tenant has its own ANN index graph (ann.py builds
+ANN indexes per partition). Queries keyed only by document still work; they
+probe the (document_id, chunk_index) index of each partition.
+
+The primary key and the generation unique constraint carry organization_id,
+as Postgres requires for partitioned tables; the model state keeps `id` as
+the key (Django never relies on the composite form).
+
+A layout is changed with repartition(), online:
+  1. create the new partitioned table (docchunk_v<n>), its secondary
+     indexes and triggers
+  2. mirror every write on the live table into it with a trigger
+  3. copy existing rows in keyset batches (FOR SHARE, so a concurrent update
+     either finishes first or is mirrored after the copy)
+  4. build the ANN indexes the live table has, partition by partition
+  5. swap the names in one short transaction
+The previous table is kept as docchunk_retired_v<n> until cleanup().
+"""
+from __future__ import annotations
+
+import uuid
+from typing import Callable, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from apps.documents import ann
+
+TABLE = ann.TABLE
+PREFIX = "docchunk"
+# columns the partitioned table is keyed and constrained on
+_PK = "(id, organization_id)"
+_UNIQUE = "(organization_id, document_id, generation, chunk_index)"
+_FK = {
+    "document_id": "documents_document (id)",
+    "organization_id": "organizations_organization (id)",
+}
+
+
+def is_partitioned(table: str = TABLE) -> bool:
+    with connection.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        row = cur.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def tree(table: str = TABLE) -> List[dict]:
+    """[{name, parent, leaf, level}] of the table's partition tree, parents first."""
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT relid::regclass::text, parentrelid::regclass::text, isleaf, level "
+            "FROM pg_partition_tree(%s::regclass) ORDER BY level, relid::regclass::text",
+            [table],
+        )
+        return [{"name": r[0], "parent": r[1], "leaf": r[2], "level": r[3]} for r in cur.fetchall()]
+
+
+def layout() -> List[dict]:
+    """Leaf partitions with their bound, row estimate and total size."""
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT t.relid::regclass::text, pg_get_expr(c.relpartbound, c.oid),
+                   c.reltuples::bigint, pg_total_relation_size(t.relid)
+            FROM pg_partition_tree(%s::regclass) t JOIN pg_class c ON c.oid = t.relid
+            WHERE t.isleaf ORDER BY 4 DESC
+            """,
+            [TABLE],
+        )
+        return [{"name": r[0], "bound": r[1], "rows": max(r[2], 0), "bytes": r[3]} for r in cur.fetchall()]
+
+
+def dedicated_orgs() -> List[str]:
+    """Organizations that currently have their own partition."""
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            """,
+            [TABLE],
+        )
+        bounds = [r[0] for r in cur.fetchall()]
+    # "FOR VALUES IN ('<uuid>')"
+    return [b.split("'")[1] for b in bounds if b.startswith("FOR VALUES IN")]
+
+
+def large_orgs(min_rows: int) -> List[str]:
+    """Organizations with at least `min_rows` chunks (all generations)."""
+    with connection.cursor() as cur:
+        cur.execute(
+            f"SELECT organization_id FROM {TABLE} GROUP BY organization_id HAVING count(*) >= %s",
+            [min_rows],
+        )
+        return [str(r[0]) for r in cur.fetchall()]
+
+
+def _next_version() -> int:
+    """One past any layout version in use, including the live table's partitions."""
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT max((regexp_match(relname, %s))[1]::int) FROM pg_class",
+            [rf"^{PREFIX}_(?:retired_)?v([0-9]+)"],
+        )
+        return (cur.fetchone()[0] or 0) + 1
+
+
+def _columns() -> List[str]:
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 "
+            "AND NOT attisdropped ORDER BY attnum",
+            [TABLE],
+        )
+        return [r[0] for r in cur.fetchall()]
+
+
+def _secondary_indexes() -> List[tuple[str, str]]:
+    """(name, "USING btree|gin (...)") of the live table's non-unique, non-ANN indexes."""
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass AND NOT i.indisunique AND NOT i.indisprimary
+            ORDER BY c.relname
+            """,
+            [TABLE],
+        )
+        rows = cur.fetchall()
+    return [(name, "USING" + d.split(" USING", 1)[1]) for name, d in rows if " USING btree" in d or " USING gin" in d]
+
+
+def create_sql(version: int, buckets: int, dedicated: Iterable[str]) -> List[str]:
+    """DDL for an empty partitioned copy of the chunk table, named docchunk_v<version>."""
+    new = f"{PREFIX}_v{version}"
+    stmts = [
+        f"CREATE TABLE {new} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING STORAGE) "
+        "PARTITION BY LIST (organization_id)",
+        f"ALTER TABLE {new} ADD CONSTRAINT {new}_pkey PRIMARY KEY {_PK}",
+        f"ALTER TABLE {new} ADD CONSTRAINT {new}_gen_uniq UNIQUE {_UNIQUE}",
+    ]
+    for column, target in _FK.items():
+        stmts.append(
+            f"ALTER TABLE {new} ADD CONSTRAINT {new}_{column}_fk FOREIGN KEY ({column}) "
+            f"REFERENCES {target} DEFERRABLE INITIALLY DEFERRED"
+        )
+    for org_id in dedicated:
+        org = uuid.UUID(str(org_id))
+        stmts.append(f"CREATE TABLE {new}_o{org.hex} PARTITION OF {new} FOR VALUES IN ('{org}')")
+    stmts.append(f"CREATE TABLE {new}_shared PARTITION OF {new} DEFAULT PARTITION BY HASH (organization_id)")
+    for i in range(buckets):
+        stmts.append(
+            f"CREATE TABLE {new}_h{i:02d} PARTITION OF {new}_shared "
+            f"FOR VALUES WITH (MODULUS {buckets}, REMAINDER {i})"
+        )
+    for i, (name, spec) in enumerate(_secondary_indexes()):
+        if not _covered(spec):
+            stmts.append(f"CREATE INDEX {new}_idx{i} ON {new} {spec}")
+    # full-text column (0012)
+    stmts.append(
+        f"CREATE TRIGGER docchunk_search_vector BEFORE INSERT OR UPDATE OF content ON {new} "
+        "FOR EACH ROW EXECUTE FUNCTION docchunk_search_vector()"
+    )
+    return stmts
+
+
+def _covered(spec: str) -> bool:
+    # retrieval's (organization_id, document_id, generation) is a prefix of the unique index
+    return "(organization_id, document_id, generation)" in spec
+
+
+def _mirror_sql(version: int) -> str:
+    new = f"{PREFIX}_v{version}"
+    return f"""
+    CREATE OR REPLACE FUNCTION {new}_mirror() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM {new} WHERE id = OLD.id AND organization_id = OLD.organization_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO {new} SELECT NEW.* ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+    CREATE TRIGGER {new}_mirror AFTER INSERT OR UPDATE OR DELETE ON {TABLE}
+        FOR EACH ROW EXECUTE FUNCTION {new}_mirror();
+    """
+
+
+def _copy_rows(version: int, batch: int, log: Callable[[str], None]) -> int:
+    new = f"{PREFIX}_v{version}"
+    cols = ", ".join(_columns())
+    copied, last = 0, None
+    while True:
+        where = "WHERE id > %s " if last is not None else ""
+        params = ([last] if last is not None else []) + [batch]
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(
+                f"""
+                WITH batch AS (
+                    SELECT {cols} FROM {TABLE} {where}ORDER BY id LIMIT %s FOR SHARE
+                ), ins AS (
+                    INSERT INTO {new} ({cols}) SELECT {cols} FROM batch ON CONFLICT DO NOTHING
+                )
+                SELECT count(*), (SELECT id FROM batch ORDER BY id DESC LIMIT 1) FROM batch
+                """,
+                params,
+            )
+            n, last = cur.fetchone()
+        copied += n
+        if n:
+            log(f"copied {copied} rows")
+        if n < batch:
+            return copied
+
+
+def _copy_ann_indexes(version: int, log: Callable[[str], None]) -> List[str]:
+    """Build each ANN index of the live table on the new one; returns their names there."""
+    new = f"{PREFIX}_v{version}"
+    names = []
+    for index in ann.existing_indexes():
+        spec = "USING" + index["definition"].split(" USING", 1)[1]
+        log(f"building {index['name']} on {new}")
+        ann.build_on_partitions(new, f"{index['name']}_v{version}", ann.index_kind(index["name"]), spec)
+        names.append(index["name"])
+    return names
+
+
+def _swap(version: int, ann_names: List[str]) -> None:
+    new, retired = f"{PREFIX}_v{version}", f"{PREFIX}_retired_v{version}"
+    lock_timeout = getattr(settings, "CHUNK_PARTITION_LOCK_TIMEOUT", "5s")
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute("SELECT set_config('lock_timeout', %s, true)", [lock_timeout])
+        cur.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        cur.execute(f"DROP TRIGGER IF EXISTS {new}_mirror ON {TABLE}")
+        cur.execute(f"DROP FUNCTION IF EXISTS {new}_mirror()")
+        # writers set organization_id themselves by now; see 0011
+        cur.execute(f"DROP TRIGGER IF EXISTS docchunk_fill_organization ON {TABLE}")
+        # the retired copy must not hold deletes of documents/orgs back
+        cur.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", [TABLE])
+        for (name,) in cur.fetchall():
+            cur.execute(f"ALTER TABLE {TABLE} DROP CONSTRAINT {name}")
+        # keep the live table's index names (Django migrations refer to them)
+        for i, (name, spec) in enumerate(_secondary_indexes()):
+            if not _covered(spec):
+                cur.execute(f"ALTER INDEX {name} RENAME TO {name}_r{version}")
+                cur.execute(f"ALTER INDEX {new}_idx{i} RENAME TO {name}")
+        for name in ann_names:
+            cur.execute(f"ALTER INDEX {name} RENAME TO {name}_r{version}")
+            cur.execute(f"ALTER INDEX {name}_v{version} RENAME TO {name}")
+        cur.execute(f"ALTER TABLE {TABLE} RENAME TO {retired}")
+        cur.execute(f"ALTER TABLE {new} RENAME TO {TABLE}")
+
+
+def repartition(
+    buckets: int,
+    dedicated: Iterable[str] = (),
+    *,
+    batch: int = 5000,
+    log: Callable[[str], None] = lambda msg: None,
+) -> str:
+    """
+    Move the chunk table to a new partition layout without blocking reads
+    or writes (see the module docstring). Must run outside a transaction.
+    Returns the name the previous table was retired under.
+    """
+    if buckets < 1:
+        raise ValueError("buckets must be >= 1")
+    dedicated = sorted({str(uuid.UUID(str(o))) for o in dedicated})
+    version = _next_version()
+    new = f"{PREFIX}_v{version}"
+    with transaction.atomic(), connection.cursor() as cur:
+        for sql in create_sql(version, buckets, dedicated):
+            cur.execute(sql)
+    log(f"created {new}: {len(dedicated)} dedicated partition(s), {buckets} hash bucket(s)")
+    try:
+        # waits for in-flight writers, so every row is either copied or mirrored
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(_mirror_sql(version))
+        _copy_rows(version, batch, log)
+        ann_names = _copy_ann_indexes(version, log)
+        with connection.cursor() as cur:
+            cur.execute(f"ANALYZE {new}")
+        _swap(version, ann_names)
+    except Exception:
+        _abandon(version)
+        raise
+    log(f"{new} is live as {TABLE}")
+    return f"{PREFIX}_retired_v{version}"
+
+
+def _abandon(version: int) -> None:
+    new = f"{PREFIX}_v{version}"
+    with connection.cursor() as cur:
+        cur.execute(f"DROP TRIGGER IF EXISTS {new}_mirror ON {TABLE}")
+        cur.execute(f"DROP FUNCTION IF EXISTS {new}_mirror()")
+        cur.execute(f"DROP TABLE IF EXISTS {new} CASCADE")
+
+
+def retired_tables() -> List[str]:
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT relname FROM pg_class WHERE relname ~ %s AND relkind IN ('r', 'p') ORDER BY relname",
+            [rf"^{PREFIX}_retired_v[0-9]+$"],
+        )
+        return [r[0] for r in cur.fetchall()]
+
+
+def cleanup(name: Optional[str] = None) -> List[str]:
+    """Drop retired chunk tables (all of them, or just `name`)."""
+    names = [n for n in retired_tables() if name in (None, n)]
+    with connection.cursor() as cur:
+        for n in names:
+            cur.execute(f"DROP TABLE IF EXISTS {n} CASCADE")
+    return names
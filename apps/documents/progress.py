@@ -0,0 +1,277 @@
+"""
+Ingest progress, published so clients need not poll the document endpoints.
+
+Each document being processed has a Redis hash ingest:progress:<doc>:
+
+    status, stage          queued → extracting → persisting → ready | failed
+    started_at             epoch seconds of the current run
+    pages, pages_total     PDF pages extracted (total known for PDFs only)
+    chunks, embedded       chunks produced / chunks whose vector is ready
+
+Counters are HINCRBY'd, so the slices of a fanned-out ingest running on
+different workers add up. Every update is also published on the org's
+channel ingest:progress:org:<org> for the SSE stream; workers batch their
+increments and publish at most every INGEST_PROGRESS_INTERVAL_S.
+Progress is best effort: Redis errors never fail an ingest.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import redis
+from django.conf import settings
+
+from common.utils.sse import sse_event
+
+log = logging.getLogger(__name__)
+
+TERMINAL = ("ready", "failed")
+_COUNTERS = ("pages", "chunks", "embedded")
+_TTL_S = 24 * 3600
+
+_r = None
+
+
+def _client():
+    global _r
+    if _r is None:
+        _r = redis.from_url(getattr(settings, "IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"))
+    return _r
+
+
+def _key(doc_id) -> str:
+    return f"ingest:progress:{doc_id}"
+
+
+def channel(org_id) -> str:
+    return f"ingest:progress:org:{org_id}"
+
+
+def view(doc_id, raw: Dict) -> Dict:
+    """Client-facing progress, with throughput and ETA derived from the counters."""
+    h = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v) for k, v in raw.items()}
+    out = {"id": str(doc_id), "status": h.get("status"), "stage": h.get("stage")}
+    for name in _COUNTERS:
+        out[name] = int(h.get(name) or 0)
+    pages_total = int(h.get("pages_total") or 0) or None
+    out["pages_total"] = pages_total
+    out["chunks_per_s"] = out["eta_s"] = None
+    started = float(h.get("started_at") or 0)
+    if started and out["stage"] not in TERMINAL:
+        elapsed = max(time.time() - started, 1e-3)
+        out["elapsed_s"] = round(elapsed, 1)
+        out["chunks_per_s"] = round(out["embedded"] / elapsed, 2)
+        if pages_total and out["pages"]:
+            out["eta_s"] = round((pages_total - out["pages"]) * elapsed / out["pages"], 1)
+    return out
+
+
+def _publish(r, org_id, payload: Dict) -> None:
+    r.publish(channel(org_id), json.dumps(payload))
+
+
+def set_status(doc_id, org_id, status: str) -> None:
+    """Document.status changed. PROCESSING starts a fresh record (stage "queued")."""
+    try:
+        r = _client()
+        p = r.pipeline()
+        if status in TERMINAL:
+            p.hset(_key(doc_id), mapping={"status": status, "stage": status})
+        else:
+            p.delete(_key(doc_id))
+            p.hset(_key(doc_id), mapping={"status": status, "stage": "queued"})
+        p.expire(_key(doc_id), _TTL_S)
+        p.hgetall(_key(doc_id))
+        raw = p.execute()[-1]
+        _publish(r, org_id, view(doc_id, raw))
+    except redis.RedisError:
+        log.debug("Progress update failed for document %s", doc_id, exc_info=True)
+
+
+def snapshot(doc_ids: List) -> Dict[str, Optional[Dict]]:
+    """Current progress of each document, None where nothing is recorded."""
+    try:
+        p = _client().pipeline()
+        for doc_id in doc_ids:
+            p.hgetall(_key(doc_id))
+        rows = p.execute()
+    except redis.RedisError:
+        rows = [None] * len(doc_ids)
+    return {str(d): (view(d, raw) if raw else None) for d, raw in zip(doc_ids, rows)}
+
+
+class Tracker:
+    """Worker-side progress reporting for one document (or one slice of it)."""
+
+    def __init__(self, doc):
+        self.doc_id = str(doc.id)
+        self.org_id = str(doc.organization_id)
+        self.interval = float(getattr(settings, "INGEST_PROGRESS_INTERVAL_S", 1.0))
+        self.pending: Counter = Counter()
+        self.last = 0.0
+
+    def start(self, pages_total: Optional[int] = None, pages_done: int = 0) -> None:
+        """A processing run begins: reset the counters."""
+        self._write(
+            {"stage": "extracting", "started_at": time.time(), "pages_total": pages_total or 0, "pages": pages_done,
+             "chunks": 0, "embedded": 0},
+        )
+
+    def stage(self, name: str) -> None:
+        self.flush()
+        self._write({"stage": name})
+
+    def add(self, **counts: int) -> None:
+        self.pending.update(counts)
+        if time.monotonic() - self.last >= self.interval:
+            self.flush()
+
+    def pages(self, sections: Iterable[str]) -> Iterator[str]:
+        """Pass PDF sections (one per page) through, counting pages."""
+        for section in sections:
+            yield section
+            self.add(pages=1)
+
+    def flush(self) -> None:
+        self.last = time.monotonic()
+        if not self.pending:
+            return
+        counts, self.pending = self.pending, Counter()
+        try:
+            r = _client()
+            p = r.pipeline()
+            for name, n in counts.items():
+                p.hincrby(_key(self.doc_id), name, n)
+            p.expire(_key(self.doc_id), _TTL_S)
+            p.hgetall(_key(self.doc_id))
+            _publish(r, self.org_id, view(self.doc_id, p.execute()[-1]))
+        except redis.RedisError:
+            log.debug("Progress update failed for document %s", self.doc_id, exc_info=True)
+
+    def _write(self, fields: Dict) -> None:
+        try:
+            r = _client()
+            p = r.pipeline()
+            p.hset(_key(self.doc_id), mapping=fields)
+            p.expire(_key(self.doc_id), _TTL_S)
+            p.hgetall(_key(self.doc_id))
+            _publish(r, self.org_id, view(self.doc_id, p.execute()[-1]))
+        except redis.RedisError:
+            log.debug("Progress update failed for document %s", self.doc_id, exc_info=True)
+
+
+# ---- SSE ----
+
+def _initial(doc_status: Dict[str, str]) -> Dict[str, Dict]:
+    """Current progress per document, falling back to Document.status."""
+    snap = snapshot(list(doc_status))
+    out = {}
+    for doc_id, status in doc_status.items():
+        cur = snap.get(doc_id)
+        if cur is None or (status in TERMINAL and cur["stage"] not in TERMINAL):
+            cur = view(doc_id, {"status": status, "stage": status if status in TERMINAL else "queued"})
+        out[doc_id] = cur
+    return out
+
+
+class _Stream:
+    """Event bookkeeping shared by the sync and async SSE generators."""
+
+    def __init__(self, doc_status: Dict[str, str]):
+        self.pending = set(doc_status)
+        self.max_s = float(getattr(settings, "INGEST_PROGRESS_STREAM_MAX_S", 300))
+        self.keepalive_s = float(getattr(settings, "INGEST_PROGRESS_KEEPALIVE_S", 15))
+
+    def events(self, states: Iterable[Dict]) -> Iterator[str]:
+        for state in states:
+            if state["id"] not in self.pending:
+                continue
+            if state["stage"] in TERMINAL:
+                self.pending.discard(state["id"])
+            yield sse_event(state, event="progress")
+
+    def message(self, msg) -> Iterator[str]:
+        try:
+            state = json.loads(msg["data"])
+        except (TypeError, ValueError, KeyError):
+            return iter(())
+        return self.events([state])
+
+
+def stream(org_id, doc_status: Dict[str, str]) -> Iterator[str]:
+    """
+    SSE frames for the given documents (id -> Document.status): the current
+    state of each, then every update until all are READY/FAILED or
+    INGEST_PROGRESS_STREAM_MAX_S passes. Comment frames keep idle
+    connections open.
+    """
+    s = _Stream(doc_status)
+    pubsub = None
+    try:
+        pubsub = _client().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel(org_id))
+    except redis.RedisError:
+        pubsub = None
+    # snapshot after subscribing, so no update falls in between
+    yield from s.events(_initial(doc_status).values())
+    if pubsub is not None:
+        deadline = time.monotonic() + s.max_s
+        sent = time.monotonic()
+        try:
+            while s.pending and time.monotonic() < deadline:
+                msg = pubsub.get_message(timeout=1.0)
+                frames = list(s.message(msg)) if msg else []
+                if frames:
+                    yield from frames
+                    sent = time.monotonic()
+                elif time.monotonic() - sent >= s.keepalive_s:
+                    yield ": keepalive\n\n"
+                    sent = time.monotonic()
+        except redis.RedisError:
+            log.warning("Progress stream for org %s lost Redis", org_id)
+        finally:
+            pubsub.close()
+    yield "data: [DONE]\n\n"
+
+
+async def astream(org_id, doc_status: Dict[str, str]):
+    """Async twin of stream() for ASGI, on redis.asyncio."""
+    import asyncio
+
+    import redis.asyncio as aredis
+
+    s = _Stream(doc_status)
+    client = aredis.from_url(getattr(settings, "IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"))
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    try:
+        try:
+            await pubsub.subscribe(channel(org_id))
+            subscribed = True
+        except redis.RedisError:
+            subscribed = False
+        for frame in s.events((await asyncio.to_thread(_initial, doc_status)).values()):
+            yield frame
+        if subscribed:
+            deadline = time.monotonic() + s.max_s
+            sent = time.monotonic()
+            try:
+                while s.pending and time.monotonic() < deadline:
+                    msg = await pubsub.get_message(timeout=1.0)
+                    frames = list(s.message(msg)) if msg else []
+                    for frame in frames:
+                        yield frame
+                    if frames:
+                        sent = time.monotonic()
+                    elif time.monotonic() - sent >= s.keepalive_s:
+                        yield ": keepalive\n\n"
+                        sent = time.monotonic()
+            except redis.RedisError:
+                log.warning("Progress stream for org %s lost Redis", org_id)
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
+    yield "data: [DONE]\n\n"
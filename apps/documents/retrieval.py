@@ -0,0 +1,196 @@
+"""
+Chunk retrieval. Three modes (MODES), picked per request, else per chatbot,
+else RETRIEVAL_MODE:
+
+  vector   kNN over the embeddings (search_chunks)
+  lexical  Postgres full-text search over DocumentChunk.search (GIN index);
+           needs no query embedding
+  hybrid   both, merged with reciprocal rank fusion. Short keyword queries
+           (SKUs, error codes, policy numbers) take the lexical result alone
+           when it has hits, skipping the embedding call.
+"""
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef
+from pgvector.django import CosineDistance, MaxInnerProduct
+
+from apps.documents import ann
+from apps.documents.models import Document, DocumentChunk
+from common.llm.embeddings import unit_vector
+
+MODES = ("vector", "lexical", "hybrid")
+# text search configuration of DocumentChunk.search (set by the 0012 trigger)
+TEXT_SEARCH_CONFIG = "english"
+
+# a term that looks like an identifier: has a digit, or is an all-caps code
+_IDENT = re.compile(r"(?=[^\s]*\d)[\w./#:-]{2,}|[A-Z][A-Z0-9_-]{2,}")
+
+
+def _live_chunks(org_id, filters: Dict | None):
+    # Live generation as a semi-join against the org's documents rather than
+    # a join per chunk row: the chunk side keeps its organization_id filter
+    # (partition pruning, ANN index order) and the flip stays one UPDATE.
+    docs = Document.objects.filter(
+        organization_id=org_id, pk=OuterRef("document_id"), live_generation=OuterRef("generation")
+    )
+    qs = DocumentChunk.objects.filter(organization_id=org_id)
+    if filters:
+        if ids := filters.get("document_ids"):
+            qs = qs.filter(document_id__in=ids)
+        if fts := filters.get("file_types"):
+            docs = docs.filter(file_type__in=fts)
+    return qs.filter(Exists(docs))
+
+
+def search_chunks(
+    org_id,
+    qvec: List[float],
+    top_k: int,
+    filters: Dict | None = None,
+    *,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    coarse_dims: int = 0,
+    coarse_factor: int = 8,
+) -> List[Dict]:
+    """
+    Org-scoped kNN over DocumentChunk.embedding (live generation only).
+    Returns [{document_id, chunk_index, content, score}] ordered by score desc.
+
+    Filters on the chunk's own organization_id, which prunes a partitioned
+    chunk table to the org's partition (apps.documents.partitions).
+
+    Orders by the raw `<=>` distance (not `1 - distance`) so the planner can
+    use the HNSW/IVFFlat index; ANN knobs are applied with SET LOCAL.
+
+    With a compact EMBEDDING_STORAGE (see apps.documents.ann) the index
+    yields top_k * EMBEDDING_RERANK_FACTOR candidates by halfvec inner
+    product or binary Hamming distance, reranked by full-precision inner
+    product (= cosine, vectors are unit length).
+
+    coarse_dims > 0 (ann.coarse_params(org)) takes precedence: top_k *
+    coarse_factor candidates from the truncated Matryoshka index, rescored
+    on the full vector the same way.
+    """
+    storage = ann.default_storage()
+    qs = _live_chunks(org_id, filters)
+
+    exact = storage == "full" and not coarse_dims
+    if exact:
+        qs = qs.annotate(distance=CosineDistance("embedding", qvec)).order_by("distance")
+    if coarse_dims or storage != "full":
+        qvec = unit_vector(qvec)
+        n_candidates = top_k * (coarse_factor if coarse_dims else ann.rerank_factor(storage))
+        candidates = (
+            qs.annotate(coarse=ann.coarse_distance(storage, qvec, coarse_dims))
+            .order_by("coarse")
+            .values("id")[:n_candidates]
+        )
+        qs = (
+            DocumentChunk.objects.filter(organization_id=org_id, id__in=candidates)
+            .annotate(distance=MaxInnerProduct("embedding", qvec))
+            .order_by("distance")
+        )
+        # HNSW returns at most ef_search rows
+        ef_search = max(int(ef_search or getattr(settings, "ANN_HNSW_EF_SEARCH", 40)), n_candidates)
+
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            ann.apply_search_params(cur, ef_search=ef_search, probes=probes)
+        rows = list(qs.values("document_id", "chunk_index", "content", "distance")[:top_k])
+
+    for r in rows:
+        d = float(r.pop("distance"))
+        # `<#>` is the negative inner product
+        r["score"] = 1.0 - d if exact else -d
+    return rows
+
+
+def lexical_chunks(org_id, query: str, top_k: int, filters: Dict | None = None) -> List[Dict]:
+    """
+    Org-scoped full-text search (live generation only), same row shape as
+    search_chunks(); score is ts_rank_cd. The query uses web search syntax
+    ("quoted phrases", -excluded, or).
+    """
+    q = SearchQuery(query, config=TEXT_SEARCH_CONFIG, search_type="websearch")
+    qs = (
+        _live_chunks(org_id, filters)
+        .filter(search=q)
+        .annotate(score=SearchRank(F("search"), q, cover_density=True))
+        .order_by("-score")
+    )
+    rows = list(qs.values("document_id", "chunk_index", "content", "score")[:top_k])
+    for r in rows:
+        r["score"] = float(r["score"])
+    return rows
+
+
+def fuse(result_lists: List[List[Dict]], top_k: int) -> List[Dict]:
+    """Reciprocal rank fusion: score = sum of 1 / (RETRIEVAL_RRF_K + rank) over the lists."""
+    k = int(getattr(settings, "RETRIEVAL_RRF_K", 60))
+    scores: Dict[Tuple, float] = {}
+    rows: Dict[Tuple, Dict] = {}
+    for results in result_lists:
+        for rank, r in enumerate(results, 1):
+            key = (str(r["document_id"]), r["chunk_index"])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            rows.setdefault(key, r)
+    best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [{**rows[key], "score": scores[key]} for key in best]
+
+
+def resolve_mode(requested: str | None = None, bot=None) -> str:
+    mode = requested or getattr(bot, "retrieval_mode", "") or getattr(settings, "RETRIEVAL_MODE", "vector")
+    return mode if mode in MODES else "vector"
+
+
+def is_keyword_query(query: str) -> bool:
+    """A few terms, at least one of them identifier-like, and not a question."""
+    terms = query.split()
+    if not terms or len(terms) > int(getattr(settings, "RETRIEVAL_KEYWORD_MAX_TERMS", 4)):
+        return False
+    if query.rstrip().endswith("?"):
+        return False
+    return any(_IDENT.fullmatch(t) for t in terms)
+
+
+def needs_embedding(mode: str, query: str) -> bool:
+    """Whether retrieve() will (normally) call `embed`; start it early if so."""
+    return mode == "vector" or (mode == "hybrid" and not is_keyword_query(query))
+
+
+def retrieve(
+    org_id,
+    query: str,
+    top_k: int,
+    filters: Dict | None = None,
+    *,
+    mode: str,
+    embed: Callable[[], List[float]],
+    **vector_kwargs,
+) -> Tuple[List[Dict], str]:
+    """
+    Chunks for `query` in `mode`; returns (rows, mode actually used).
+
+    `embed` returns the query vector and is only called when the vector
+    side runs, after the lexical query. Callers start the embedding in the
+    background when needs_embedding() so the two overlap. vector_kwargs go
+    to search_chunks().
+    """
+    if mode == "lexical":
+        return lexical_chunks(org_id, query, top_k, filters), "lexical"
+    if mode == "hybrid":
+        if is_keyword_query(query):
+            rows = lexical_chunks(org_id, query, top_k, filters)
+            if rows:
+                return rows, "lexical"
+            return search_chunks(org_id, embed(), top_k, filters, **vector_kwargs), "vector"
+        depth = top_k * int(getattr(settings, "RETRIEVAL_HYBRID_DEPTH", 3))
+        lexical = lexical_chunks(org_id, query, depth, filters)
+        vector = search_chunks(org_id, embed(), depth, filters, **vector_kwargs)
+        return fuse([lexical, vector], top_k), "hybrid"
+    return search_chunks(org_id, embed(), top_k, filters, **vector_kwargs), "vector"
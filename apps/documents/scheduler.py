@@ -0,0 +1,234 @@
+"""
+Fair-share dispatch of process_document across organizations.
+
+enqueue_processing() does not hand documents straight to Celery, where one
+org's 10,000-document upload would sit in front of everyone else. Jobs wait
+in per-org Redis lists and dispatch() releases them to the broker:
+
+  - at most INGEST_MAX_INFLIGHT documents run at once overall and at most
+    INGEST_ORG_MAX_INFLIGHT per org, so a big backlog stays in its own list;
+  - orgs are visited least-recently-served first and each may start up to
+    its weight (INGEST_ORG_WEIGHTS, default 1) per round: weighted
+    round-robin, so a small tenant waits at most about one round;
+  - an org's interactive jobs go before its bulk (re-index) jobs.
+
+dispatch() runs after every submit and every finished document, and from
+beat in case a worker died without reporting back. Running entries expire
+after INGEST_RUNNING_TTL_S for the same reason (at least the broker's
+visibility timeout, so a job that may still be redelivered keeps its slot).
+A job is popped and marked running in one script, and put back at the head
+of its queue if handing it to the broker fails.
+
+Keys:
+  ingest:q:<org>:interactive|bulk   JSON jobs, FIFO
+  ingest:orgs                       zset org -> last served (epoch s)
+  ingest:running                    zset "<org>:<doc>" -> deadline
+  ingest:running:<org>              zset doc -> deadline
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+import redis
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+ORGS_KEY = "ingest:orgs"
+RUNNING_KEY = "ingest:running"
+LOCK_KEY = "ingest:dispatch:lock"
+AGAIN_KEY = "ingest:dispatch:again"
+
+# Pop an org's next job (interactive first) and mark it running in one step,
+# so a crash in between cannot lose it. With nothing queued the org is
+# forgotten instead (atomic w.r.t. submit's MULTI).
+# KEYS: interactive queue, bulk queue, RUNNING_KEY, org running set, ORGS_KEY
+# ARGV: org, deadline
+_CLAIM_LUA = """
+local raw = redis.call('LPOP', KEYS[1]) or redis.call('LPOP', KEYS[2])
+if not raw then
+  redis.call('ZREM', KEYS[5], ARGV[1])
+  return false
+end
+local doc = cjson.decode(raw)['doc']
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[1] .. ':' .. doc)
+redis.call('ZADD', KEYS[4], ARGV[2], doc)
+return raw
+"""
+
+_r = None
+
+
+def _client():
+    global _r
+    if _r is None:
+        _r = redis.from_url(getattr(settings, "IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"))
+    return _r
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "INGEST_FAIR_SHARE", True))
+
+
+def _queue_key(org: str, bulk: bool) -> str:
+    return f"ingest:q:{org}:{'bulk' if bulk else 'interactive'}"
+
+
+def _running_key(org: str) -> str:
+    return f"ingest:running:{org}"
+
+
+def _weight(org: str) -> int:
+    return max(1, int(settings.INGEST_ORG_WEIGHTS.get(org, 1)))
+
+
+def _start(job: Dict) -> None:
+    from apps.documents.tasks import process_document, ingest_priority
+
+    process_document.apply_async(
+        (job["doc"],),
+        {"mode": job["mode"], "bulk": job["bulk"]},
+        queue=settings.CELERY_QUEUE_INGEST_BULK if job["bulk"] else settings.CELERY_QUEUE_INGEST,
+        priority=ingest_priority(job["size"]),
+    )
+
+
+def submit(org_id, doc_id, mode: str, bulk: bool, size: int) -> None:
+    """Queue a document for processing in its org's virtual queue."""
+    org = str(org_id)
+    job = {"doc": str(doc_id), "mode": mode, "bulk": bulk, "size": size}
+    try:
+        p = _client().pipeline()
+        p.rpush(_queue_key(org, bulk), json.dumps(job))
+        p.zadd(ORGS_KEY, {org: 0}, nx=True)
+        p.execute()
+    except redis.RedisError:
+        log.warning("Ingest scheduler unavailable; dispatching document %s directly", doc_id)
+        _start(job)
+        return
+    dispatch()
+
+
+def release(org_id, doc_id) -> None:
+    """A document finished (or failed for good): free its slot and start the next job."""
+    org = str(org_id)
+    try:
+        p = _client().pipeline()
+        p.zrem(RUNNING_KEY, f"{org}:{doc_id}")
+        p.zrem(_running_key(org), str(doc_id))
+        p.execute()
+    except redis.RedisError:
+        return
+    dispatch()
+
+
+def dispatch() -> int:
+    """Start as many queued jobs as the caps allow. Returns how many were started."""
+    r = _client()
+    started = 0
+    try:
+        while True:
+            lock = r.lock(LOCK_KEY, timeout=30)
+            if not lock.acquire(blocking=False):
+                r.set(AGAIN_KEY, 1, ex=30)  # the holder runs another pass
+                return started
+            try:
+                r.delete(AGAIN_KEY)
+                started += _fill(r)
+            finally:
+                try:
+                    lock.release()
+                except redis.exceptions.LockError:
+                    pass
+            if not r.exists(AGAIN_KEY):
+                return started
+    except redis.RedisError:
+        log.warning("Ingest dispatch failed", exc_info=True)
+        return started
+
+
+def _unclaim(r, org: str, raw: bytes, job: Dict) -> None:
+    """Undo a claim whose job never reached the broker: requeue it at the head."""
+    p = r.pipeline()
+    p.lpush(_queue_key(org, job["bulk"]), raw)
+    p.zadd(ORGS_KEY, {org: 0}, nx=True)
+    p.zrem(RUNNING_KEY, f"{org}:{job['doc']}")
+    p.zrem(_running_key(org), job["doc"])
+    p.execute()
+
+
+def _reap(r, now: float) -> None:
+    expired = r.zrangebyscore(RUNNING_KEY, "-inf", now)
+    for member in expired:
+        org, _, doc = member.decode().partition(":")
+        log.warning("Ingest slot of document %s (org %s) expired without release", doc, org)
+        p = r.pipeline()
+        p.zrem(RUNNING_KEY, member)
+        p.zrem(_running_key(org), doc)
+        p.execute()
+
+
+def _fill(r) -> int:
+    now = time.time()
+    _reap(r, now)
+    free = int(settings.INGEST_MAX_INFLIGHT) - r.zcard(RUNNING_KEY)
+    per_org = int(settings.INGEST_ORG_MAX_INFLIGHT)
+    ttl = max(int(settings.INGEST_RUNNING_TTL_S), int(getattr(settings, "CELERY_VISIBILITY_TIMEOUT_S", 0)))
+    deadline = now + ttl
+    claim = r.register_script(_CLAIM_LUA)
+    started = 0
+    orgs = [o.decode() for o in r.zrange(ORGS_KEY, 0, -1)]  # least recently served first
+    while free > 0 and orgs:
+        next_round = []
+        for org in orgs:
+            budget = _weight(org)
+            running = r.zcard(_running_key(org))
+            took = 0
+            while took < budget and free > 0 and running + took < per_org:
+                raw = claim(
+                    keys=[_queue_key(org, False), _queue_key(org, True), RUNNING_KEY, _running_key(org), ORGS_KEY],
+                    args=[org, deadline],
+                )
+                if raw is None:
+                    break
+                job = json.loads(raw)
+                try:
+                    _start(job)
+                except Exception:
+                    _unclaim(r, org, raw, job)
+                    raise
+                took += 1
+                free -= 1
+            if took:
+                r.zadd(ORGS_KEY, {org: time.time()}, xx=True)
+                started += took
+            if took == budget:
+                next_round.append(org)
+        orgs = next_round
+    return started
+
+
+def backlog(org_id=None) -> Optional[Dict]:
+    """Queued and running documents per org (or for one org)."""
+    try:
+        r = _client()
+        orgs = [str(org_id)] if org_id else [o.decode() for o in r.zrange(ORGS_KEY, 0, -1)]
+        p = r.pipeline()
+        for org in orgs:
+            p.llen(_queue_key(org, False))
+            p.llen(_queue_key(org, True))
+            p.zcard(_running_key(org))
+        p.zcard(RUNNING_KEY)
+        counts = p.execute()
+    except redis.RedisError:
+        return None
+    per_org = {
+        org: {"interactive": counts[3 * i], "bulk": counts[3 * i + 1], "running": counts[3 * i + 2]}
+        for i, org in enumerate(orgs)
+    }
+    if org_id:
+        return per_org[str(org_id)]
+    return {"running": counts[-1], "max_inflight": int(settings.INGEST_MAX_INFLIGHT), "orgs": per_org}
@@ -1,14 +1,14 @@
 from rest_framework import serializers
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from common.validators.files import ALLOWED_EXTS
 from .models import Document
+from . import uploads
 
 class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
         fields = "__all__"
-        read_only_fields = ["id", "organization", "upload_date", "status", "url"]
+        read_only_fields = ["id", "organization", "upload_date", "status", "url", "storage_key", "content_hash",
+                            "deduplicated_from", "live_generation"]
 
 class DocumentUploadSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=200)
@@ -23,10 +23,22 @@ class DocumentUploadSerializer(serializers.Serializer):
         request = self.context["request"]
         org = getattr(request, "organization", None) or request.user.organization
         f = validated["file"]
-        path = default_storage.save(f"docs/{org.id}/{f.name}", ContentFile(f.read()))
-        url = default_storage.url(path)
-        doc = Document.objects.create(organization=org, name=validated["name"],
-                                      file_type=validated["ext"], size_bytes=f.size, url=url)
-        from .tasks import process_document
-        process_document.delay(str(doc.id))
-        return doc
+        # streamed part by part (never f.read()), hashed on the way through
+        try:
+            path, sha, size = uploads.store(f"docs/{org.id}/{f.name}", f.chunks(), limit=uploads.max_upload_bytes())
+        except uploads.UploadError as e:
+            raise serializers.ValidationError(str(e))
+        return uploads.create_document(org, validated["name"], validated["ext"], size, path, sha)
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    filename = serializers.CharField(max_length=255)
+    size_bytes = serializers.IntegerField(min_value=1)
+    # presigned direct-to-S3 parts (requires UPLOAD_DIRECT_S3 and S3 storage)
+    direct = serializers.BooleanField(required=False, default=False)
+    def validate(self, attrs):
+        ext = (attrs["filename"].split(".")[-1] or "").lower()
+        if ext not in ALLOWED_EXTS:
+            raise serializers.ValidationError("Unsupported file type")
+        attrs["ext"] = ext
+        return attrs
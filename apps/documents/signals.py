@@ -0,0 +1,25 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.chat.semantic_cache import bump_corpus_version
+from apps.documents import progress
+from apps.documents.models import Document
+
+
+@receiver(post_save, sender=Document)
+def _document_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    # chunks are swapped in before status flips to READY, so that is the
+    # point cached answers stop reflecting the corpus
+    if instance.status == Document.Status.READY and (update_fields is None or "status" in update_fields):
+        bump_corpus_version(instance.organization_id)
+    if created or (update_fields and "status" in update_fields):
+        # after commit, like the corpus bump: a client told READY must find the new chunks
+        transaction.on_commit(partial(progress.set_status, instance.id, instance.organization_id, instance.status))
+
+
+@receiver(post_delete, sender=Document)
+def _document_deleted(sender, instance, **kwargs):
+    bump_corpus_version(instance.organization_id)
@@ -1,43 +1,99 @@
 from __future__ import annotations
+import hashlib
 import logging
-from typing import List
-import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from celery import shared_task
+from celery import chord, shared_task
 from django.core.files.storage import default_storage
 from django.conf import settings
-import httpx
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
 
-from apps.documents.models import Document, DocumentChunk
-from common.llm.embeddings import get_embedding
-from common.utils.extract import extract_text_from_bytes, sniff_mime
+from apps.documents import chunk_store, dedupe, progress, scheduler
+from apps.documents.chunking import get_chunker
+from apps.documents.models import Document, DocumentChunk, IngestSlice
+from common.llm.embeddings import get_embeddings
+from common.utils import transport
+from common.utils.extract import iter_text_sections, pdf_page_count, sniff_mime_file
 
 log = logging.getLogger(__name__)
 
+_COPY_BUFSIZE = 1024 * 1024
+
+
+def _storage_key(document: Document) -> str:
+    if document.storage_key:
+        return document.storage_key
+    # Legacy rows: derive the key from a local MEDIA_URL url
+    media_url = getattr(settings, "MEDIA_URL", "")
+    if media_url and document.url.startswith(media_url):
+        return document.url[len(media_url) :].lstrip("/")
+    return ""
+
+
+def _copy_capped(chunks: Iterable[bytes], out, limit: int) -> None:
+    written = 0
+    for block in chunks:
+        written += len(block)
+        if written > limit:
+            raise ValueError(f"File size exceeds {settings.MAX_UPLOAD_MB}MB limit.")
+        out.write(block)
 
-def _read_bytes(document: Document) -> bytes:
+
+@contextmanager
+def _open_source(document: Document) -> Iterator[str]:
     """
-    Try to load from storage path inferred from URL (if local),
-    else fallback to HTTP GET on the URL.
+    Yield a local filesystem path for the document's file.
+    Files in local storage are used in place. Remote storage (S3) is streamed
+    to a temp file, as is the HTTP fallback for rows without a storage key;
+    both are capped at MAX_UPLOAD_MB and never held in memory.
     """
-    url = document.url
-    # Try to derive relative path for default_storage
-    media_url = getattr(settings, "MEDIA_URL", "")
-    rel = None
-    if media_url and url.startswith(media_url):
-        rel = url[len(media_url) :].lstrip("/")
+    key = _storage_key(document)
+    local = None
+    if key:
+        try:
+            local = default_storage.path(key)
+        except NotImplementedError:  # remote backend: no local path
+            pass
+    if local and os.path.exists(local):
+        yield local
+        return
+
+    limit = int(settings.MAX_UPLOAD_MB) * 1024 * 1024
+    fd, tmp = tempfile.mkstemp(prefix="doc-", suffix=".src")
     try:
-        if rel and default_storage.exists(rel):
-            with default_storage.open(rel, "rb") as f:
-                return f.read()
-    except Exception:
-        pass
+        with os.fdopen(fd, "wb") as out:
+            if key and not local:
+                with default_storage.open(key, "rb") as f:
+                    _copy_capped(iter(lambda: f.read(_COPY_BUFSIZE), b""), out, limit)
+            else:
+                # Fallback: HTTP GET, streamed over the shared keep-alive pool
+                url = document.url
+                if not url.startswith(("http://", "https://")):
+                    raise FileNotFoundError(f"No stored file for document {document.id}")
+                with transport.get_client(url).stream("GET", url, timeout=60.0) as r:
+                    r.raise_for_status()
+                    declared = int(r.headers.get("content-length") or 0)
+                    if declared > limit:
+                        raise ValueError(f"File size exceeds {settings.MAX_UPLOAD_MB}MB limit.")
+                    _copy_capped(r.iter_bytes(_COPY_BUFSIZE), out, limit)
+        yield tmp
+    finally:
+        os.unlink(tmp)
 
-    # Fallback: HTTP GET
-    with httpx.Client(timeout=60.0) as client:
-        r = client.get(url)
-        r.raise_for_status()
-        return r.content
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_COPY_BUFSIZE), b""):
+            h.update(block)
+    return h.hexdigest()
 
 
 def _map_file_type_to_mime(file_type: str) -> str:
@@ -55,83 +111,495 @@ def _map_file_type_to_mime(file_type: str) -> str:
     return "application/octet-stream"  # Fallback for unknown types
 
 
-def _chunk_text(text: str) -> List[str]:
-    size = int(getattr(settings, "CHUNK_SIZE_CHARS", 1500))
-    overlap = int(getattr(settings, "CHUNK_OVERLAP_CHARS", 200))
-    if size <= 0:
-        return [text]
-    chunks: List[str] = []
-    i = 0
-    n = len(text)
-    while i < n:
-        end = min(i + size, n)
-        chunk = text[i:end]
-        chunks.append(chunk)
-        if end == n:
-            break
-        i = max(end - overlap, i + 1)
-    return chunks
+def _embed_chunks(chunks: List[str]) -> List[List[float]]:
+    return get_embeddings(chunks, background=True)
 
 
-def _embed_chunks(chunks: List[str]) -> List[List[float]]:
-    vecs: List[List[float]] = []
-    for ch in chunks:
-        vecs.append(get_embedding(ch))
-    return vecs
+def chunk_hash(text: str) -> str:
+    """Identity of a chunk's embedding: same model + same text => same vector."""
+    model = getattr(settings, "EMBEDDING_MODEL", "")
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
 
 
-@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3)
-def process_document(self, doc_id: str):
+def _chunk_and_embed(
+    chunks: Iterable[str], known: Set[str] = frozenset(), tracker: Optional[progress.Tracker] = None
+) -> Tuple[List[str], List[str], List[Optional[List[float]]]]:
     """
-    Extract → chunk → embed → persist DocumentChunk rows.
-    Sets Document.status to READY or FAILED.
+    Embed chunks in batches on a background thread while the caller's
+    iterator keeps extracting/chunking. At most INGEST_EMBED_MAX_INFLIGHT
+    batches wait on the provider at once.
+
+    Chunks whose hash is in `known` are not embedded; their vector is None
+    (the existing row is reused). Returns (chunks, hashes, vectors).
     """
-    doc = Document.objects.get(id=doc_id)
-    try:
-        raw = _read_bytes(doc)
-
-        # Sanity check MIME type, but Document.file_type is source of truth
-        sniffed_mime, _ = sniff_mime(raw)
-        log.debug(
-            "Document %s: Sniffed MIME: %s, Declared file_type: %s",
-            doc.id,
-            sniffed_mime,
-            doc.file_type,
-        )
+    batch_size = max(1, int(getattr(settings, "INGEST_EMBED_BATCH_CHUNKS", 128)))
+    max_inflight = max(1, int(getattr(settings, "INGEST_EMBED_MAX_INFLIGHT", 2)))
+    out_chunks: List[str] = []
+    out_hashes: List[str] = []
+    out_vecs: List[Optional[List[float]]] = []
+    futures = []  # (positions in out_vecs, future)
+
+    def drain(n: int) -> None:
+        while len(futures) > n:
+            positions, fut = futures.pop(0)
+            for pos, vec in zip(positions, fut.result()):
+                out_vecs[pos] = vec
+            if tracker:
+                tracker.add(embedded=len(positions))
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-embed") as pool:
+        batch: List[str] = []
+        positions: List[int] = []
+        for chunk in chunks:
+            h = chunk_hash(chunk)
+            out_chunks.append(chunk)
+            out_hashes.append(h)
+            out_vecs.append(None)
+            if tracker:
+                tracker.add(chunks=1, embedded=int(h in known))
+            if h in known:
+                continue
+            batch.append(chunk)
+            positions.append(len(out_vecs) - 1)
+            if len(batch) < batch_size:
+                continue
+            futures.append((positions, pool.submit(_embed_chunks, batch)))
+            batch, positions = [], []
+            drain(max_inflight)
+        if batch:
+            futures.append((positions, pool.submit(_embed_chunks, batch)))
+        drain(0)
+    return out_chunks, out_hashes, out_vecs
+
+
+def _persist_chunks(
+    doc: Document,
+    chunks: List[str],
+    hashes: List[str],
+    vecs: List[Optional[List[float]]],
+    reuse: bool = True,
+) -> Dict[str, int]:
+    """
+    Write `chunks` as a new generation and flip it live (see chunk_store).
+    With `reuse`, chunks whose hash matches a live row are cloned from it
+    server-side instead of using a freshly computed embedding.
+    """
+    live = chunk_store.live_generation(doc.id)
+    existing: Dict[str, List] = {}
+    live_count = 0
+    for row_id, h in DocumentChunk.objects.filter(document=doc, generation=live).values_list("id", "content_hash"):
+        live_count += 1
+        if reuse and h:
+            existing.setdefault(h, []).append(row_id)
 
-        # Use the document's declared file_type for extraction
-        mime_type_for_extraction = _map_file_type_to_mime(doc.file_type)
+    moves = []  # (live row id, new chunk_index)
+    new = []  # (chunk_index, content, content_hash, embedding)
+    for idx, (content, h, emb) in enumerate(zip(chunks, hashes, vecs)):
+        ids = existing.get(h) if h else None
+        if ids:
+            moves.append((ids.pop(0), idx))
+            continue
+        # Cap content length as per prompt
+        new.append([idx, content[:5000], h, emb])
+    # hash was known, but more copies of the chunk than live rows to reuse
+    missing = [row for row in new if row[3] is None]
+    if missing:
+        vectors = _embed_chunks([chunks[row[0]] for row in missing])
+        for row, vec in zip(missing, vectors):
+            row[3] = vec
 
-        text = extract_text_from_bytes(
-            mime_type_for_extraction,
-            raw,
-            {
-                "MAX_UPLOAD_MB": settings.MAX_UPLOAD_MB,
-                "MAX_PDF_PAGES": settings.MAX_PDF_PAGES,
-            },
+    generation = chunk_store.next_generation(doc.id)
+    reused = chunk_store.clone_chunks(doc.id, generation, moves)
+    added = chunk_store.copy_chunks(doc.id, doc.organization_id, generation, new)
+    chunk_store.flip_generation(doc.id, generation)
+    return {"reused": reused, "added": added, "removed": live_count - reused, "generation": generation}
+
+
+def _extract_caps() -> Dict:
+    return {
+        "MAX_UPLOAD_MB": settings.MAX_UPLOAD_MB,
+        "MAX_PDF_PAGES": settings.MAX_PDF_PAGES,
+        "PDF_WORKERS": getattr(settings, "EXTRACT_PDF_WORKERS", 0),
+        "PDF_PAGES_PER_TASK": getattr(settings, "EXTRACT_PDF_PAGES_PER_TASK", 8),
+    }
+
+
+def _known_hashes(doc: Document, mode: str) -> Set[str]:
+    if mode != "incremental":
+        return set()
+    return set(
+        DocumentChunk.objects.filter(document=doc, generation=doc.live_generation)
+        .exclude(content_hash="")
+        .values_list("content_hash", flat=True)
+    )
+
+
+def _pdf_pages(doc: Document, path: str) -> int:
+    """Page count of a PDF document (within MAX_PDF_PAGES), 0 for other types."""
+    if doc.file_type != Document.FileType.PDF:
+        return 0
+    n_pages = pdf_page_count(path)
+    if n_pages > settings.MAX_PDF_PAGES:
+        raise ValueError(f"PDF exceeds {settings.MAX_PDF_PAGES} page limit.")
+    return n_pages
+
+
+def _fans_out(n_pages: int) -> bool:
+    min_pages = int(getattr(settings, "INGEST_FANOUT_MIN_PAGES", 64))
+    return min_pages > 0 and n_pages >= min_pages
+
+
+def _unfinished_run(doc: Document, mode: str) -> Optional[int]:
+    """Shadow generation of an earlier fanned-out run of `mode` that never flipped."""
+    return (
+        IngestSlice.objects.filter(document=doc, mode=mode, generation__gt=doc.live_generation)
+        .order_by("-generation")
+        .values_list("generation", flat=True)
+        .first()
+    )
+
+
+def _plan_slices(doc: Document, mode: str, n_pages: int) -> int:
+    per_slice = max(1, int(getattr(settings, "INGEST_SLICE_PAGES", 32)))
+    generation = chunk_store.next_generation(doc.id)
+    IngestSlice.objects.bulk_create(
+        IngestSlice(
+            document=doc, generation=generation, mode=mode, index=i,
+            page_start=start, page_stop=min(start + per_slice, n_pages),
         )
+        for i, start in enumerate(range(0, n_pages, per_slice))
+    )
+    return generation
 
-        chunks = _chunk_text(text)
-        embeddings = _embed_chunks(chunks)
 
-        # wipe existing chunks for idempotency
-        DocumentChunk.objects.filter(document=doc).delete()
+def _dispatch_slices(doc: Document, generation: int, bulk: bool = False, resume: bool = False) -> int:
+    """
+    Queue every slice not yet DONE in a chord that ends in finalize_document.
+    Slices run in the parent's lane and priority, so an interactive upload
+    never waits behind a bulk re-index.
+
+    On resume, a PENDING slice touched within INGEST_SLICE_LEASE_S means the
+    earlier chord is still live (e.g. this job was redelivered): it is left
+    to run and finalize, and nothing is queued.
+    """
+    slices = IngestSlice.objects.filter(document=doc, generation=generation).exclude(status=IngestSlice.Status.DONE)
+    if resume and slices.filter(
+        status=IngestSlice.Status.PENDING,
+        updated_at__gte=timezone.now() - timedelta(seconds=settings.INGEST_SLICE_LEASE_S),
+    ).exists():
+        return 0
+    todo = list(slices.values_list("id", flat=True))
+    done = finalize_document.s(str(doc.id), generation).on_error(fail_document.si(str(doc.id)))
+    if not todo:  # all checkpointed; only the finalize step is left
+        done.delay([])
+        return 0
+    lane = settings.CELERY_QUEUE_INGEST_BULK if bulk else settings.CELERY_QUEUE_INGEST
+    priority = ingest_priority(doc.size_bytes)
+    chord(process_document_slice.s(str(sid)).set(queue=lane, priority=priority) for sid in todo)(done)
+    return len(todo)
+
+
+def ingest_priority(size_bytes: int) -> int:
+    """Broker priority (0 = first): up to 1MB 0, then one step per doubling, capped at 9."""
+    return min(9, (max(size_bytes, 0) >> 20).bit_length())
+
 
-        objs = []
-        for idx, (content, emb) in enumerate(zip(chunks, embeddings)):
-            # Cap content length as per prompt
-            objs.append(
-                DocumentChunk(
-                    document=doc, chunk_index=idx, content=content[:5000], embedding=emb
-                )
+def enqueue_processing(doc: Document, mode: str = "incremental", bulk: bool = False) -> None:
+    """
+    Queue process_document in the interactive lane, or the bulk lane for
+    re-index jobs, so a bulk run never delays fresh uploads. With
+    INGEST_FAIR_SHARE the job goes through the per-org scheduler first.
+    """
+    if scheduler.enabled():
+        scheduler.submit(doc.organization_id, doc.id, mode, bulk, doc.size_bytes)
+        return
+    process_document.apply_async(
+        (str(doc.id),),
+        {"mode": mode, "bulk": bulk},
+        queue=settings.CELERY_QUEUE_INGEST_BULK if bulk else settings.CELERY_QUEUE_INGEST,
+        priority=ingest_priority(doc.size_bytes),
+    )
+
+
+def _dedupe(doc: Document, bulk: bool) -> Optional[Dict]:
+    """
+    Clone an identical READY document, or, while an earlier copy is still
+    processing, requeue this one to clone it once it is done. The deferred
+    job gives up its scheduler slot, so it never holds up the copy it waits on.
+    """
+    result = dedupe.try_dedupe(doc)
+    if result:
+        return {"document_id": str(doc.id), "mode": "dedupe", **result}
+    source = dedupe.pending_source(doc)
+    if source is None:
+        return None
+    requeue_document.apply_async((str(doc.id), bulk), countdown=settings.DOCUMENT_DEDUPE_RETRY_S)
+    log.info("Document %s waits for identical document %s to finish processing", doc.id, source.id)
+    return {"document_id": str(doc.id), "mode": "deferred", "waiting_for": str(source.id)}
+
+
+@shared_task(ignore_result=True)
+def requeue_document(doc_id: str, bulk: bool = False):
+    """Queue a document again after its dedupe wait (see _dedupe)."""
+    doc = Document.objects.filter(id=doc_id, status=Document.Status.PROCESSING).first()
+    if doc is not None:
+        enqueue_processing(doc, "incremental", bulk)
+
+
+@shared_task(
+    bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3,
+    acks_late=True, reject_on_worker_lost=True,
+)
+def process_document(self, doc_id: str, mode: str = "incremental", bulk: bool = False):
+    """
+    Extract → chunk → embed (streamed) → persist DocumentChunk rows.
+    Sets Document.status to READY or FAILED.
+
+    mode="incremental" clones chunks from an identical READY document of the
+    org if there is one (apps.documents.dedupe), waits for one that is still
+    processing, else keeps the embedding of
+    every unchanged chunk and embeds only new/changed ones; mode="full"
+    re-embeds all. `bulk` is the lane the job was queued in (enqueue_processing).
+
+    PDFs of INGEST_FANOUT_MIN_PAGES pages or more are split into
+    INGEST_SLICE_PAGES page ranges (IngestSlice) processed in parallel by
+    process_document_slice; finalize_document flips the result live. A rerun
+    after a failure resumes the unfinished run and redoes only the slices
+    that did not complete.
+
+    The document's scheduler slot is released when it is done; for a
+    fanned-out run that is in finalize_document / fail_document.
+    """
+    doc = Document.objects.get(id=doc_id)
+    tracker = progress.Tracker(doc)
+    finished = True
+    try:
+        # identical file already processed in this org: clone, don't re-embed
+        if mode == "incremental" and (result := _dedupe(doc, bulk)):
+            return result
+        generation = _unfinished_run(doc, mode)
+        if generation is not None:
+            finished = False
+            slices = IngestSlice.objects.filter(document=doc, generation=generation)
+            tracker.start(
+                pages_total=max(slices.values_list("page_stop", flat=True), default=0),
+                pages_done=sum(
+                    s.page_stop - s.page_start for s in slices.filter(status=IngestSlice.Status.DONE)
+                ),
+            )
+            queued = _dispatch_slices(doc, generation, bulk, resume=True)
+            log.info("Resuming document %s (%s): %d slices requeued", doc.id, mode, queued)
+            return {"document_id": str(doc.id), "mode": mode, "generation": generation, "slices": queued}
+        known = _known_hashes(doc, mode)
+        with _open_source(doc) as path:
+            if not doc.content_hash:  # direct-to-storage uploads are hashed here
+                doc.content_hash = _file_sha256(path)
+                doc.save(update_fields=["content_hash"])
+                if mode == "incremental" and (result := _dedupe(doc, bulk)):
+                    return result
+            n_pages = _pdf_pages(doc, path)
+            tracker.start(pages_total=n_pages)
+            if _fans_out(n_pages):
+                finished = False
+                generation = _plan_slices(doc, mode, n_pages)
+                queued = _dispatch_slices(doc, generation, bulk)
+                log.info("Document %s (%s): %d pages fanned out in %d slices", doc.id, mode, n_pages, queued)
+                return {"document_id": str(doc.id), "mode": mode, "generation": generation, "slices": queued}
+
+            # Sanity check MIME type, but Document.file_type is source of truth
+            sniffed_mime, _ = sniff_mime_file(path)
+            log.debug(
+                "Document %s: Sniffed MIME: %s, Declared file_type: %s",
+                doc.id,
+                sniffed_mime,
+                doc.file_type,
             )
-        DocumentChunk.objects.bulk_create(objs, batch_size=100)
+
+            # Use the document's declared file_type for extraction
+            mime_type_for_extraction = _map_file_type_to_mime(doc.file_type)
+
+            sections = iter_text_sections(mime_type_for_extraction, path, _extract_caps())
+            if n_pages:
+                sections = tracker.pages(sections)
+            # extraction, chunking and embedding overlap (see _chunk_and_embed)
+            chunker = get_chunker(mime_type_for_extraction)
+            chunks, hashes, embeddings = _chunk_and_embed(chunker.chunks(sections), known, tracker)
+
+        tracker.stage("persisting")
+        stats = _persist_chunks(doc, chunks, hashes, embeddings, reuse=mode == "incremental")
 
         doc.status = Document.Status.READY
         doc.save(update_fields=["status"])
-        log.info("Processed document %s: %d chunks", doc.id, len(objs))
+        log.info(
+            "Processed document %s (%s): %d chunks, %d reused, %d added, %d removed, generation %d",
+            doc.id, mode, len(chunks), stats["reused"], stats["added"], stats["removed"], stats["generation"],
+        )
+        return {"document_id": str(doc.id), "mode": mode, "chunks": len(chunks), **stats}
     except Exception as e:
         log.exception("Processing failed for document %s", doc.id)
         doc.status = Document.Status.FAILED
         doc.save(update_fields=["status"])
+        finished = self.request.retries >= self.max_retries
         raise
+    finally:
+        if finished:
+            scheduler.release(doc.organization_id, doc.id)
+
+
+def _write_slice(doc: Document, piece: IngestSlice, hashes: List[str], chunks: List[str], vecs) -> int:
+    """Write a slice's chunks into the shadow generation; returns how many were reused."""
+    base = piece.index * chunk_store.SLICE_INDEX_STRIDE
+    live_ids: Dict[str, object] = {}
+    need = {h for h, v in zip(hashes, vecs) if v is None}
+    if need:
+        rows = DocumentChunk.objects.filter(
+            document=doc, generation=doc.live_generation, content_hash__in=need
+        ).values_list("content_hash", "id")
+        for h, row_id in rows:
+            live_ids.setdefault(h, row_id)
+    moves = []  # (live row id, new chunk_index)
+    new = []  # (chunk_index, content, content_hash, embedding)
+    for idx, (content, h, emb) in enumerate(zip(chunks, hashes, vecs)):
+        if emb is None and h in live_ids:
+            moves.append((live_ids[h], base + idx))
+        else:
+            new.append([base + idx, content[:5000], h, emb])
+    # the live row went away since the hashes were read
+    missing = [row for row in new if row[3] is None]
+    if missing:
+        for row, vec in zip(missing, _embed_chunks([chunks[row[0] - base] for row in missing])):
+            row[3] = vec
+    reused = chunk_store.clone_chunks(doc.id, piece.generation, moves)
+    chunk_store.copy_chunks(doc.id, doc.organization_id, piece.generation, new)
+    return reused
+
+
+@shared_task(
+    bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3,
+    acks_late=True, reject_on_worker_lost=True, ignore_result=False,  # the chord reads slice results
+)
+def process_document_slice(self, slice_id: str):
+    """
+    Extract, chunk, embed and persist one page range of a fanned-out ingest.
+    The rows and the DONE checkpoint commit together, so a retry either
+    skips the slice or redoes it from scratch, never half of it.
+    """
+    piece = IngestSlice.objects.select_related("document").get(id=slice_id)
+    if piece.status == IngestSlice.Status.DONE:
+        return {"slice": piece.index, "chunks": piece.chunks, "reused": piece.reused}
+    doc = piece.document
+    # stamp the start (update() skips auto_now) so a resume leaves this slice alone
+    IngestSlice.objects.filter(id=piece.id).update(
+        status=IngestSlice.Status.PENDING, attempts=F("attempts") + 1, updated_at=timezone.now()
+    )
+    try:
+        mime = _map_file_type_to_mime(doc.file_type)
+        known = _known_hashes(doc, piece.mode)
+        with _open_source(doc) as path:
+            sections = iter_text_sections(mime, path, _extract_caps(), pages=(piece.page_start, piece.page_stop))
+            chunks, hashes, embeddings = _chunk_and_embed(get_chunker(mime).chunks(sections), known)
+        with transaction.atomic():
+            reused = _write_slice(doc, piece, hashes, chunks, embeddings)
+            piece.status = IngestSlice.Status.DONE
+            piece.chunks = len(chunks)
+            piece.reused = reused
+            piece.last_error = ""
+            piece.save(update_fields=["status", "chunks", "reused", "last_error", "updated_at"])
+        # counted per committed slice, so retried slices are not counted twice
+        tracker = progress.Tracker(doc)
+        tracker.add(pages=piece.page_stop - piece.page_start, chunks=len(chunks), embedded=len(chunks))
+        tracker.flush()
+    except Exception as e:
+        IngestSlice.objects.filter(id=piece.id).update(
+            status=IngestSlice.Status.FAILED, last_error=str(e)[:2000], updated_at=timezone.now()
+        )
+        raise
+    return {"slice": piece.index, "chunks": piece.chunks, "reused": piece.reused}
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=3, acks_late=True)
+def finalize_document(self, results, doc_id: str, generation: int):
+    """Chord callback: renumber the slices' chunks, flip the generation live, mark READY."""
+    doc = Document.objects.get(id=doc_id)
+    slices = IngestSlice.objects.filter(document=doc, generation=generation)
+    if slices.exclude(status=IngestSlice.Status.DONE).exists():
+        raise RuntimeError(f"Document {doc_id}: generation {generation} has unfinished slices")
+    totals = slices.aggregate(chunks=Sum("chunks"), reused=Sum("reused"), slices=Count("id"))
+    live_count = DocumentChunk.objects.filter(document=doc, generation=doc.live_generation).count()
+    progress.Tracker(doc).stage("persisting")
+    with transaction.atomic():
+        chunk_store.renumber(doc.id, generation)
+        chunk_store.flip_generation(doc.id, generation)
+        doc.status = Document.Status.READY
+        doc.save(update_fields=["status"])
+        slices.delete()
+    scheduler.release(doc.organization_id, doc.id)
+    chunks, reused = totals["chunks"] or 0, totals["reused"] or 0
+    log.info(
+        "Processed document %s in %d slices: %d chunks, %d reused, %d added, generation %d",
+        doc.id, totals["slices"], chunks, reused, chunks - reused, generation,
+    )
+    return {
+        "document_id": str(doc.id), "chunks": chunks, "reused": reused, "added": chunks - reused,
+        "removed": live_count - reused, "generation": generation, "slices": totals["slices"],
+    }
+
+
+@shared_task(ignore_result=True)
+def fail_document(doc_id: str):
+    """Chord error callback: a slice ran out of retries. Its checkpoints are kept for a rerun."""
+    log.error("Fanned-out processing failed for document %s", doc_id)
+    # the chord is gone: a rerun must dispatch these again rather than wait for them
+    IngestSlice.objects.filter(document_id=doc_id, status=IngestSlice.Status.PENDING).update(
+        status=IngestSlice.Status.FAILED, updated_at=timezone.now()
+    )
+    failed = Document.objects.filter(id=doc_id).exclude(status=Document.Status.READY).update(
+        status=Document.Status.FAILED
+    )
+    org_id = Document.objects.filter(id=doc_id).values_list("organization_id", flat=True).first()
+    if org_id:
+        if failed:
+            progress.set_status(doc_id, org_id, Document.Status.FAILED)
+        scheduler.release(org_id, doc_id)
+
+
+@shared_task(ignore_result=True)
+def dispatch_ingest():
+    """Periodic: start queued documents whose dispatch was missed (see scheduler)."""
+    n = scheduler.dispatch()
+    if n:
+        log.info("Dispatched %d queued documents", n)
+
+
+@shared_task(ignore_result=True)
+def gc_chunk_generations(doc_id: str | None = None):
+    """
+    Delete chunk rows of replaced generations. Queued after every flip;
+    the periodic run (doc_id=None) sweeps up after missed or failed cleanups,
+    including shadow generations of runs that failed before flipping.
+    """
+    doc_ids = [doc_id] if doc_id else chunk_store.documents_with_stale_chunks()
+    total = 0
+    for d in doc_ids:
+        total += chunk_store.delete_stale(d)
+    if not doc_id:
+        grace = settings.CHUNK_SHADOW_GRACE_S
+        abandoned = chunk_store.documents_with_abandoned_chunks(grace)
+        for d in abandoned:
+            total += chunk_store.delete_abandoned(d, grace)
+        doc_ids = set(doc_ids) | set(abandoned)
+    # checkpoints of fanned-out runs that a later generation superseded
+    slices = IngestSlice.objects.filter(generation__lte=F("document__live_generation"))
+    (slices.filter(document_id=doc_id) if doc_id else slices).delete()
+    if total:
+        log.info("Deleted %d stale chunk rows across %d documents", total, len(doc_ids))
+
+
+@shared_task(ignore_result=True)
+def purge_upload_sessions():
+    """Periodic: abort expired multipart uploads and delete their parts."""
+    from apps.documents.uploads import purge_expired
+
+    n = purge_expired()
+    if n:
+        log.info("Aborted %d expired upload sessions", n)
@@ -1,3 +1,480 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import redis
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from apps.documents import chunk_store, dedupe, progress, retrieval, scheduler, tasks
+from apps.documents.chunking import CharChunker, CsvChunker, MarkdownChunker, TokenChunker
+from apps.documents.models import Document, DocumentChunk, IngestSlice
+from apps.documents.uploads import HashingReader, UploadError
+from apps.organizations.models import Organization
+from common.llm import rate_limit
+from common.llm.embeddings import _pack_batches
+from common.llm.tokens import count_tokens
+
+
+def sentences(n, prefix="Sentence"):
+    return " ".join(f"{prefix} number {i} says something short." for i in range(n))
+
+
+def make_doc(org, **fields):
+    return Document.objects.create(
+        organization=org, name="f.txt", file_type="txt", size_bytes=1, url="https://example.com/f.txt", **fields
+    )
+
+
+def add_chunks(doc, generation, indexes):
+    DocumentChunk.objects.bulk_create(
+        DocumentChunk(
+            document=doc, organization_id=doc.organization_id, generation=generation, chunk_index=i,
+            content=f"chunk {i}", embedding=[0.1] * settings.EMBEDDING_DIM,
+        )
+        for i in indexes
+    )
+
+
+def generations(doc):
+    return sorted(set(DocumentChunk.objects.filter(document=doc).values_list("generation", flat=True)))
+
+
+class TokenChunkerTests(SimpleTestCase):
+    def test_chunks_fit_budget(self):
+        chunker = TokenChunker(64, 16)
+        chunks = list(chunker.chunks([sentences(40) + "\n\n" + sentences(40, "Other")]))
+        self.assertGreater(len(chunks), 2)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk), 64)
+
+    def test_neighbours_share_whole_sentences(self):
+        chunks = list(TokenChunker(64, 16).chunks([sentences(40)]))
+        self.assertGreater(len(chunks), 2)
+        for a, b in zip(chunks, chunks[1:]):
+            # b opens with the last sentence(s) of a
+            first = b.split("\n\n")[0]
+            self.assertIn(first, a)
+
+    def test_no_overlap(self):
+        chunks = list(TokenChunker(64, 0).chunks([sentences(40)]))
+        self.assertEqual(" ".join(chunks).count("number 7 says"), 1)
+
+    def test_oversize_sentence_is_cut_into_windows(self):
+        word = "x" * 4000  # one "sentence", far over budget
+        chunks = list(TokenChunker(32, 8).chunks([word]))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), word)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk), 32)
+
+    def test_sections_are_joined_across_boundaries(self):
+        text = sentences(10)
+        whole = list(TokenChunker(512, 0).chunks([text]))
+        pieces = list(TokenChunker(512, 0).chunks([text[:37], text[37:90], text[90:]]))
+        self.assertEqual(whole, pieces)
+
+    def test_markdown_heading_starts_a_chunk(self):
+        md = "# One\nintro text.\n## Two\nmore text."
+        chunks = list(MarkdownChunker(512, 48).chunks([md]))
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[1].startswith("## Two"))
+        self.assertNotIn("intro", chunks[1])
+
+    def test_csv_repeats_header(self):
+        rows = "id,name\n" + "".join(f"{i},item number {i}\n" for i in range(200))
+        chunks = list(CsvChunker(64, 16).chunks([rows]))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith("id,name\n"))
+        body = [line for chunk in chunks for line in chunk.split("\n")[1:]]
+        self.assertEqual(len(body), 200)  # rows never overlap
+
+    def test_char_chunker_overlap(self):
+        chunks = list(CharChunker(10, 3).chunks(["abcdefghij", "klmnopqrst"]))
+        self.assertEqual(chunks[0], "abcdefghij")
+        self.assertEqual(chunks[1][:3], "hij")
+
+
+class RetrievalHelperTests(SimpleTestCase):
+    @override_settings(RETRIEVAL_RRF_K=60)
+    def test_fuse_ranks_by_reciprocal_rank_sum(self):
+        a = [{"document_id": "d", "chunk_index": i, "score": 0.9 - i / 10} for i in (1, 2, 3)]
+        b = [{"document_id": "d", "chunk_index": i, "score": 5.0 - i} for i in (3, 1, 4)]
+        fused = retrieval.fuse([a, b], top_k=3)
+        self.assertEqual([r["chunk_index"] for r in fused], [1, 3, 2])
+        self.assertAlmostEqual(fused[0]["score"], 1 / 61 + 1 / 62)
+        self.assertAlmostEqual(fused[2]["score"], 1 / 62)
+
+    def test_fuse_keys_on_document_and_index(self):
+        a = [{"document_id": "d1", "chunk_index": 0, "score": 1.0}]
+        b = [{"document_id": "d2", "chunk_index": 0, "score": 1.0}]
+        self.assertEqual(len(retrieval.fuse([a, b], top_k=5)), 2)
+
+    @override_settings(RETRIEVAL_KEYWORD_MAX_TERMS=4)
+    def test_is_keyword_query(self):
+        for q in ("SKU-4411", "error E1234", "policy 88-221 refund", "ACME_PRO"):
+            self.assertTrue(retrieval.is_keyword_query(q), q)
+        for q in ("", "refund policy", "what is E1234?", "how do I reset the router 2 times"):
+            self.assertFalse(retrieval.is_keyword_query(q), q)
+
+    @override_settings(RETRIEVAL_MODE="vector")
+    def test_resolve_mode_and_needs_embedding(self):
+        bot = type("Bot", (), {"retrieval_mode": "hybrid"})()
+        self.assertEqual(retrieval.resolve_mode("lexical", bot), "lexical")
+        self.assertEqual(retrieval.resolve_mode(None, bot), "hybrid")
+        self.assertEqual(retrieval.resolve_mode("bogus"), "vector")
+        self.assertFalse(retrieval.needs_embedding("lexical", "how do refunds work"))
+        self.assertFalse(retrieval.needs_embedding("hybrid", "SKU-4411"))
+        self.assertTrue(retrieval.needs_embedding("hybrid", "how do refunds work"))
+        self.assertTrue(retrieval.needs_embedding("vector", "SKU-4411"))
+
+
+class PackBatchesTests(SimpleTestCase):
+    def test_limits(self):
+        texts = [f"text number {i} " * (i % 7 + 1) for i in range(50)]
+        batches = _pack_batches(texts, "text-embedding-3-small", 8, 60)
+        self.assertEqual([i for batch, _ in batches for i in batch], list(range(50)))
+        for batch, tokens in batches:
+            self.assertLessEqual(len(batch), 8)
+            self.assertEqual(tokens, sum(count_tokens(texts[i], "text-embedding-3-small") for i in batch))
+            self.assertLessEqual(tokens, 60)
+
+    def test_oversized_text_gets_its_own_batch(self):
+        texts = ["short", "long " * 200, "short"]
+        batches = _pack_batches(texts, "text-embedding-3-small", 16, 50)
+        self.assertEqual([b for b, _ in batches], [[0], [1], [2]])
+
+
+@override_settings(EMBEDDING_TPM_LIMIT=1000, EMBEDDING_TPM_MAX_WAIT_S=10)
+class RateLimitTests(SimpleTestCase):
+    def test_waits_until_budget_is_available(self):
+        with mock.patch.object(rate_limit, "_take", side_effect=[1500, 0]) as take, \
+                mock.patch.object(rate_limit.time, "sleep") as sleep:
+            rate_limit.acquire(200)
+        sleep.assert_called_once_with(1.5)
+        self.assertEqual(take.call_args_list, [mock.call(200, force=False)] * 2)
+
+    def test_interactive_callers_are_charged_without_waiting(self):
+        with mock.patch.object(rate_limit, "_take", return_value=0) as take:
+            rate_limit.acquire(200, wait=False)
+        take.assert_called_once_with(200, force=True)
+
+    def test_gives_up_past_max_wait(self):
+        with mock.patch.object(rate_limit, "_take", return_value=60_000), \
+                mock.patch.object(rate_limit.time, "sleep") as sleep:
+            with self.assertRaises(RuntimeError):
+                rate_limit.acquire(200)
+        sleep.assert_not_called()
+
+    def test_fails_open(self):
+        with mock.patch.object(rate_limit, "_take", side_effect=redis.ConnectionError) as take:
+            rate_limit.acquire(200)
+        take.assert_called_once()
+        with override_settings(EMBEDDING_TPM_LIMIT=0), mock.patch.object(rate_limit, "_take") as take:
+            rate_limit.acquire(200)
+        take.assert_not_called()
+
+
+class ProgressViewTests(SimpleTestCase):
+    def test_rates_and_eta_from_counters(self):
+        raw = {b"status": b"processing", b"stage": b"extracting", b"started_at": b"1000", b"pages": b"20",
+               b"pages_total": b"100", b"embedded": b"50"}
+        with mock.patch.object(progress.time, "time", return_value=1010.0):
+            out = progress.view("d1", raw)
+        self.assertEqual(
+            out,
+            {"id": "d1", "status": "processing", "stage": "extracting", "pages": 20, "chunks": 0, "embedded": 50,
+             "pages_total": 100, "chunks_per_s": 5.0, "eta_s": 40.0, "elapsed_s": 10.0},
+        )
+
+    def test_no_eta_without_page_total_or_when_done(self):
+        running = {"status": "processing", "stage": "extracting", "started_at": "1000", "embedded": "5"}
+        with mock.patch.object(progress.time, "time", return_value=1010.0):
+            self.assertIsNone(progress.view("d1", running)["eta_s"])
+            done = progress.view("d1", {**running, "status": "ready", "stage": "ready", "pages_total": "9"})
+        self.assertIsNone(done["chunks_per_s"])
+        self.assertNotIn("elapsed_s", done)
+
+    def test_initial_state_falls_back_to_document_status(self):
+        stale = progress.view("d1", {"status": "processing", "stage": "persisting"})
+        with mock.patch.object(progress, "snapshot", return_value={"d1": stale, "d2": None, "d3": stale}):
+            initial = progress._initial({"d1": "ready", "d2": "processing", "d3": "processing"})
+        self.assertEqual(initial["d1"]["stage"], "ready")  # record lags the committed status
+        self.assertEqual(initial["d2"]["stage"], "queued")
+        self.assertEqual(initial["d3"]["stage"], "persisting")
+
+    def test_stream_ends_when_every_document_is_terminal(self):
+        s = progress._Stream({"d1": "processing", "d2": "processing"})
+        frames = list(s.events([
+            progress.view("d1", {"stage": "ready"}),
+            progress.view("other", {"stage": "ready"}),  # not asked for
+            progress.view("d2", {"stage": "extracting"}),
+        ]))
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(s.pending, {"d2"})
+        self.assertEqual(list(s.message({"data": b"not json"})), [])
+
+
+class HashingReaderTests(SimpleTestCase):
+    def test_hash_and_size(self):
+        reader = HashingReader([b"abc", b"defgh", b"", b"ij"])
+        out = b""
+        while data := reader.read(4):
+            out += data
+        self.assertEqual(out, b"abcdefghij")
+        self.assertEqual(reader.size, 10)
+        self.assertEqual(reader.sha256, hashlib.sha256(b"abcdefghij").hexdigest())
+
+    def test_read_all(self):
+        reader = HashingReader([b"ab", b"cd"])
+        self.assertEqual(reader.read(1), b"a")
+        self.assertEqual(reader.read(), b"bcd")
+        self.assertEqual(reader.sha256, hashlib.sha256(b"abcd").hexdigest())
+
+    def test_limit(self):
+        reader = HashingReader([b"x" * 6, b"x" * 6], limit=10)
+        self.assertEqual(reader.read(6), b"x" * 6)
+        with self.assertRaises(UploadError):
+            reader.read(6)
+
+    def test_exact_limit_is_allowed(self):
+        reader = HashingReader([b"x" * 10], limit=10)
+        self.assertEqual(len(reader.read()), 10)
+
+
+class ChunkStoreTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="org")
+        self.doc = make_doc(self.org)
+
+    def test_next_generation_counts_up(self):
+        self.assertEqual(chunk_store.next_generation(self.doc.id), 1)
+        self.assertEqual(chunk_store.next_generation(self.doc.id), 2)
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.last_generation, 2)
+        self.assertIsNotNone(self.doc.last_generation_at)
+
+    def test_next_generation_skips_existing_shadow(self):
+        add_chunks(self.doc, 5, [0, 1])  # left by a run that never flipped
+        self.assertEqual(chunk_store.next_generation(self.doc.id), 6)
+
+    def test_next_generation_missing_document(self):
+        with self.assertRaises(Document.DoesNotExist):
+            chunk_store.next_generation(self.org.id)
+
+    def test_delete_stale_keeps_live_and_shadow(self):
+        for generation in (1, 2, 3):
+            add_chunks(self.doc, generation, [0, 1])
+        Document.objects.filter(pk=self.doc.pk).update(live_generation=2)
+        self.assertEqual(chunk_store.documents_with_stale_chunks(), [str(self.doc.id)])
+        self.assertEqual(chunk_store.delete_stale(self.doc.id, batch_size=1), 2)
+        self.assertEqual(generations(self.doc), [2, 3])
+
+    def _abandon(self, generation, age_s):
+        add_chunks(self.doc, generation, [0, 1])
+        Document.objects.filter(pk=self.doc.pk).update(
+            live_generation=1, last_generation=generation,
+            last_generation_at=timezone.now() - timedelta(seconds=age_s),
+        )
+
+    def test_abandoned_shadow_is_deleted_after_grace(self):
+        add_chunks(self.doc, 1, [0, 1])
+        self._abandon(2, age_s=7200)
+        self.assertEqual(chunk_store.documents_with_abandoned_chunks(3600), [str(self.doc.id)])
+        self.assertEqual(chunk_store.delete_abandoned(self.doc.id, 3600, batch_size=1), 2)
+        self.assertEqual(generations(self.doc), [1])
+
+    def test_recent_shadow_is_kept(self):
+        self._abandon(2, age_s=60)
+        self.assertEqual(chunk_store.documents_with_abandoned_chunks(3600), [])
+        self.assertEqual(chunk_store.delete_abandoned(self.doc.id, 3600), 0)
+
+    def test_checkpointed_shadow_is_kept(self):
+        self._abandon(2, age_s=7200)
+        IngestSlice.objects.create(document=self.doc, generation=2, mode="incremental", index=0, page_start=0, page_stop=32)
+        self.assertEqual(chunk_store.documents_with_abandoned_chunks(3600), [])
+        self.assertEqual(chunk_store.delete_abandoned(self.doc.id, 3600), 0)
+        self.assertEqual(generations(self.doc), [2])
+
+
+@override_settings(DOCUMENT_DEDUPE_ENABLED=True, DOCUMENT_DEDUPE_RETRY_S=30, DOCUMENT_DEDUPE_MAX_WAIT_S=3600)
+class DedupeTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="org")
+        self.source = make_doc(self.org, content_hash="a" * 64)
+        self.copy = make_doc(self.org, content_hash="a" * 64)
+        # uploaded in this order
+        Document.objects.filter(pk=self.source.pk).update(upload_date=timezone.now() - timedelta(minutes=5))
+        self.source.refresh_from_db()
+
+    def _ready(self, doc, chunks=3):
+        add_chunks(doc, 1, range(chunks))
+        Document.objects.filter(pk=doc.pk).update(status=Document.Status.READY, live_generation=1)
+
+    def test_clones_ready_source(self):
+        self._ready(self.source)
+        result = dedupe.try_dedupe(self.copy)
+        self.assertEqual(result["deduplicated_from"], str(self.source.id))
+        self.assertEqual(result["cloned"], 3)
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, Document.Status.READY)
+        self.assertEqual(self.copy.deduplicated_from_id, self.source.id)
+        self.assertEqual(
+            DocumentChunk.objects.filter(document=self.copy, generation=self.copy.live_generation).count(), 3
+        )
+
+    def test_no_source(self):
+        self.assertIsNone(dedupe.try_dedupe(self.copy))  # source still processing
+        other = make_doc(Organization.objects.create(name="other"), content_hash="a" * 64)
+        self._ready(other)
+        self.assertIsNone(dedupe.try_dedupe(self.copy))  # other org
+        with override_settings(DOCUMENT_DEDUPE_ENABLED=False):
+            self._ready(self.source)
+            self.assertIsNone(dedupe.try_dedupe(self.copy))
+
+    def test_pending_source_is_the_earlier_processing_upload(self):
+        self.assertEqual(dedupe.pending_source(self.copy), self.source)
+        self.assertIsNone(dedupe.pending_source(self.source))  # never wait on a later copy
+        Document.objects.filter(pk=self.source.pk).update(status=Document.Status.FAILED)
+        self.assertIsNone(dedupe.pending_source(self.copy))
+
+    def test_pending_source_gives_up_after_max_wait(self):
+        with override_settings(DOCUMENT_DEDUPE_MAX_WAIT_S=0):
+            self.assertIsNone(dedupe.pending_source(self.copy))
+
+    def test_worker_defers_while_source_processes(self):
+        with mock.patch.object(tasks.requeue_document, "apply_async") as requeue:
+            result = tasks._dedupe(self.copy, bulk=False)
+        self.assertEqual(result["mode"], "deferred")
+        requeue.assert_called_once_with((str(self.copy.id), False), countdown=30)
+        self._ready(self.source)
+        self.assertEqual(tasks._dedupe(self.copy, bulk=False)["mode"], "dedupe")
+
+
+@override_settings(INGEST_SLICE_LEASE_S=600)
+class FanOutTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="org")
+        self.doc = make_doc(self.org)
+
+    def _slices(self, generation, statuses):
+        for i, status in enumerate(statuses):
+            IngestSlice.objects.create(
+                document=self.doc, generation=generation, mode="incremental", index=i,
+                page_start=i * 32, page_stop=(i + 1) * 32, status=status,
+            )
+
+    def test_renumber_closes_slice_gaps_in_order(self):
+        stride = chunk_store.SLICE_INDEX_STRIDE
+        add_chunks(self.doc, 2, [0, 1, stride, stride + 1, 2 * stride])
+        add_chunks(self.doc, 1, [0, stride])  # other generations are untouched
+        self.assertEqual(chunk_store.renumber(self.doc.id, 2), 3)
+        rows = DocumentChunk.objects.filter(document=self.doc, generation=2).order_by("chunk_index")
+        self.assertEqual([r.chunk_index for r in rows], [0, 1, 2, 3, 4])
+        self.assertEqual(
+            [r.content for r in rows],
+            ["chunk 0", "chunk 1", f"chunk {stride}", f"chunk {stride + 1}", f"chunk {2 * stride}"],
+        )
+        self.assertEqual(
+            sorted(DocumentChunk.objects.filter(document=self.doc, generation=1).values_list("chunk_index", flat=True)),
+            [0, stride],
+        )
+
+    def test_resume_leaves_in_flight_slices_alone(self):
+        self._slices(2, [IngestSlice.Status.DONE, IngestSlice.Status.PENDING, IngestSlice.Status.FAILED])
+        with mock.patch.object(tasks, "chord") as chord:
+            self.assertEqual(tasks._dispatch_slices(self.doc, 2, resume=True), 0)
+        chord.assert_not_called()
+
+    def test_resume_requeues_stale_and_failed_slices(self):
+        self._slices(2, [IngestSlice.Status.DONE, IngestSlice.Status.PENDING, IngestSlice.Status.FAILED])
+        IngestSlice.objects.filter(document=self.doc).update(updated_at=timezone.now() - timedelta(hours=1))
+        with mock.patch.object(tasks, "chord") as chord:
+            self.assertEqual(tasks._dispatch_slices(self.doc, 2, resume=True), 2)
+        self.assertEqual(len(list(chord.call_args.args[0])), 2)
+
+    def test_failed_chord_releases_pending_slices(self):
+        self._slices(2, [IngestSlice.Status.DONE, IngestSlice.Status.PENDING])
+        with mock.patch.object(tasks.scheduler, "release"):
+            tasks.fail_document(str(self.doc.id))
+        self.assertEqual(
+            sorted(IngestSlice.objects.filter(document=self.doc).values_list("status", flat=True)),
+            [IngestSlice.Status.DONE, IngestSlice.Status.FAILED],
+        )
+        self.doc.refresh_from_db()
+        self.assertEqual(self.doc.status, Document.Status.FAILED)
+
+
+@override_settings(
+    INGEST_MAX_INFLIGHT=8, INGEST_ORG_MAX_INFLIGHT=10, INGEST_ORG_WEIGHTS={"a": 3}, INGEST_RUNNING_TTL_S=3600,
+)
+class SchedulerTests(SimpleTestCase):
+    """Against a real Redis (TEST_REDIS_URL, a scratch database that is flushed)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.r = redis.from_url(os.environ.get("TEST_REDIS_URL", "redis://localhost:6379/15"))
+        try:
+            cls.r.ping()
+        except redis.RedisError:
+            raise unittest.SkipTest("Redis is not available")
+
+    def setUp(self):
+        self.r.flushdb()
+        self.started = []
+        for patcher in (
+            mock.patch.object(scheduler, "_r", self.r),
+            mock.patch.object(scheduler, "_start", side_effect=self.started.append),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _queue(self, org, n, bulk=False):
+        for i in range(n):
+            job = {"doc": f"{org}-{'bulk' if bulk else 'doc'}{i}", "mode": "incremental", "bulk": bulk, "size": 1}
+            self.r.rpush(scheduler._queue_key(org, bulk), json.dumps(job))
+        self.r.zadd(scheduler.ORGS_KEY, {org: 0}, nx=True)
+
+    def _started_by(self, org):
+        return [job["doc"] for job in self.started if job["doc"].startswith(f"{org}-")]
+
+    def test_weighted_round_robin(self):
+        self._queue("a", 10)
+        self._queue("b", 10)
+        self.assertEqual(scheduler._fill(self.r), 8)
+        # two rounds of three for "a" (weight 3) and one for "b"
+        self.assertEqual([job["doc"][0] for job in self.started], list("aaabaaab"))
+        self.assertEqual(self.r.zcard(scheduler.RUNNING_KEY), 8)
+
+    @override_settings(INGEST_ORG_MAX_INFLIGHT=2, INGEST_ORG_WEIGHTS={})
+    def test_per_org_cap(self):
+        self._queue("a", 5)
+        self._queue("b", 1)
+        self.assertEqual(scheduler._fill(self.r), 3)
+        self.assertEqual(len(self._started_by("a")), 2)
+        self.assertEqual(scheduler.backlog("a"), {"interactive": 3, "bulk": 0, "running": 2})
+        # a finished document frees its org's slot for the next one
+        scheduler.release("a", self._started_by("a")[0])
+        self.assertEqual(len(self._started_by("a")), 3)
+
+    def test_interactive_before_bulk(self):
+        self._queue("a", 2, bulk=True)
+        self._queue("a", 1)
+        scheduler._fill(self.r)
+        self.assertEqual([job["doc"] for job in self.started], ["a-doc0", "a-bulk0", "a-bulk1"])
+        # an org with nothing left queued is dropped from the rotation
+        self.assertEqual(self.r.zrange(scheduler.ORGS_KEY, 0, -1), [])
+
+    def test_failed_start_is_requeued(self):
+        self._queue("a", 1)
+        with mock.patch.object(scheduler, "_start", side_effect=RuntimeError("broker down")):
+            with self.assertRaises(RuntimeError):
+                scheduler._fill(self.r)
+        self.assertEqual(scheduler.backlog("a"), {"interactive": 1, "bulk": 0, "running": 0})
@@ -0,0 +1,381 @@
+"""
+Document uploads without buffering whole files in app workers.
+
+Single request (POST /documents): the uploaded file is copied to
+default_storage chunk by chunk through HashingReader, which computes the
+sha256 and enforces MAX_UPLOAD_MB on the fly.
+
+Multipart / resumable (POST /documents/uploads ...):
+  1. create a session: the file is split into UPLOAD_PART_SIZE_MB parts
+  2. send parts in any order, retrying any that fail
+       local: PUT /documents/uploads/<id>/parts/<n> (raw body, streamed)
+       s3:    PUT to the presigned part URL returned by the session
+  3. GET the session to see which parts arrived (resume after a crash)
+  4. POST .../complete: parts are assembled and the Document is created
+
+The s3 backend needs default_storage to be S3Storage and UPLOAD_DIRECT_S3;
+file bytes then never pass through the app. Its content hash is computed
+at ingest instead.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import uuid
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from apps.documents.models import Document, UploadSession
+
+log = logging.getLogger(__name__)
+
+_READ_CHUNK = 1024 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+class HashingReader:
+    """Read-only file-like view over byte chunks that hashes and counts as it goes."""
+
+    def __init__(self, chunks: Iterable[bytes], limit: Optional[int] = None):
+        self._chunks = iter(chunks)
+        self._buf = b""
+        self._limit = limit
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def _take(self, data: bytes) -> bytes:
+        self.size += len(data)
+        if self._limit is not None and self.size > self._limit:
+            raise UploadError(f"Upload exceeds {self._limit} bytes.")
+        self._hash.update(data)
+        return data
+
+    def read(self, n: int = -1) -> bytes:
+        if n is None or n < 0:
+            data = self._buf + b"".join(self._chunks)
+            self._buf = b""
+            return self._take(data)
+        while len(self._buf) < n:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            # chunks are usually consumed whole; only join when a read spans two
+            self._buf = chunk if not self._buf else self._buf + chunk
+        data, self._buf = self._buf[:n], self._buf[n:]
+        return self._take(data)
+
+    def close(self) -> None:
+        pass
+
+
+def iter_stream(stream, length: Optional[int] = None) -> Iterator[bytes]:
+    """Byte chunks from a file-like object (e.g. the raw request body)."""
+    remaining = length
+    while remaining is None or remaining > 0:
+        n = _READ_CHUNK if remaining is None else min(_READ_CHUNK, remaining)
+        data = stream.read(n)
+        if not data:
+            return
+        if remaining is not None:
+            remaining -= len(data)
+        yield data
+
+
+def max_upload_bytes() -> int:
+    return int(settings.MAX_UPLOAD_MB) * 1024 * 1024
+
+
+def store(key: str, chunks: Iterable[bytes], limit: Optional[int] = None) -> Tuple[str, str, int]:
+    """Stream chunks into default_storage. Returns (stored name, sha256, size)."""
+    reader = HashingReader(chunks, limit)
+    name = default_storage.get_available_name(key)
+    try:
+        name = default_storage.save(name, File(reader, name=name))
+    except Exception:
+        default_storage.delete(name)  # drop the partial write
+        raise
+    return name, reader.sha256, reader.size
+
+
+def create_document(org, name: str, file_type: str, size: int, key: str, content_hash: str = "") -> Document:
+    doc = Document.objects.create(
+        organization=org,
+        name=name,
+        file_type=file_type,
+        size_bytes=size,
+        url=default_storage.url(key),
+        storage_key=key,
+        content_hash=content_hash,
+    )
+    from apps.documents.tasks import enqueue_processing
+
+    # deduplication runs in the worker (process_document), off the request path
+    transaction.on_commit(lambda: enqueue_processing(doc))
+    return doc
+
+
+# ---- multipart sessions ----
+
+def direct_s3_available() -> bool:
+    return bool(getattr(settings, "UPLOAD_DIRECT_S3", False)) and hasattr(default_storage, "bucket_name")
+
+
+def _s3_key(key: str) -> str:
+    from storages.utils import clean_name
+
+    return default_storage._normalize_name(clean_name(key))
+
+
+def _s3_client():
+    return default_storage.connection.meta.client
+
+
+def _s3_presign_client():
+    # Presigned URLs must use the endpoint clients can reach (e.g. localhost
+    # for a MinIO container the app itself reaches as http://minio:9000).
+    endpoint = getattr(settings, "UPLOAD_PRESIGN_ENDPOINT_URL", "")
+    if not endpoint:
+        return _s3_client()
+    import boto3
+    from botocore.config import Config
+
+    s3_opts = {"addressing_style": default_storage.addressing_style} if default_storage.addressing_style else {}
+    return boto3.session.Session().client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id=default_storage.access_key or None,
+        aws_secret_access_key=default_storage.secret_key or None,
+        region_name=default_storage.region_name or None,
+        config=Config(signature_version="s3v4", s3=s3_opts),
+    )
+
+
+def _part_key(session: UploadSession, number: int) -> str:
+    return f"uploads/{session.id}/part-{number:05d}"
+
+
+def create_session(org, *, name: str, filename: str, file_type: str, size_bytes: int, direct: bool) -> UploadSession:
+    if size_bytes > max_upload_bytes():
+        raise UploadError(f"File size exceeds {settings.MAX_UPLOAD_MB}MB limit.")
+    if direct and not direct_s3_available():
+        raise UploadError("Direct-to-storage uploads are not enabled.")
+    sid = uuid.uuid4()
+    filename = default_storage.get_valid_name(os.path.basename(filename))
+    session = UploadSession(
+        id=sid,
+        organization=org,
+        name=name,
+        filename=filename,
+        file_type=file_type,
+        size_bytes=size_bytes,
+        part_size=int(getattr(settings, "UPLOAD_PART_SIZE_MB", 8)) * 1024 * 1024,
+        backend=UploadSession.Backend.S3 if direct else UploadSession.Backend.LOCAL,
+        storage_key=f"docs/{org.id}/{sid}/{filename}",
+        expires_at=timezone.now() + timedelta(seconds=int(getattr(settings, "UPLOAD_SESSION_TTL_S", 24 * 3600))),
+    )
+    if direct:
+        resp = _s3_client().create_multipart_upload(
+            Bucket=default_storage.bucket_name, Key=_s3_key(session.storage_key)
+        )
+        session.s3_upload_id = resp["UploadId"]
+    session.save()
+    return session
+
+
+def _check_open(session: UploadSession) -> None:
+    if session.status != UploadSession.Status.PENDING:
+        raise UploadError(f"Upload session is {session.status}.")
+    if session.expires_at <= timezone.now():
+        raise UploadError("Upload session expired.")
+
+
+def _check_part_number(session: UploadSession, number: int) -> None:
+    if not 1 <= number <= session.part_count:
+        raise UploadError(f"Part number must be between 1 and {session.part_count}.")
+
+
+def put_part(session: UploadSession, number: int, stream, length: Optional[int]) -> Dict:
+    """Store one part sent through the API (local backend). Re-sending a part replaces it."""
+    _check_open(session)
+    if session.backend != UploadSession.Backend.LOCAL:
+        raise UploadError("Parts of a direct upload go to their presigned URLs.")
+    _check_part_number(session, number)
+    expected = session.expected_part_size(number)
+    if length is not None and length != expected:
+        raise UploadError(f"Part {number} must be {expected} bytes.")
+
+    key = _part_key(session, number)
+    default_storage.delete(key)
+    name, sha, size = store(key, iter_stream(stream, length), limit=expected)
+    if size != expected:
+        default_storage.delete(name)
+        raise UploadError(f"Part {number} must be {expected} bytes, got {size}.")
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+        previous = locked.parts.get(str(number), {}).get("name")
+        # storage may pick another name if a concurrent retry got there first
+        locked.parts[str(number)] = {"size": size, "sha256": sha, "name": name}
+        locked.save(update_fields=["parts"])
+    if previous and previous != name:
+        default_storage.delete(previous)
+    session.parts = locked.parts
+    return {"part": number, "size": size, "sha256": sha}
+
+
+def presign_parts(session: UploadSession, numbers: Iterable[int]) -> List[Dict]:
+    expires = int(getattr(settings, "UPLOAD_PRESIGN_EXPIRES_S", 3600))
+    client = _s3_presign_client()
+    out = []
+    for n in numbers:
+        url = client.generate_presigned_url(
+            "upload_part",
+            Params={
+                "Bucket": default_storage.bucket_name,
+                "Key": _s3_key(session.storage_key),
+                "UploadId": session.s3_upload_id,
+                "PartNumber": n,
+            },
+            ExpiresIn=expires,
+        )
+        out.append({"part": n, "url": url, "size": session.expected_part_size(n)})
+    return out
+
+
+def _s3_parts(session: UploadSession) -> Dict[int, Dict]:
+    parts: Dict[int, Dict] = {}
+    kwargs = {
+        "Bucket": default_storage.bucket_name,
+        "Key": _s3_key(session.storage_key),
+        "UploadId": session.s3_upload_id,
+    }
+    while True:
+        resp = _s3_client().list_parts(**kwargs)
+        for p in resp.get("Parts", []):
+            parts[p["PartNumber"]] = {"size": p["Size"], "etag": p["ETag"]}
+        if not resp.get("IsTruncated"):
+            return parts
+        kwargs["PartNumberMarker"] = resp["NextPartNumberMarker"]
+
+
+def received_parts(session: UploadSession) -> Dict[int, Dict]:
+    if session.backend == UploadSession.Backend.S3 and session.status == UploadSession.Status.PENDING:
+        return _s3_parts(session)
+    return {int(k): v for k, v in session.parts.items()}
+
+
+def describe(session: UploadSession) -> Dict:
+    """Session state for clients, including what is still missing (for resume)."""
+    received = received_parts(session)
+    missing = [n for n in range(1, session.part_count + 1) if n not in received]
+    out = {
+        "id": str(session.id),
+        "status": session.status,
+        "backend": session.backend,
+        "size_bytes": session.size_bytes,
+        "part_size": session.part_size,
+        "part_count": session.part_count,
+        "received_parts": sorted(received),
+        "missing_parts": missing,
+        "expires_at": session.expires_at,
+        "document_id": str(session.document_id) if session.document_id else None,
+    }
+    if session.backend == UploadSession.Backend.S3 and session.status == UploadSession.Status.PENDING:
+        out["part_urls"] = presign_parts(session, missing)
+    return out
+
+
+def complete(session: UploadSession) -> Document:
+    with transaction.atomic():
+        # a concurrent complete() waits here and then finds the session COMPLETE
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        _check_open(session)
+        received = received_parts(session)
+        missing = [n for n in range(1, session.part_count + 1) if n not in received]
+        if missing:
+            raise UploadError(f"Missing parts: {missing}")
+        for n, part in received.items():
+            if part["size"] != session.expected_part_size(n):
+                raise UploadError(f"Part {n} has the wrong size.")
+
+        if session.backend == UploadSession.Backend.S3:
+            _s3_client().complete_multipart_upload(
+                Bucket=default_storage.bucket_name,
+                Key=_s3_key(session.storage_key),
+                UploadId=session.s3_upload_id,
+                MultipartUpload={
+                    "Parts": [{"PartNumber": n, "ETag": received[n]["etag"]} for n in sorted(received)]
+                },
+            )
+            key, sha = session.storage_key, ""
+        else:
+            def assembled() -> Iterator[bytes]:
+                for n in range(1, session.part_count + 1):
+                    with default_storage.open(received[n]["name"], "rb") as f:
+                        yield from f.chunks(_READ_CHUNK)
+
+            default_storage.delete(session.storage_key)
+            key, sha, _ = store(session.storage_key, assembled(), limit=session.size_bytes)
+            transaction.on_commit(lambda: _delete_parts(session))
+
+        doc = create_document(session.organization, session.name, session.file_type, session.size_bytes, key, sha)
+        session.status = UploadSession.Status.COMPLETE
+        session.document = doc
+        session.storage_key = key
+        session.save(update_fields=["status", "document", "storage_key"])
+    return doc
+
+
+def abort(session: UploadSession) -> None:
+    with transaction.atomic():
+        # not while complete() is assembling the parts
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status != UploadSession.Status.PENDING:
+            return
+        session.status = UploadSession.Status.ABORTED
+        session.save(update_fields=["status"])
+    if session.backend == UploadSession.Backend.S3:
+        try:
+            _s3_client().abort_multipart_upload(
+                Bucket=default_storage.bucket_name,
+                Key=_s3_key(session.storage_key),
+                UploadId=session.s3_upload_id,
+            )
+        except Exception:
+            log.warning("upload %s: could not abort S3 multipart upload", session.id, exc_info=True)
+    else:
+        _delete_parts(session)
+
+
+def _delete_parts(session: UploadSession) -> None:
+    names = {p["name"] for p in session.parts.values() if p.get("name")}
+    names.update(_part_key(session, n) for n in range(1, session.part_count + 1))
+    for name in names:
+        default_storage.delete(name)
+
+
+def purge_expired() -> int:
+    n = 0
+    for session in UploadSession.objects.filter(status=UploadSession.Status.PENDING, expires_at__lte=timezone.now()):
+        abort(session)
+        n += 1
+    return n
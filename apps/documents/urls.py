@@ -3,11 +3,25 @@ from django.urls import path
 from apps.documents.views import (
     DocumentDetailView,
     DocumentListCreateView,
+    DocumentProgressStreamView,
     DocumentReprocessView,
+    DocumentStatusView,
+    IngestBacklogView,
+    UploadCompleteView,
+    UploadPartView,
+    UploadSessionCreateView,
+    UploadSessionDetailView,
 )
 
 urlpatterns = [
     path("documents", DocumentListCreateView.as_view()),
     path("documents/<uuid:pk>", DocumentDetailView.as_view()),
     path("documents/<uuid:pk>/reprocess", DocumentReprocessView.as_view()),
+    path("documents/status", DocumentStatusView.as_view()),
+    path("documents/progress/stream", DocumentProgressStreamView.as_view()),
+    path("documents/ingest/backlog", IngestBacklogView.as_view()),
+    path("documents/uploads", UploadSessionCreateView.as_view()),
+    path("documents/uploads/<uuid:pk>", UploadSessionDetailView.as_view()),
+    path("documents/uploads/<uuid:pk>/parts/<int:number>", UploadPartView.as_view()),
+    path("documents/uploads/<uuid:pk>/complete", UploadCompleteView.as_view()),
 ]
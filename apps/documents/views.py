@@ -1,11 +1,17 @@
+import uuid
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from rest_framework import generics, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from apps.documents.models import Document
+from apps.documents import progress, scheduler, uploads
+from apps.documents.models import Document, UploadSession
 from common.security.permissions import ReadOnlyOrOwnerAdmin
 from common.security.throttles import DocumentsRateThrottle
-from apps.documents.serializers import DocumentSerializer, DocumentUploadSerializer
-from apps.documents.tasks import process_document
+from apps.documents.serializers import DocumentSerializer, DocumentUploadSerializer, UploadSessionCreateSerializer
+from apps.documents.tasks import enqueue_processing
 
 class DocumentListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -33,7 +39,196 @@ class DocumentReprocessView(APIView):
         except Document.DoesNotExist:
             return Response({"detail": "Document not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        doc.status = Document.Status.PROCESSING
-        doc.save(update_fields=["status"])
-        process_document.delay(str(doc.id))
-        return Response(status=status.HTTP_202_ACCEPTED)
+        # "incremental" (default) re-embeds only changed chunks; "full" re-embeds everything
+        mode = request.data.get("mode", "incremental")
+        if mode not in ("incremental", "full"):
+            return Response({"detail": "mode must be 'incremental' or 'full'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # one run per document: a second would re-dispatch the first one's slices
+        claimed = (
+            Document.objects.filter(pk=doc.pk)
+            .exclude(status=Document.Status.PROCESSING)
+            .update(status=Document.Status.PROCESSING)
+        )
+        if not claimed:
+            return Response({"detail": "Document is already being processed."}, status=status.HTTP_409_CONFLICT)
+        progress.set_status(doc.id, doc.organization_id, Document.Status.PROCESSING)
+        enqueue_processing(doc, mode=mode)
+        return Response({"mode": mode}, status=status.HTTP_202_ACCEPTED)
+
+
+def _requested_ids(request):
+    """Document ids from ?ids=a,b,c (or a JSON body {"ids": [...]}); None if invalid."""
+    raw = request.query_params.get("ids")
+    ids = raw.split(",") if raw else request.data.get("ids") if hasattr(request.data, "get") else None
+    if not ids or not isinstance(ids, list) or len(ids) > int(settings.INGEST_PROGRESS_MAX_IDS):
+        return None
+    try:
+        return list(dict.fromkeys(str(uuid.UUID(str(i).strip())) for i in ids))
+    except ValueError:
+        return None
+
+
+def _owned_status(request, ids):
+    org = getattr(request, "organization", None) or request.user.organization
+    rows = Document.objects.filter(id__in=ids, organization=org).values_list("id", "status")
+    return org, {str(doc_id): doc_status for doc_id, doc_status in rows}
+
+
+class DocumentStatusView(APIView):
+    """
+    GET /documents/status?ids=<id>,<id>,...  (or POST {"ids": [...]})
+    Status and ingest progress of up to INGEST_PROGRESS_MAX_IDS documents in
+    one call: a single indexed lookup, no pagination, count or serializer.
+    Unknown ids are left out.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        ids = _requested_ids(request)
+        if ids is None:
+            return Response(
+                {"detail": f"ids must list 1-{settings.INGEST_PROGRESS_MAX_IDS} document ids."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        _, owned = _owned_status(request, ids)
+        snap = progress.snapshot(list(owned))
+        return Response({
+            "documents": {
+                doc_id: {"status": doc_status, "progress": snap.get(doc_id)}
+                for doc_id, doc_status in owned.items()
+            }
+        })
+
+    post = get
+
+
+class DocumentProgressStreamView(APIView):
+    """
+    GET /documents/progress/stream?ids=<id>,<id>,...  (SSE)
+    One "progress" event per update of the listed documents, starting with
+    their current state; ends with [DONE] once all are ready or failed.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        ids = _requested_ids(request)
+        if ids is None:
+            return Response(
+                {"detail": f"ids must list 1-{settings.INGEST_PROGRESS_MAX_IDS} document ids."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        org, owned = _owned_status(request, ids)
+        if not owned:
+            return Response({"detail": "Document not found."}, status=status.HTTP_404_NOT_FOUND)
+        if isinstance(request._request, ASGIRequest):
+            body = progress.astream(org.id, owned)
+        else:
+            body = progress.stream(org.id, owned)
+        resp = StreamingHttpResponse(body, content_type="text/event-stream")
+        resp["Cache-Control"] = "no-cache"
+        resp["X-Accel-Buffering"] = "no"
+        return resp
+
+
+class IngestBacklogView(APIView):
+    """GET /documents/ingest/backlog: this org's documents waiting in / running from the scheduler."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        org = getattr(request, "organization", None) or request.user.organization
+        data = scheduler.backlog(org.id)
+        if data is None:
+            return Response({"detail": "Scheduler unavailable."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(data)
+
+
+class _UploadSessionMixin:
+    def get_session(self, request, pk):
+        org = getattr(request, "organization", None) or request.user.organization
+        try:
+            return UploadSession.objects.get(id=pk, organization=org)
+        except UploadSession.DoesNotExist:
+            return None
+
+
+class UploadSessionCreateView(APIView):
+    """
+    POST /documents/uploads  {name, filename, size_bytes, direct?}
+    Starts a multipart upload; see apps.documents.uploads for the protocol.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [DocumentsRateThrottle]
+
+    def post(self, request):
+        s = UploadSessionCreateSerializer(data=request.data)
+        s.is_valid(raise_exception=True)
+        org = getattr(request, "organization", None) or request.user.organization
+        try:
+            session = uploads.create_session(
+                org,
+                name=s.validated_data["name"],
+                filename=s.validated_data["filename"],
+                file_type=s.validated_data["ext"],
+                size_bytes=s.validated_data["size_bytes"],
+                direct=s.validated_data["direct"],
+            )
+        except uploads.UploadError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(uploads.describe(session), status=status.HTTP_201_CREATED)
+
+
+class UploadSessionDetailView(_UploadSessionMixin, APIView):
+    """
+    GET    /documents/uploads/<id>  received/missing parts (and fresh part URLs for direct uploads)
+    DELETE /documents/uploads/<id>  abort and discard received parts
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        session = self.get_session(request, pk)
+        if session is None:
+            return Response({"detail": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(uploads.describe(session))
+
+    def delete(self, request, pk):
+        session = self.get_session(request, pk)
+        if session is None:
+            return Response({"detail": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+        uploads.abort(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadPartView(_UploadSessionMixin, APIView):
+    """
+    PUT /documents/uploads/<id>/parts/<n>  raw part bytes (application/octet-stream)
+    The body is streamed to storage, never parsed; re-sending a part replaces it.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def put(self, request, pk, number):
+        session = self.get_session(request, pk)
+        if session is None:
+            return Response({"detail": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+        length = request.META.get("CONTENT_LENGTH")
+        try:
+            part = uploads.put_part(session, number, request._request, int(length) if length else None)
+        except uploads.UploadError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(part)
+
+
+class UploadCompleteView(_UploadSessionMixin, APIView):
+    """POST /documents/uploads/<id>/complete  assemble parts, create the Document and queue ingest."""
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [DocumentsRateThrottle]
+
+    def post(self, request, pk):
+        session = self.get_session(request, pk)
+        if session is None:
+            return Response({"detail": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            doc = uploads.complete(session)
+        except uploads.UploadError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(DocumentSerializer(doc).data, status=status.HTTP_201_CREATED)
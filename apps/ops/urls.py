@@ -1,7 +1,8 @@
 from django.urls import path
-from apps.ops.views import HealthzView, ReadyzView
+from apps.ops.views import HealthzView, MetricsView, ReadyzView
 
 urlpatterns = [
     path("healthz", HealthzView.as_view(), name="healthz"),
     path("readyz", ReadyzView.as_view(), name="readyz"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
\ No newline at end of file
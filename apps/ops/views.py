@@ -1,12 +1,14 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 
 from django.db import connections
 from django.conf import settings
 
 from apps.chatbot_provider.models import ChatbotProvider
+from apps.documents import dedupe, scheduler
+from common.llm import embedding_cache
 
 import redis
 from celery import current_app
@@ -78,3 +80,32 @@ class ReadyzView(APIView):
             "celery": celery_status,
             "provider": provider_status
         }, status=status.HTTP_200_OK)
+
+
+
+def _queue_depths():
+    """Messages waiting per Celery queue (all priority levels), or None if the broker is down."""
+    names = {settings.CELERY_TASK_DEFAULT_QUEUE}
+    names.update(route["queue"] for route in settings.CELERY_TASK_ROUTES.values())
+    try:
+        with current_app.connection_for_read() as conn:
+            channel = conn.default_channel
+            return {
+                name: channel.queue_declare(queue=name, passive=True).message_count
+                for name in sorted(names)
+            }
+    except Exception:
+        return None
+
+
+class MetricsView(APIView):
+    """Internal performance counters (staff only)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "embedding_cache": embedding_cache.stats(),
+            "document_dedupe": dedupe.stats(),
+            "queues": _queue_depths(),
+            "ingest_scheduler": scheduler.backlog(),
+        }, status=status.HTTP_200_OK)
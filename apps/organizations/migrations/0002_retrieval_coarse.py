@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("organizations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="organization",
+            name="retrieval_coarse_dims",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="organization",
+            name="retrieval_coarse_factor",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
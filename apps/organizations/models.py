@@ -5,5 +5,10 @@ class Organization(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100)
     logo_url = models.URLField(blank=True, null=True)
+    # Two-stage (Matryoshka) retrieval: dims of the truncated coarse vector
+    # (0 = off, null = RETRIEVAL_COARSE_DIMS) and candidates per result
+    # rescored at full precision (null = RETRIEVAL_COARSE_FACTOR)
+    retrieval_coarse_dims = models.PositiveSmallIntegerField(null=True, blank=True)
+    retrieval_coarse_factor = models.PositiveSmallIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
\ No newline at end of file
@@ -1,7 +1,17 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import Organization
 
 class UpdateOrganizationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Organization
-        fields = ["name", "logo_url"]
+        fields = ["name", "logo_url", "retrieval_coarse_dims", "retrieval_coarse_factor"]
+    def validate_retrieval_coarse_dims(self, value):
+        # each size needs its own index (`ann_index build --dims N`)
+        if value and value not in settings.RETRIEVAL_COARSE_DIMS_CHOICES:
+            raise serializers.ValidationError(f"Must be 0 or one of {settings.RETRIEVAL_COARSE_DIMS_CHOICES}.")
+        return value
+    def validate_retrieval_coarse_factor(self, value):
+        if value is not None and not 1 <= value <= 50:
+            raise serializers.ValidationError("Must be between 1 and 50.")
+        return value
@@ -1,9 +1,15 @@
 from rest_framework import serializers
+from apps.documents.retrieval import MODES
 
 class SearchRequestSerializer(serializers.Serializer):
     query = serializers.CharField(max_length=4000)
     top_k = serializers.IntegerField(required=False, min_value=1, max_value=50, default=8)
     filters = serializers.DictField(required=False)
+    # Per-query ANN knobs; default to ANN_HNSW_EF_SEARCH / ANN_IVFFLAT_PROBES
+    ef_search = serializers.IntegerField(required=False, min_value=1, max_value=1000)
+    probes = serializers.IntegerField(required=False, min_value=1, max_value=1000)
+    # default RETRIEVAL_MODE; see apps.documents.retrieval
+    mode = serializers.ChoiceField(choices=MODES, required=False)
 
 class SearchResultSerializer(serializers.Serializer):
     document_id = serializers.CharField()
@@ -13,3 +19,4 @@ class SearchResultSerializer(serializers.Serializer):
 
 class SearchResponseSerializer(serializers.Serializer):
     results = SearchResultSerializer(many=True)
+    mode = serializers.CharField()  # mode actually used (hybrid may answer lexically)
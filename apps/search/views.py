@@ -3,10 +3,12 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from apps.search.serializers import SearchRequestSerializer, SearchResponseSerializer
 from common.llm.embeddings import get_embedding
-from apps.documents.models import DocumentChunk
+from apps.chat.stages import parallel_stages_enabled, submit_stage
+from apps.documents import retrieval
+from apps.documents.ann import coarse_params
 from common.security.throttles import SearchRateThrottle  # Import SearchRateThrottle
 from drf_spectacular.utils import extend_schema
-from django.db.models import F
+from apps.api_keys.cache import record_usage
 
 @extend_schema(
     request=SearchRequestSerializer, responses={200: SearchResponseSerializer}
@@ -23,25 +25,27 @@ class SearchView(APIView):
             return Response({"detail": "No organization context"}, status=403)
         s = SearchRequestSerializer(data=request.data)
         s.is_valid(raise_exception=True)
-        qvec = get_embedding(s.validated_data["query"])
-        qs = (
-            DocumentChunk.objects.filter(document__organization_id=org.id)
-            .extra(select={"score": "1 - (embedding <=> %s)"}, select_params=[qvec])
-            .order_by("-score")
-        )
-        filters = s.validated_data.get("filters") or {}
-        if ids := filters.get("document_ids"):
-            qs = qs.filter(document_id__in=ids)
-        if fts := filters.get("file_types"):
-            qs = qs.filter(document__file_type__in=fts)
-        rows = list(
-            qs.values("document_id", "chunk_index", "content", "score")[
-                : s.validated_data["top_k"]
-            ]
+        data = s.validated_data
+        query = data["query"]
+        mode = retrieval.resolve_mode(data.get("mode"))
+        # the embedding round trip overlaps the lexical query in hybrid mode
+        fut = None
+        if parallel_stages_enabled() and retrieval.needs_embedding(mode, query):
+            fut = submit_stage(get_embedding, query)
+        dims, factor = coarse_params(org)
+        rows, used = retrieval.retrieve(
+            org.id,
+            query,
+            data["top_k"],
+            data.get("filters"),
+            mode=mode,
+            embed=fut.result if fut is not None else (lambda: get_embedding(query)),
+            ef_search=data.get("ef_search"),
+            probes=data.get("probes"),
+            coarse_dims=dims,
+            coarse_factor=factor,
         )
         api_key = getattr(request, "auth_api_key", None)
         if api_key:
-            type(api_key).objects.filter(pk=api_key.pk).update(
-                usage_count=F("usage_count") + 1
-            )
-        return Response({"results": rows})
+            record_usage(api_key)
+        return Response({"results": rows, "mode": used})
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Iterable, List, Tuple
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
 
 class ChatClient(ABC):
     model: str
@@ -16,3 +16,11 @@ class ChatClient(ABC):
     @abstractmethod
     def stream(self, *, messages: List[Dict], max_tokens: int, temperature: float, timeout_s: int) -> Iterable[str]:
         """Yield deltas (string fragments)."""
+
+    @abstractmethod
+    async def achat(self, *, messages: List[Dict], max_tokens: int, temperature: float, timeout_s: int) -> Tuple[str, Dict, str]:
+        """Async chat(); must not block the event loop."""
+
+    @abstractmethod
+    def astream(self, *, messages: List[Dict], max_tokens: int, temperature: float, timeout_s: int) -> AsyncIterator[str]:
+        """Async generator twin of stream()."""
@@ -1,36 +1,50 @@
-import json
-from typing import Dict, Iterable, List, Tuple
+from contextlib import closing
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
 from .base import ChatClient
-from common.utils.http import post_json_resilient, stream_post_sse_resilient
+from common.utils.http import apost_json_resilient, astream_post_sse_resilient, post_json_resilient, stream_post_sse_resilient
+from common.utils.sse import aiter_sse_json, iter_sse_json
 
 _DEEPSEEK_BASE = "https://api.deepseek.com"
 
 class DeepSeekChat(ChatClient):
     def chat(self, *, messages: List[Dict], max_tokens: int, temperature: float, timeout_s: int) -> Tuple[str, Dict, str]:
-        url = f"{_DEEPSEEK_BASE}/chat/completions"
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-        payload = {"model": self.model, "messages": messages, "max_tokens": int(max_tokens), "temperature": float(temperature), "stream": False}
+        url, headers, payload = self._request(messages, max_tokens, temperature, stream=False)
         data = post_json_resilient(f"deepseek:{self.model}", url, headers, payload, timeout_s).json()
-        answer = _get_choice_message_content(data)
-        usage = data.get("usage", {}) or {}
-        return answer, usage, data.get("model", self.model)
+        return self._parse(data)
 
     def stream(self, *, messages: List[Dict], max_tokens: int, temperature: float, timeout_s: int) -> Iterable[str]:
-        url = f"{_DEEPSEEK_BASE}/chat/completions"
-        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
-        payload = {"model": self.model, "messages": messages, "max_tokens": int(max_tokens), "temperature": float(temperature), "stream": True}
-        client, resp = stream_post_sse_resilient(f"deepseek:{self.model}", url, headers, {}, payload, timeout_s)
-        with client, resp:
-            for line in resp.iter_lines():
-                if not line: continue
-                if isinstance(line, bytes): line = line.decode("utf-8", "ignore")
-                if not line.startswith("data:"): continue
-                datum = line[5:].strip()
-                if not datum or datum == "[DONE]": break
-                try: chunk = json.loads(datum)
-                except Exception: continue
+        url, headers, payload = self._request(messages, max_tokens, temperature, stream=True)
+        resp = stream_post_sse_resilient(f"deepseek:{self.model}", url, headers, {}, payload, timeout_s)
+        with closing(resp):
+            for chunk in iter_sse_json(resp.iter_lines()):
+                delta = _get_choice_delta_content(chunk)
+                if delta: yield delta
+
+    async def achat(self, *, messages: List[Dict], max_tokens: int, temperature: float, timeout_s: int) -> Tuple[str, Dict, str]:
+        url, headers, payload = self._request(messages, max_tokens, temperature, stream=False)
+        data = (await apost_json_resilient(f"deepseek:{self.model}", url, headers, payload, timeout_s)).json()
+        return self._parse(data)
+
+    async def astream(self, *, messages: List[Dict], max_tokens: int, temperature: float, timeout_s: int) -> AsyncIterator[str]:
+        url, headers, payload = self._request(messages, max_tokens, temperature, stream=True)
+        resp = await astream_post_sse_resilient(f"deepseek:{self.model}", url, headers, {}, payload, timeout_s)
+        try:
+            async for chunk in aiter_sse_json(resp.aiter_lines()):
                 delta = _get_choice_delta_content(chunk)
                 if delta: yield delta
+        finally:
+            await resp.aclose()
+
+    def _request(self, messages: List[Dict], max_tokens: int, temperature: float, *, stream: bool) -> Tuple[str, Dict, Dict]:
+        url = f"{_DEEPSEEK_BASE}/chat/completions"
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        payload = {"model": self.model, "messages": messages, "max_tokens": int(max_tokens), "temperature": float(temperature), "stream": stream}
+        return url, headers, payload
+
+    def _parse(self, data: Dict) -> Tuple[str, Dict, str]:
+        answer = _get_choice_message_content(data)
+        usage = data.get("usage", {}) or {}
+        return answer, usage, data.get("model", self.model)
 
 def _get_choice_message_content(data: Dict) -> str:
     try:
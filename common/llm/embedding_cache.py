@@ -0,0 +1,226 @@
+"""
+Content-addressed cache in front of the embedding provider.
+
+Key = sha256(provider, model, dimension, normalized text), so a change of
+EMBEDDING_MODEL/EMBEDDING_DIM lands in a fresh key space and can never
+serve vectors produced by a different model.
+
+Tiers:
+  1. in-process LRU (bounded entry count, per worker)
+  2. Redis (TTL per entry + size bound enforced through a recency ZSET)
+
+Vectors are stored as packed float32 bytes (4 bytes/dim, same precision
+pgvector keeps). Redis errors degrade to a miss; they never fail a request.
+"""
+import hashlib
+import logging
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import redis
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+_PREFIX = "emb:v1:"
+_RECENCY_KEY = "emb:v1:recency"
+_STATS_KEY = "emb:v1:stats"
+
+_r = None
+
+
+def _rds():
+    global _r
+    if _r is None:
+        url = getattr(settings, "EMBEDDING_CACHE_REDIS_URL", None) or getattr(
+            settings, "IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"
+        )
+        _r = redis.from_url(url)
+    return _r
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "EMBEDDING_CACHE_ENABLED", True))
+
+
+def namespace(model: str) -> Tuple[str, str, int]:
+    provider = getattr(settings, "EMBEDDING_PROVIDER", "openai")
+    dim = int(getattr(settings, "EMBEDDING_DIM", 1536))
+    return provider, model, dim
+
+
+def normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_key(ns: Tuple[str, str, int], text: str) -> str:
+    provider, model, dim = ns
+    raw = f"{provider}\x00{model}\x00{dim}\x00{normalize(text)}".encode("utf-8")
+    return _PREFIX + hashlib.sha256(raw).hexdigest()
+
+
+def pack(vec: Sequence[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def unpack(blob: bytes, dim: int) -> Optional[List[float]]:
+    if len(blob) != dim * 4:
+        return None
+    a = array("f")
+    a.frombytes(blob)
+    return a.tolist()
+
+
+class _LRU:
+    def __init__(self):
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            blob = self._data.get(key)
+            if blob is not None:
+                self._data.move_to_end(key)
+            return blob
+
+    def set(self, key: str, blob: bytes) -> None:
+        cap = int(getattr(settings, "EMBEDDING_CACHE_LOCAL_MAX", 2048))
+        if cap <= 0:
+            return
+        with self._lock:
+            self._data[key] = blob
+            self._data.move_to_end(key)
+            while len(self._data) > cap:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_local = _LRU()
+_counters = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(**deltas: int) -> None:
+    with _counters_lock:
+        for k, v in deltas.items():
+            _counters[k] += v
+    try:
+        p = _rds().pipeline(transaction=False)
+        for k, v in deltas.items():
+            if v:
+                p.hincrby(_STATS_KEY, k, v)
+        p.execute()
+    except redis.RedisError:
+        pass
+
+
+def get_many(ns: Tuple[str, str, int], texts: Iterable[str]) -> Dict[str, List[float]]:
+    """Return {text: vector} for every text found in either tier."""
+    dim = ns[2]
+    found: Dict[str, List[float]] = {}
+    pending: Dict[str, str] = {}
+    local_hits = 0
+    for t in texts:
+        key = make_key(ns, t)
+        blob = _local.get(key)
+        vec = unpack(blob, dim) if blob is not None else None
+        if vec is not None:
+            found[t] = vec
+            local_hits += 1
+        else:
+            pending[key] = t
+
+    redis_hits = 0
+    if pending:
+        keys = list(pending)
+        try:
+            blobs = _rds().mget(keys)
+            now = time.time()
+            p = _rds().pipeline(transaction=False)
+            for key, blob in zip(keys, blobs):
+                vec = unpack(blob, dim) if blob is not None else None
+                if vec is None:
+                    continue
+                found[pending[key]] = vec
+                _local.set(key, blob)
+                p.zadd(_RECENCY_KEY, {key: now}, xx=True)
+                redis_hits += 1
+            if redis_hits:
+                p.execute()
+        except redis.RedisError:
+            log.debug("embedding cache: redis unavailable on read", exc_info=True)
+
+    misses = len(pending) - redis_hits
+    _count(local_hits=local_hits, redis_hits=redis_hits, misses=misses)
+    return found
+
+
+def set_many(ns: Tuple[str, str, int], items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+    ttl = int(getattr(settings, "EMBEDDING_CACHE_TTL_S", 7 * 24 * 3600))
+    cap = int(getattr(settings, "EMBEDDING_CACHE_REDIS_MAX", 200_000))
+    now = time.time()
+    rows = []
+    for text, vec in items:
+        key = make_key(ns, text)
+        blob = pack(vec)
+        _local.set(key, blob)
+        rows.append((key, blob))
+    if not rows:
+        return
+    try:
+        r = _rds()
+        p = r.pipeline(transaction=False)
+        for key, blob in rows:
+            p.set(key, blob, ex=ttl)
+            p.zadd(_RECENCY_KEY, {key: now})
+        p.zcard(_RECENCY_KEY)
+        size = p.execute()[-1]
+        if size > cap:
+            _evict(r, now - ttl)
+    except redis.RedisError:
+        log.debug("embedding cache: redis unavailable on write", exc_info=True)
+
+
+def _evict(r, expired_before: float) -> None:
+    # drop recency entries whose payload already expired, then oldest-first
+    r.zremrangebyscore(_RECENCY_KEY, "-inf", expired_before)
+    size = r.zcard(_RECENCY_KEY)
+    cap = int(getattr(settings, "EMBEDDING_CACHE_REDIS_MAX", 200_000))
+    if size <= cap:
+        return
+    victims = [k for k, _ in r.zpopmin(_RECENCY_KEY, size - cap)]
+    if victims:
+        r.delete(*victims)
+
+
+def stats() -> Dict:
+    with _counters_lock:
+        local = dict(_counters)
+    lookups = sum(local.values())
+    out = {
+        "process": {**local, "hit_rate": _rate(local, lookups), "local_entries": len(_local)},
+    }
+    try:
+        r = _rds()
+        shared = {k.decode(): int(v) for k, v in (r.hgetall(_STATS_KEY) or {}).items()}
+        total = sum(shared.values())
+        out["cluster"] = {**shared, "hit_rate": _rate(shared, total), "redis_entries": r.zcard(_RECENCY_KEY)}
+    except redis.RedisError:
+        out["cluster"] = None
+    return out
+
+
+def _rate(c: Dict, total: int) -> float:
+    if not total:
+        return 0.0
+    return round((c.get("local_hits", 0) + c.get("redis_hits", 0)) / total, 4)
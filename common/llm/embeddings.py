@@ -1,24 +1,110 @@
-import httpx
-from typing import List
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Sequence, Tuple
 from django.conf import settings
+from common.utils import transport
+from . import embedding_cache, rate_limit
+from .tokens import count_tokens
+
+# OpenAI hard limits per /v1/embeddings request
+_OPENAI_MAX_ITEMS = 2048
+_OPENAI_MAX_TOKENS = 300_000
+
+def unit_vector(vec: Sequence[float]) -> List[float]:
+    """`vec` scaled to length 1 (so inner product == cosine similarity)."""
+    norm = math.sqrt(math.fsum(x * x for x in vec))
+    if not norm or abs(norm - 1.0) < 1e-6:
+        return list(vec)
+    return [x / norm for x in vec]
 
 def get_embedding(text: str) -> List[float]:
+    return get_embeddings([text])[0]
+
+def get_embeddings(texts: Sequence[str], background: bool = False) -> List[List[float]]:
+    """
+    Embed many texts with as few provider round trips as possible.
+    Cached vectors are served from common.llm.embedding_cache; identical
+    inputs are sent once, batches are packed by item and token count and run
+    concurrently (EMBEDDING_MAX_CONCURRENCY). Output order matches input order.
+    Every request is charged to the shared TPM budget (common.llm.rate_limit);
+    background callers wait for it, interactive ones do not.
+    """
     provider = getattr(settings, "EMBEDDING_PROVIDER", "openai")
-    if provider == "openai":
-        return _openai_embed(text)
-    raise RuntimeError(f"Unsupported embedding provider: {provider}")
+    if provider != "openai":
+        raise RuntimeError(f"Unsupported embedding provider: {provider}")
+    if not texts:
+        return []
 
-def _openai_embed(text: str) -> List[float]:
+    # Snapshot the model once: vectors are requested from and cached under
+    # the same model even if settings change mid-call.
     model = getattr(settings, "EMBEDDING_MODEL", "text-embedding-3-small")
+    ns = embedding_cache.namespace(model)
+    use_cache = embedding_cache.enabled()
+
+    # coalesce duplicates
+    uniq_texts = list(dict.fromkeys(texts))
+    found = embedding_cache.get_many(ns, uniq_texts) if use_cache else {}
+    missing = [t for t in uniq_texts if t not in found]
+
+    if missing:
+        fetched = _embed_uncached(missing, model, background)
+        found.update(zip(missing, fetched))
+        if use_cache:
+            embedding_cache.set_many(ns, zip(missing, fetched))
+
+    return [found[t] for t in texts]
+
+def _embed_uncached(texts: List[str], model: str, background: bool = False) -> List[List[float]]:
+    max_items = min(int(getattr(settings, "EMBEDDING_BATCH_MAX_ITEMS", 512)), _OPENAI_MAX_ITEMS)
+    max_tokens = min(int(getattr(settings, "EMBEDDING_BATCH_MAX_TOKENS", 250_000)), _OPENAI_MAX_TOKENS)
+    batches = _pack_batches(texts, model, max_items, max_tokens)
+
+    vectors: List[List[float]] = [None] * len(texts)  # type: ignore[list-item]
+
+    def run(item) -> None:
+        batch, tokens = item
+        rate_limit.acquire(tokens, wait=background)
+        embs = _openai_embed([texts[i] for i in batch], model)
+        for i, emb in zip(batch, embs):
+            vectors[i] = emb
+
+    workers = max(1, min(int(getattr(settings, "EMBEDDING_MAX_CONCURRENCY", 4)), len(batches)))
+    if workers == 1:
+        for b in batches:
+            run(b)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+            # list() re-raises the first batch failure
+            list(pool.map(run, batches))
+    return vectors
+
+def _pack_batches(texts: List[str], model: str, max_items: int, max_tokens: int) -> List[Tuple[List[int], int]]:
+    """Greedy packing of text indices into (indices, tokens) batches under both limits."""
+    batches: List[Tuple[List[int], int]] = []
+    cur: List[int] = []
+    cur_tokens = 0
+    for i, t in enumerate(texts):
+        n = count_tokens(t, model)
+        if cur and (len(cur) >= max_items or cur_tokens + n > max_tokens):
+            batches.append((cur, cur_tokens))
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        batches.append((cur, cur_tokens))
+    return batches
+
+def _openai_embed(texts: List[str], model: str) -> List[List[float]]:
     api_key = _require_env("OPENAI_API_KEY")
     url = "https://api.openai.com/v1/embeddings"
     headers = {"Authorization": f"Bearer {api_key}"}
-    payload = {"model": model, "input": text}
-    with httpx.Client(timeout=30) as client:
-        r = client.post(url, headers=headers, json=payload)
-        r.raise_for_status()
-        data = r.json()
-    return data["data"][0]["embedding"]
+    payload = {"model": model, "input": texts}
+    r = transport.get_client(url).post(url, headers=headers, json=payload, timeout=60)
+    r.raise_for_status()
+    data = r.json()
+    # API returns one item per input carrying its position
+    items = sorted(data["data"], key=lambda d: d["index"])
+    return [d["embedding"] for d in items]
 
 def _require_env(name: str) -> str:
     import os
@@ -1,6 +1,13 @@
-from typing import Dict, Iterable, List, Tuple
+from contextlib import closing
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
 from .base import ChatClient
-from common.utils.http import post_json_resilient, stream_post_sse_resilient
+from common.utils.http import (
+    apost_json_resilient,
+    astream_post_sse_resilient,
+    post_json_resilient,
+    stream_post_sse_resilient,
+)
+from common.utils.sse import aiter_sse_json, iter_sse_json
 
 _GEMINI_BASE = "https://generativelanguage.googleapis.com/v1beta"
 
@@ -15,10 +22,9 @@ class GeminiChat(ChatClient):
         timeout_s: int,
     ) -> Tuple[str, Dict, str]:
         url = f"{_GEMINI_BASE}/models/{self.model}:generateContent"
-        headers = {"x-goog-api-key": self.api_key, "Content-Type": "application/json"}
         payload = self._build_payload(messages, max_tokens, temperature)
         data = post_json_resilient(
-            f"gemini:{self.model}", url, headers, payload, timeout_s
+            f"gemini:{self.model}", url, self._headers(), payload, timeout_s
         ).json()
         text = _extract_text_from_response(data)
         usage = _extract_usage_from_response(data)
@@ -33,32 +39,57 @@ class GeminiChat(ChatClient):
         timeout_s: int,
     ) -> Iterable[str]:
         url = f"{_GEMINI_BASE}/models/{self.model}:streamGenerateContent"
-        headers = {"x-goog-api-key": self.api_key, "Content-Type": "application/json"}
         params = {"alt": "sse"}
         payload = self._build_payload(messages, max_tokens, temperature)
-        client, resp = stream_post_sse_resilient(
-            f"gemini:{self.model}", url, headers, params, payload, timeout_s
+        resp = stream_post_sse_resilient(
+            f"gemini:{self.model}", url, self._headers(), params, payload, timeout_s
         )
-        import json as _json
+        with closing(resp):
+            for obj in iter_sse_json(resp.iter_lines()):
+                delta = _extract_text_from_response(obj)
+                if delta:
+                    yield delta
 
-        with client, resp:
-            for raw in resp.iter_lines():
-                if not raw:
-                    continue
-                if isinstance(raw, bytes):
-                    raw = raw.decode("utf-8", "ignore")
-                if not raw.startswith("data:"):
-                    continue
-                datum = raw[5:].strip()
-                if datum in ("[DONE]", ""):
-                    break
-                try:
-                    obj = _json.loads(datum)
-                except Exception:
-                    continue
+    async def achat(
+        self,
+        *,
+        messages: List[Dict],
+        max_tokens: int,
+        temperature: float,
+        timeout_s: int,
+    ) -> Tuple[str, Dict, str]:
+        url = f"{_GEMINI_BASE}/models/{self.model}:generateContent"
+        payload = self._build_payload(messages, max_tokens, temperature)
+        resp = await apost_json_resilient(
+            f"gemini:{self.model}", url, self._headers(), payload, timeout_s
+        )
+        data = resp.json()
+        return _extract_text_from_response(data), _extract_usage_from_response(data), self.model
+
+    async def astream(
+        self,
+        *,
+        messages: List[Dict],
+        max_tokens: int,
+        temperature: float,
+        timeout_s: int,
+    ) -> AsyncIterator[str]:
+        url = f"{_GEMINI_BASE}/models/{self.model}:streamGenerateContent"
+        params = {"alt": "sse"}
+        payload = self._build_payload(messages, max_tokens, temperature)
+        resp = await astream_post_sse_resilient(
+            f"gemini:{self.model}", url, self._headers(), params, payload, timeout_s
+        )
+        try:
+            async for obj in aiter_sse_json(resp.aiter_lines()):
                 delta = _extract_text_from_response(obj)
                 if delta:
                     yield delta
+        finally:
+            await resp.aclose()
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-goog-api-key": self.api_key, "Content-Type": "application/json"}
 
     def _build_payload(
         self, messages: List[Dict], max_tokens: int, temperature: float
@@ -1,7 +1,13 @@
-import json
-from typing import Dict, Iterable, List, Tuple
+from contextlib import closing
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
 from .base import ChatClient
-from common.utils.http import post_json_resilient, stream_post_sse_resilient
+from common.utils.http import (
+    apost_json_resilient,
+    astream_post_sse_resilient,
+    post_json_resilient,
+    stream_post_sse_resilient,
+)
+from common.utils.sse import aiter_sse_json, iter_sse_json
 
 _DEFAULT_BASE = "https://api.openai.com/v1"
 
@@ -19,25 +25,11 @@ class OpenAIChat(ChatClient):
         temperature: float,
         timeout_s: int,
     ) -> Tuple[str, Dict, str]:
-        url = f"{self.base_url}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "max_tokens": int(max_tokens),
-            "temperature": float(temperature),
-        }
+        url, headers, payload = self._request(messages, max_tokens, temperature, stream=False)
         resp = post_json_resilient(
             f"openai:{self.model}", url, headers, payload, timeout_s
         )
-        data = resp.json()
-        answer = _get_choice_message_content(data)
-        usage = data.get("usage", {}) or {}
-        model_name = data.get("model", self.model)
-        return answer, usage, model_name
+        return self._parse(resp.json())
 
     def stream(
         self,
@@ -47,6 +39,53 @@ class OpenAIChat(ChatClient):
         temperature: float,
         timeout_s: int,
     ) -> Iterable[str]:
+        url, headers, payload = self._request(messages, max_tokens, temperature, stream=True)
+        resp = stream_post_sse_resilient(
+            f"openai:{self.model}", url, headers, {}, payload, timeout_s
+        )
+        with closing(resp):
+            for chunk in iter_sse_json(resp.iter_lines()):
+                delta = _get_choice_delta_content(chunk)
+                if delta:
+                    yield delta
+
+    async def achat(
+        self,
+        *,
+        messages: List[Dict],
+        max_tokens: int,
+        temperature: float,
+        timeout_s: int,
+    ) -> Tuple[str, Dict, str]:
+        url, headers, payload = self._request(messages, max_tokens, temperature, stream=False)
+        resp = await apost_json_resilient(
+            f"openai:{self.model}", url, headers, payload, timeout_s
+        )
+        return self._parse(resp.json())
+
+    async def astream(
+        self,
+        *,
+        messages: List[Dict],
+        max_tokens: int,
+        temperature: float,
+        timeout_s: int,
+    ) -> AsyncIterator[str]:
+        url, headers, payload = self._request(messages, max_tokens, temperature, stream=True)
+        resp = await astream_post_sse_resilient(
+            f"openai:{self.model}", url, headers, {}, payload, timeout_s
+        )
+        try:
+            async for chunk in aiter_sse_json(resp.aiter_lines()):
+                delta = _get_choice_delta_content(chunk)
+                if delta:
+                    yield delta
+        finally:
+            await resp.aclose()
+
+    def _request(
+        self, messages: List[Dict], max_tokens: int, temperature: float, *, stream: bool
+    ) -> Tuple[str, Dict, Dict]:
         url = f"{self.base_url}/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -57,29 +96,16 @@ class OpenAIChat(ChatClient):
             "messages": messages,
             "max_tokens": int(max_tokens),
             "temperature": float(temperature),
-            "stream": True,
         }
-        client, resp = stream_post_sse_resilient(
-            f"openai:{self.model}", url, headers, {}, payload, timeout_s
-        )
-        with client, resp:
-            for line in resp.iter_lines():
-                if not line:
-                    continue
-                if isinstance(line, bytes):
-                    line = line.decode("utf-8", "ignore")
-                if not line.startswith("data:"):
-                    continue
-                datum = line[5:].strip()
-                if datum == "[DONE]" or not datum:
-                    break
-                try:
-                    chunk = json.loads(datum)
-                except Exception:
-                    continue
-                delta = _get_choice_delta_content(chunk)
-                if delta:
-                    yield delta
+        if stream:
+            payload["stream"] = True
+        return url, headers, payload
+
+    def _parse(self, data: Dict) -> Tuple[str, Dict, str]:
+        answer = _get_choice_message_content(data)
+        usage = data.get("usage", {}) or {}
+        model_name = data.get("model", self.model)
+        return answer, usage, model_name
 
 
 def _get_choice_message_content(data: Dict) -> str:
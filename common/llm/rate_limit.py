@@ -0,0 +1,72 @@
+"""
+Shared tokens-per-minute budget for the embedding API key.
+
+A token bucket in Redis (refilled continuously at EMBEDDING_TPM_LIMIT per
+minute, holding at most one minute's worth) is shared by every worker and
+web process. Background callers (ingestion) wait for budget before each
+request; interactive callers (chat queries) are charged but never wait, so
+ingestion backs off around them. EMBEDDING_TPM_LIMIT=0 disables it.
+"""
+import time
+
+import redis
+from django.conf import settings
+
+KEY = "llm:tpm:embeddings"
+
+# returns ms to wait before `n` tokens are available (0 = taken)
+_TAKE_LUA = """
+local rate = tonumber(ARGV[1])
+local n = tonumber(ARGV[2])
+local force = ARGV[3] == '1'
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or rate
+local ts = tonumber(state[2]) or now
+tokens = math.min(rate, tokens + (now - ts) * rate / 60000)
+-- a request bigger than the bucket goes through once the bucket is full
+local need = math.min(n, rate)
+local wait = 0
+if force or tokens >= need then
+  tokens = tokens - n
+else
+  wait = math.ceil((need - tokens) * 60000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 120000)
+return wait
+"""
+
+_r = None
+_script = None
+
+
+def _take(n: int, force: bool) -> int:
+    global _r, _script
+    if _r is None:
+        _r = redis.from_url(getattr(settings, "IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"))
+        _script = _r.register_script(_TAKE_LUA)
+    return int(_script(keys=[KEY], args=[int(settings.EMBEDDING_TPM_LIMIT), n, "1" if force else "0"]))
+
+
+def acquire(tokens: int, wait: bool = True) -> None:
+    """
+    Take `tokens` from the shared budget, sleeping until they are available
+    (wait=True) or just charging them (wait=False). Raises RuntimeError after
+    EMBEDDING_TPM_MAX_WAIT_S so the calling task can retry later. Fails open
+    if Redis is unavailable.
+    """
+    if int(getattr(settings, "EMBEDDING_TPM_LIMIT", 0)) <= 0 or tokens <= 0:
+        return
+    give_up = time.monotonic() + float(settings.EMBEDDING_TPM_MAX_WAIT_S)
+    while True:
+        try:
+            delay_ms = _take(tokens, force=not wait)
+        except redis.RedisError:
+            return
+        if delay_ms <= 0:
+            return
+        if time.monotonic() + delay_ms / 1000 > give_up:
+            raise RuntimeError("Embedding tokens-per-minute budget exhausted")
+        time.sleep(delay_ms / 1000)
@@ -0,0 +1,48 @@
+from functools import lru_cache
+from typing import List, Optional
+
+import tiktoken
+
+_FALLBACK_ENCODING = "cl100k_base"
+# ~4 chars/token when the BPE files are unavailable (offline worker)
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=16)
+def get_encoding(model: str | None = None) -> "tiktoken.Encoding":
+    """Cached tiktoken encoder for a model name (cl100k_base if unknown)."""
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            pass
+    return tiktoken.get_encoding(_FALLBACK_ENCODING)
+
+
+@lru_cache(maxsize=16)
+def try_get_encoding(model: str | None = None) -> Optional["tiktoken.Encoding"]:
+    """get_encoding(), or None if it cannot be loaded. The failure is cached too."""
+    try:
+        return get_encoding(model)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    enc = try_get_encoding(model)
+    if enc is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def split_tokens(text: str, max_tokens: int, overlap: int = 0, model: str | None = None) -> List[str]:
+    """Cut `text` into windows of at most `max_tokens` tokens, `overlap` tokens apart."""
+    step = max(max_tokens - overlap, 1)
+    enc = try_get_encoding(model)
+    if enc is None:
+        # count_tokens() estimates len // 4 + 1, so stay one token under
+        size = max(max_tokens - 1, 1) * CHARS_PER_TOKEN
+        stride = max(size - overlap * CHARS_PER_TOKEN, 1)
+        return [text[i : i + size] for i in range(0, max(len(text) - (size - stride), 1), stride)]
+    ids = enc.encode(text, disallowed_special=())
+    return [enc.decode(ids[i : i + max_tokens]) for i in range(0, max(len(ids) - (max_tokens - step), 1), step)]
@@ -1,5 +1,6 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework import exceptions
+from apps.api_keys import cache as api_key_cache
 from apps.api_keys.models import APIKey
 
 
@@ -11,12 +12,13 @@ class APIKeyAuthentication(BaseAuthentication):
         if not key:
             return None
         try:
-            api_key = APIKey.objects.select_related("organization").get_plaintext(key)
+            api_key = api_key_cache.resolve(key)
         except APIKey.DoesNotExist:
             raise exceptions.AuthenticationFailed("Invalid API key")
         if api_key.status != APIKey.Status.ACTIVE:
             raise exceptions.AuthenticationFailed("API key revoked")
-        if api_key.quota is not None and api_key.usage_count >= api_key.quota:
+        # live counter includes usage not yet flushed to the DB
+        if api_key.quota is not None and api_key.live_usage >= api_key.quota:
             raise exceptions.AuthenticationFailed("API key quota exceeded")
         request.organization = api_key.organization
         request.auth_api_key = api_key
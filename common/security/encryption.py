@@ -1,17 +1,23 @@
 import base64
+from functools import lru_cache
 from django.conf import settings
 from cryptography.fernet import Fernet, InvalidToken
 
+@lru_cache(maxsize=4)
+def _fernet_for(key: str) -> Fernet:
+    # key derivation is cached per secret; settings changes still take effect
+    try:
+        return Fernet(key)
+    except Exception:
+        return Fernet(base64.urlsafe_b64encode(key.encode()[:32].ljust(32, b"0")))
+
 class Encryptor:
     @staticmethod
     def _fernet() -> Fernet:
         key = settings.ENCRYPTION_SECRET_KEY
         if not key:
             raise RuntimeError("ENCRYPTION_SECRET_KEY not configured")
-        try:
-            return Fernet(key)
-        except Exception:
-            return Fernet(base64.urlsafe_b64encode(key.encode()[:32].ljust(32, b"0")))
+        return _fernet_for(key)
 
     @classmethod
     def encrypt(cls, plaintext: str) -> str:
@@ -1,10 +1,23 @@
+import codecs
 import mimetypes
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from io import BytesIO
+from typing import Iterator, List, Optional, Tuple
 
 import magic
 from pypdf import PdfReader
 from docx import Document
 
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_MIMES = ("text/plain", "text/markdown", "text/csv")
+
+_SNIFF_BYTES = 8192
+_TEXT_READ_BYTES = 256 * 1024
+_DOCX_PARAGRAPHS_PER_SECTION = 200
+
 
 def sniff_mime(file_bytes: bytes) -> tuple[str, str]:
     """
@@ -26,11 +39,150 @@ def sniff_mime(file_bytes: bytes) -> tuple[str, str]:
     return "application/octet-stream", ".bin"
 
 
+def sniff_mime_file(path: str) -> tuple[str, str]:
+    """sniff_mime() on the file header only; the file is never fully read."""
+    with open(path, "rb") as f:
+        return sniff_mime(f.read(_SNIFF_BYTES))
+
+
+@contextmanager
+def _mapped(path: str):
+    # mmap keeps page text extraction off the Python heap: the kernel pages
+    # the file in on demand and shares it between pool workers.
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield BytesIO(b"")
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield m
+
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> List[str]:
+    """Process-pool entry point: text of pages [start, stop) of the PDF at `path`."""
+    with _mapped(path) as src:
+        reader = PdfReader(src)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def pdf_page_count(path: str) -> int:
+    with _mapped(path) as src:
+        return len(PdfReader(src).pages)
+
+
+def _iter_pdf(path: str, caps: dict, pages: Optional[Tuple[int, int]] = None) -> Iterator[str]:
+    max_pdf_pages = caps.get("MAX_PDF_PAGES", 500)
+    workers = int(caps.get("PDF_WORKERS", 0))
+    per_task = max(1, int(caps.get("PDF_PAGES_PER_TASK", 8)))
+
+    n_pages = pdf_page_count(path)
+    if n_pages > max_pdf_pages:
+        raise ValueError(f"PDF exceeds {max_pdf_pages} page limit.")
+    first, last = (0, n_pages) if pages is None else (max(pages[0], 0), min(pages[1], n_pages))
+
+    ranges = [(s, min(s + per_task, last)) for s in range(first, last, per_task)]
+    pending = []
+    pool = None
+    if workers > 0 and len(ranges) > 1:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(ranges)))
+        try:
+            pending.append(pool.submit(_extract_pdf_pages, path, *ranges[0]))
+        except (AssertionError, OSError, RuntimeError):
+            # e.g. inside a daemonic (prefork) worker that may not fork children
+            pool.shutdown(wait=False)
+            pool = None
+
+    if pool is None:
+        for start, stop in ranges:
+            yield from _extract_pdf_pages(path, start, stop)
+        return
+
+    # Keep a bounded window of page ranges in flight and yield them in page
+    # order, so the consumer can chunk/embed early pages while later ones are
+    # still being extracted, without buffering the whole document.
+    window = workers * 2
+    todo = iter(ranges[1:])
+    try:
+        for rng in todo:
+            pending.append(pool.submit(_extract_pdf_pages, path, *rng))
+            if len(pending) >= window:
+                break
+        while pending:
+            fut = pending.pop(0)
+            rng = next(todo, None)
+            if rng is not None:
+                pending.append(pool.submit(_extract_pdf_pages, path, *rng))
+            yield from fut.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _iter_text(path: str) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(_TEXT_READ_BYTES)
+            final = not block
+            try:
+                text = decoder.decode(block, final=final)
+            except UnicodeDecodeError:
+                raise ValueError("Could not decode text file with UTF-8.")
+            if text:
+                yield text
+            if final:
+                return
+
+
+def _iter_docx(path: str) -> Iterator[str]:
+    doc = Document(path)
+    paras = doc.paragraphs
+    for i in range(0, len(paras), _DOCX_PARAGRAPHS_PER_SECTION):
+        section = "\n".join(p.text for p in paras[i : i + _DOCX_PARAGRAPHS_PER_SECTION])
+        yield section if i == 0 else "\n" + section
+
+
+def iter_text_sections(
+    file_type: str, path: str, caps: dict, pages: Optional[Tuple[int, int]] = None
+) -> Iterator[str]:
+    """
+    Stream extracted text from the file at `path` as successive sections
+    (PDF: one per page, text: fixed-size blocks, DOCX: paragraph groups).
+    Concatenating the sections gives the full document text.
+
+    caps: MAX_UPLOAD_MB, MAX_PDF_PAGES, and for PDFs PDF_WORKERS (process
+    pool size, 0 = extract in-process) and PDF_PAGES_PER_TASK.
+    pages: PDF only, extract just pages [start, stop).
+    Raises ValueError on violations or unsupported types.
+    """
+    max_upload_mb = caps.get("MAX_UPLOAD_MB", 25)
+    if os.path.getsize(path) > max_upload_mb * 1024 * 1024:
+        raise ValueError(f"File size exceeds {max_upload_mb}MB limit.")
+    if pages is not None and file_type != "application/pdf":
+        raise ValueError(f"Page ranges are only supported for PDF, not {file_type}")
+
+    if file_type in TEXT_MIMES:
+        yield from _iter_text(path)
+    elif file_type == "application/pdf":
+        try:
+            yield from _iter_pdf(path, caps, pages)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to extract text from PDF: {e}")
+    elif file_type == DOCX_MIME:
+        try:
+            yield from _iter_docx(path)
+        except Exception as e:
+            raise ValueError(f"Failed to extract text from DOCX: {e}")
+    else:
+        raise ValueError(f"Unsupported file type for extraction: {file_type}")
+
+
 def extract_text_from_bytes(file_type: str, raw: bytes, caps: dict) -> str:
     """
     Extracts text from raw file bytes based on the file_type.
     Enforces MAX_UPLOAD_MB and MAX_PDF_PAGES caps.
     Raises ValueError on violations or unsupported types.
+    Prefer iter_text_sections() for stored files; this keeps `raw` in memory.
     """
     max_upload_mb = caps.get("MAX_UPLOAD_MB", 25)
     max_pdf_pages = caps.get("MAX_PDF_PAGES", 500)
@@ -38,11 +190,7 @@ def extract_text_from_bytes(file_type: str, raw: bytes, caps: dict) -> str:
     if len(raw) > max_upload_mb * 1024 * 1024:
         raise ValueError(f"File size exceeds {max_upload_mb}MB limit.")
 
-    if (
-        file_type == "text/plain"
-        or file_type == "text/markdown"
-        or file_type == "text/csv"
-    ):
+    if file_type in TEXT_MIMES:
         try:
             return raw.decode("utf-8")
         except UnicodeDecodeError:
@@ -52,16 +200,10 @@ def extract_text_from_bytes(file_type: str, raw: bytes, caps: dict) -> str:
             reader = PdfReader(BytesIO(raw))
             if len(reader.pages) > max_pdf_pages:
                 raise ValueError(f"PDF exceeds {max_pdf_pages} page limit.")
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
-            return text
+            return "".join(page.extract_text() or "" for page in reader.pages)
         except Exception as e:
             raise ValueError(f"Failed to extract text from PDF: {e}")
-    elif (
-        file_type
-        == "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    ):
+    elif file_type == DOCX_MIME:
         try:
             doc = Document(BytesIO(raw))
             return "\n".join([para.text for para in doc.paragraphs])
@@ -1,7 +1,9 @@
-import json, random, time
+import asyncio, json, random, time
 import httpx
 from typing import Any, Dict, Optional
+from asgiref.sync import sync_to_async
 from . import circuit_breaker as cb
+from . import transport
 
 RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
 DEFAULT_MAX_ATTEMPTS = 5
@@ -16,15 +18,15 @@ def _sleep(attempt: int) -> None:
 def post_json_resilient(base_key: str, url: str, headers: Dict[str, str], payload: Dict[str, Any], timeout_s: int) -> httpx.Response:
     if not cb.allow(base_key):
         raise httpx.HTTPError(f"Circuit open for {base_key}")
+    client = transport.get_client(url)
     last_err: Optional[Exception] = None
     for attempt in range(1, DEFAULT_MAX_ATTEMPTS + 1):
         try:
-            with httpx.Client(timeout=timeout_s) as client:
-                resp = client.post(url, headers=headers, json=payload)
-                if resp.status_code in RETRY_STATUSES:
-                    raise httpx.HTTPStatusError("retryable", request=resp.request, response=resp)
-                cb.record_success(base_key)
-                return resp
+            resp = client.post(url, headers=headers, json=payload, timeout=timeout_s)
+            if resp.status_code in RETRY_STATUSES:
+                raise httpx.HTTPStatusError("retryable", request=resp.request, response=resp)
+            cb.record_success(base_key)
+            return resp
         except Exception as e:
             last_err = e
             cb.record_failure(base_key)
@@ -34,20 +36,25 @@ def post_json_resilient(base_key: str, url: str, headers: Dict[str, str], payloa
     assert last_err is not None
     raise last_err
 
-def stream_post_sse_resilient(base_key: str, url: str, headers: Dict[str, str], params: Dict[str, str], payload: Dict[str, Any], timeout_s: int):
-    # Retry only the CONNECT phase
+def stream_post_sse_resilient(base_key: str, url: str, headers: Dict[str, str], params: Dict[str, str], payload: Dict[str, Any], timeout_s: int) -> httpx.Response:
+    """
+    Open a streaming POST on the pooled client and return the response with
+    its body unread. Caller must close it (``with closing(resp):``) to hand the
+    connection back to the pool. Retries only the CONNECT phase.
+    """
     if not cb.allow(base_key):
         raise httpx.HTTPError(f"Circuit open for {base_key}")
+    client = transport.get_client(url)
     last_err = None
     for attempt in range(1, DEFAULT_MAX_ATTEMPTS + 1):
         try:
-            client = httpx.Client(timeout=timeout_s)
-            resp = client.stream("POST", url, headers=headers, params=params, json=payload)
-            resp.__enter__()  # managed ctx
+            req = client.build_request("POST", url, headers=headers, params=params, json=payload, timeout=timeout_s)
+            resp = client.send(req, stream=True)
             if resp.status_code in RETRY_STATUSES:
+                resp.close()
                 raise httpx.HTTPStatusError("retryable", request=resp.request, response=resp)
             cb.record_success(base_key)
-            return client, resp
+            return resp
         except Exception as e:
             last_err = e
             cb.record_failure(base_key)
@@ -55,3 +62,59 @@ def stream_post_sse_resilient(base_key: str, url: str, headers: Dict[str, str],
                 break
             _sleep(attempt)
     raise last_err
+
+# ---- async (ASGI) variants ----
+# Circuit-breaker bookkeeping is a couple of Redis round trips; run it off the
+# event loop rather than pulling in a second (asyncio) Redis client.
+_cb_allow = sync_to_async(cb.allow, thread_sensitive=False)
+_cb_success = sync_to_async(cb.record_success, thread_sensitive=False)
+_cb_failure = sync_to_async(cb.record_failure, thread_sensitive=False)
+
+async def _asleep(attempt: int) -> None:
+    backoff = min(DEFAULT_BASE_DELAY * (2 ** (attempt - 1)), DEFAULT_MAX_DELAY)
+    jitter = random.uniform(0, 0.15)
+    await asyncio.sleep(backoff + jitter)
+
+async def apost_json_resilient(base_key: str, url: str, headers: Dict[str, str], payload: Dict[str, Any], timeout_s: int) -> httpx.Response:
+    if not await _cb_allow(base_key):
+        raise httpx.HTTPError(f"Circuit open for {base_key}")
+    client = transport.get_async_client(url)
+    last_err: Optional[Exception] = None
+    for attempt in range(1, DEFAULT_MAX_ATTEMPTS + 1):
+        try:
+            resp = await client.post(url, headers=headers, json=payload, timeout=timeout_s)
+            if resp.status_code in RETRY_STATUSES:
+                raise httpx.HTTPStatusError("retryable", request=resp.request, response=resp)
+            await _cb_success(base_key)
+            return resp
+        except Exception as e:
+            last_err = e
+            await _cb_failure(base_key)
+            if attempt >= DEFAULT_MAX_ATTEMPTS:
+                break
+            await _asleep(attempt)
+    assert last_err is not None
+    raise last_err
+
+async def astream_post_sse_resilient(base_key: str, url: str, headers: Dict[str, str], params: Dict[str, str], payload: Dict[str, Any], timeout_s: int) -> httpx.Response:
+    """Async twin of stream_post_sse_resilient; caller must ``await resp.aclose()``."""
+    if not await _cb_allow(base_key):
+        raise httpx.HTTPError(f"Circuit open for {base_key}")
+    client = transport.get_async_client(url)
+    last_err = None
+    for attempt in range(1, DEFAULT_MAX_ATTEMPTS + 1):
+        try:
+            req = client.build_request("POST", url, headers=headers, params=params, json=payload, timeout=timeout_s)
+            resp = await client.send(req, stream=True)
+            if resp.status_code in RETRY_STATUSES:
+                await resp.aclose()
+                raise httpx.HTTPStatusError("retryable", request=resp.request, response=resp)
+            await _cb_success(base_key)
+            return resp
+        except Exception as e:
+            last_err = e
+            await _cb_failure(base_key)
+            if attempt >= DEFAULT_MAX_ATTEMPTS:
+                break
+            await _asleep(attempt)
+    raise last_err
@@ -10,3 +10,44 @@ def sse_event(data, event: str | None = None) -> str:
     for line in str(data).splitlines():
         out += f"data: {line}\n"
     return out + "\n"
+
+
+def _parse_data_line(line) -> dict | None | bool:
+    """
+    Decode one upstream SSE line.
+    Returns the JSON payload of a `data:` line, None for lines to skip,
+    or False at end of stream (`[DONE]` or empty data).
+    """
+    if not line:
+        return None
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", "ignore")
+    if not line.startswith("data:"):
+        return None
+    datum = line[5:].strip()
+    if not datum or datum == "[DONE]":
+        return False
+    try:
+        return json.loads(datum)
+    except Exception:
+        return None
+
+
+def iter_sse_json(lines):
+    """Yield decoded JSON payloads from an iterable of SSE lines."""
+    for line in lines:
+        obj = _parse_data_line(line)
+        if obj is False:
+            break
+        if obj is not None:
+            yield obj
+
+
+async def aiter_sse_json(lines):
+    """Async twin of iter_sse_json for httpx's aiter_lines()."""
+    async for line in lines:
+        obj = _parse_data_line(line)
+        if obj is False:
+            break
+        if obj is not None:
+            yield obj
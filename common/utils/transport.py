@@ -0,0 +1,104 @@
+"""
+Per-process registry of pooled httpx clients, one per origin
+(scheme://host:port), so LLM and embedding calls reuse keep-alive
+TCP/TLS connections instead of handshaking on every request.
+
+Async callers (ASGI views) get an httpx.AsyncClient per event loop and
+origin via get_async_client(); an AsyncClient must not cross loops.
+
+Fork safety: gunicorn (--preload) and Celery prefork fork after the parent
+may already hold open connections. Sharing those sockets across processes
+corrupts streams, so the registry is dropped in the child via
+os.register_at_fork, with a pid check as a fallback.
+"""
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+
+try:  # HTTP/2 needs the optional `h2` package (httpx[http2])
+    import h2  # noqa: F401
+
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
+
+_clients: Dict[str, httpx.Client] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(getattr(settings, "HTTP_POOL_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(getattr(settings, "HTTP_POOL_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=float(getattr(settings, "HTTP_KEEPALIVE_EXPIRY_S", 30.0)),
+    )
+
+
+def http2_enabled() -> bool:
+    return _H2_AVAILABLE and bool(getattr(settings, "HTTP2_ENABLED", True))
+
+
+def get_client(url: str) -> httpx.Client:
+    """Shared client for the origin of `url`. Pass per-request timeouts."""
+    if os.getpid() != _pid:
+        _reset_after_fork()
+    origin = _origin(url)
+    client = _clients.get(origin)
+    if client is None:
+        with _lock:
+            client = _clients.get(origin)
+            if client is None:
+                client = httpx.Client(http2=http2_enabled(), limits=_limits(), timeout=30.0)
+                _clients[origin] = client
+    return client
+
+
+def get_async_client(url: str) -> httpx.AsyncClient:
+    """Shared AsyncClient for the running event loop and the origin of `url`."""
+    if os.getpid() != _pid:
+        _reset_after_fork()
+    loop = asyncio.get_running_loop()
+    origin = _origin(url)
+    with _lock:
+        per_loop = _async_clients.setdefault(loop, {})
+        client = per_loop.get(origin)
+        if client is None:
+            client = httpx.AsyncClient(http2=http2_enabled(), limits=_limits(), timeout=30.0)
+            per_loop[origin] = client
+    return client
+
+
+def close_all() -> None:
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for c in clients:
+        c.close()
+
+
+def _reset_after_fork() -> None:
+    # Drop (don't close) inherited clients: their sockets belong to the parent.
+    global _lock, _pid
+    _clients.clear()
+    _async_clients.clear()
+    _lock = threading.Lock()
+    _pid = os.getpid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,39 @@
+"""
+Monotonic version counters in Redis, shared by all web/worker processes.
+
+Writers bump a stamp when the underlying rows change; readers keep an
+in-process copy of derived data tagged with the stamp they saw and reload
+when it moves. get() returns None when Redis is unreachable so callers can
+bypass their cache instead of serving something they cannot validate.
+"""
+import redis
+from django.conf import settings
+from django.db import transaction
+
+_r = None
+
+def _client():
+    global _r
+    if _r is None:
+        _r = redis.from_url(getattr(settings, "IDEMPOTENCY_REDIS_URL", "redis://localhost:6379/0"))
+    return _r
+
+def _k(scope: str, key) -> str:
+    return f"ver:{scope}:{key}"
+
+def get(scope: str, key) -> int | None:
+    try:
+        v = _client().get(_k(scope, key))
+    except redis.RedisError:
+        return None
+    return int(v) if v else 0
+
+def bump(scope: str, key) -> int | None:
+    try:
+        return int(_client().incr(_k(scope, key)))
+    except redis.RedisError:
+        return None
+
+def bump_on_commit(scope: str, key) -> None:
+    """Bump once the surrounding transaction commits (immediately in autocommit)."""
+    transaction.on_commit(lambda: bump(scope, key))
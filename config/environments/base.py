@@ -1,3 +1,4 @@
+import json
 import os
 from datetime import timedelta
 from pathlib import Path
@@ -71,6 +72,7 @@ TEMPLATES = [{
 }]
 
 WSGI_APPLICATION = "config.wsgi.application"
+ASGI_APPLICATION = "config.asgi.application"
 
 DATABASES = {
     "default": {
@@ -90,8 +92,33 @@ DEFAULT_FILE_STORAGE = os.environ.get(
     "DEFAULT_FILE_STORAGE",
     "django.core.files.storage.FileSystemStorage",
 )
+# Django >= 5.1 only reads STORAGES; DEFAULT_FILE_STORAGE still picks the backend
+STORAGES = {
+    "default": {"BACKEND": DEFAULT_FILE_STORAGE},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
+# S3 / S3-compatible storage (storages.backends.s3.S3Storage); MinIO locally
+AWS_STORAGE_BUCKET_NAME = os.environ.get("AWS_STORAGE_BUCKET_NAME", "")
+AWS_S3_ENDPOINT_URL = os.environ.get("AWS_S3_ENDPOINT_URL") or None
+AWS_S3_REGION_NAME = os.environ.get("AWS_S3_REGION_NAME") or None
+AWS_S3_ADDRESSING_STYLE = os.environ.get("AWS_S3_ADDRESSING_STYLE") or None
+
+# ---- uploads (apps.documents.uploads) ----
+UPLOAD_PART_SIZE_MB = int(os.environ.get("UPLOAD_PART_SIZE_MB", 8))  # S3 minimum is 5 (except the last part)
+UPLOAD_SESSION_TTL_S = int(os.environ.get("UPLOAD_SESSION_TTL_S", 24 * 3600))
+# Presigned direct-to-S3 part uploads; needs S3Storage as the default storage
+UPLOAD_DIRECT_S3 = os.environ.get("UPLOAD_DIRECT_S3", "0") == "1"
+UPLOAD_PRESIGN_EXPIRES_S = int(os.environ.get("UPLOAD_PRESIGN_EXPIRES_S", 3600))
+# Endpoint put into presigned URLs when clients reach S3 differently than the app
+UPLOAD_PRESIGN_ENDPOINT_URL = os.environ.get("UPLOAD_PRESIGN_ENDPOINT_URL", "")
+# Identical files in an org reuse the first copy's chunks (apps.documents.dedupe)
+DOCUMENT_DEDUPE_ENABLED = os.environ.get("DOCUMENT_DEDUPE_ENABLED", "1") == "1"
+# a duplicate of a file still processing is requeued every DOCUMENT_DEDUPE_RETRY_S
+# until that one finishes, for at most DOCUMENT_DEDUPE_MAX_WAIT_S after upload
+DOCUMENT_DEDUPE_RETRY_S = int(os.environ.get("DOCUMENT_DEDUPE_RETRY_S", 30))
+DOCUMENT_DEDUPE_MAX_WAIT_S = int(os.environ.get("DOCUMENT_DEDUPE_MAX_WAIT_S", 3600))
 
 # DRF
 REST_FRAMEWORK = {
@@ -141,6 +168,64 @@ SPECTACULAR_SETTINGS = {"TITLE": "Org Chatbot API", "VERSION": "0.1.0"}
 # Celery / Redis
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
+# Only chord headers (process_document_slice) store results; they expire quickly
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_RESULT_EXPIRES = int(os.environ.get("CELERY_RESULT_EXPIRES_S", 3600))
+# Long CPU-bound tasks: reserve one message at a time, and with acks_late
+# (set on the ingest tasks) redeliver if a worker dies mid-document
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get("CELERY_WORKER_PREFETCH_MULTIPLIER", 1))
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+# Lanes: "ingest" is interactive (uploads, single reprocess), "ingest_bulk"
+# takes re-index jobs, "maintenance" the periodic cleanup. The page slices
+# of a large PDF are queued in the lane of their document's job (the route
+# below is only the fallback). Run separate workers per lane (see
+# docker-compose.yml).
+CELERY_QUEUE_INGEST = "ingest"
+CELERY_QUEUE_INGEST_BULK = "ingest_bulk"
+CELERY_QUEUE_MAINTENANCE = "maintenance"
+CELERY_TASK_ROUTES = {
+    "apps.documents.tasks.process_document": {"queue": CELERY_QUEUE_INGEST},
+    "apps.documents.tasks.finalize_document": {"queue": CELERY_QUEUE_INGEST},
+    "apps.documents.tasks.fail_document": {"queue": CELERY_QUEUE_INGEST},
+    "apps.documents.tasks.process_document_slice": {"queue": CELERY_QUEUE_INGEST_BULK},
+    "apps.documents.tasks.gc_chunk_generations": {"queue": CELERY_QUEUE_MAINTENANCE},
+    "apps.documents.tasks.dispatch_ingest": {"queue": CELERY_QUEUE_MAINTENANCE},
+    "apps.documents.tasks.purge_upload_sessions": {"queue": CELERY_QUEUE_MAINTENANCE},
+    "apps.documents.tasks.requeue_document": {"queue": CELERY_QUEUE_MAINTENANCE},
+    "apps.chat.tasks.*": {"queue": CELERY_QUEUE_MAINTENANCE},
+    "apps.api_keys.tasks.*": {"queue": CELERY_QUEUE_MAINTENANCE},
+}
+# must exceed the longest acks_late task or it is delivered twice
+CELERY_VISIBILITY_TIMEOUT_S = int(os.environ.get("CELERY_VISIBILITY_TIMEOUT_S", 4 * 3600))
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    # Redis priorities 0 (first) .. 9; within a lane smaller files go first
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+    "visibility_timeout": CELERY_VISIBILITY_TIMEOUT_S,
+}
+CELERY_BEAT_SCHEDULE = {
+    "flush-api-key-usage": {
+        "task": "apps.api_keys.tasks.flush_api_key_usage",
+        "schedule": float(os.environ.get("API_KEY_USAGE_FLUSH_S", 10)),
+    },
+    "purge-semantic-cache": {
+        "task": "apps.chat.tasks.purge_semantic_cache",
+        "schedule": float(os.environ.get("SEMANTIC_CACHE_PURGE_S", 3600)),
+    },
+    "purge-upload-sessions": {
+        "task": "apps.documents.tasks.purge_upload_sessions",
+        "schedule": float(os.environ.get("UPLOAD_PURGE_S", 3600)),
+    },
+    "dispatch-ingest": {
+        "task": "apps.documents.tasks.dispatch_ingest",
+        "schedule": float(os.environ.get("INGEST_DISPATCH_SWEEP_S", 10)),
+    },
+    "gc-chunk-generations": {
+        "task": "apps.documents.tasks.gc_chunk_generations",
+        "schedule": float(os.environ.get("CHUNK_GC_SWEEP_S", 3600)),
+    },
+}
 
 # Secrets-at-rest
 ENCRYPTION_SECRET_KEY = os.environ.get("ENCRYPTION_SECRET_KEY", "")
@@ -154,33 +239,145 @@ DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "no-reply@example.com"
 
 # ---- LLM / Chat ----
 LLM_CHAT_TIMEOUT_S = int(os.environ.get("LLM_CHAT_TIMEOUT_S", 30))
+# Overlap query embedding with bot/provider lookup in chat (apps.chat.stages)
+CHAT_PARALLEL_STAGES = os.environ.get("CHAT_PARALLEL_STAGES", "1") == "1"
+CHAT_STAGE_WORKERS = int(os.environ.get("CHAT_STAGE_WORKERS", 8))
+# Per-org resolved chatbot/provider/client cache (apps.chatbot.config_cache); 0 disables
+BOT_CONFIG_CACHE_TTL_S = int(os.environ.get("BOT_CONFIG_CACHE_TTL_S", 60))
+BOT_CONFIG_CACHE_MAX = int(os.environ.get("BOT_CONFIG_CACHE_MAX", 1024))
+# Semantic answer cache (apps.chat.semantic_cache), opt-in per chatbot
+SEMANTIC_CACHE_TTL_S = int(os.environ.get("SEMANTIC_CACHE_TTL_S", 7 * 24 * 3600))
+# {"model": [usd per 1k prompt tokens, usd per 1k completion tokens]} for saved-cost stats
+LLM_TOKEN_PRICES = json.loads(os.environ.get("LLM_TOKEN_PRICES", "{}"))
+# Pooled keep-alive transport shared by LLM + embedding clients (common.utils.transport)
+HTTP_POOL_MAX_CONNECTIONS = int(os.environ.get("HTTP_POOL_MAX_CONNECTIONS", 100))
+HTTP_POOL_MAX_KEEPALIVE = int(os.environ.get("HTTP_POOL_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY_S = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY_S", 30))
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "1") == "1"
 
 # ---- RAG / retrieval ----
 EMBEDDING_PROVIDER = os.environ.get("EMBEDDING_PROVIDER", "openai")
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
 # MUST match your embedding model; 1536 is correct for OpenAI text-embedding-3-small
 EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", 1536))
+# Batching for get_embeddings(); provider caps are 2048 inputs / 300k tokens per request
+EMBEDDING_BATCH_MAX_ITEMS = int(os.environ.get("EMBEDDING_BATCH_MAX_ITEMS", 512))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.environ.get("EMBEDDING_BATCH_MAX_TOKENS", 250000))
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 4))
+# Content-addressed embedding cache (in-process LRU + Redis)
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_LOCAL_MAX = int(os.environ.get("EMBEDDING_CACHE_LOCAL_MAX", 2048))
+EMBEDDING_CACHE_REDIS_MAX = int(os.environ.get("EMBEDDING_CACHE_REDIS_MAX", 200000))
+EMBEDDING_CACHE_TTL_S = int(os.environ.get("EMBEDDING_CACHE_TTL_S", 7 * 24 * 3600))
 
 TOP_K = int(os.environ.get("TOP_K", 6))
 MAX_CONTEXT_CHARS = int(os.environ.get("MAX_CONTEXT_CHARS", 12000))
+# Prompt context packing (apps.chat.context): token budget per chat model
+# (longest prefix match in the JSON map, else the default), and the share of
+# the best chunk's score a chunk needs to be included (0 = no cutoff)
+CHAT_CONTEXT_MAX_TOKENS = int(os.environ.get("CHAT_CONTEXT_MAX_TOKENS", 3000))
+CHAT_CONTEXT_MAX_TOKENS_BY_MODEL = json.loads(os.environ.get("CHAT_CONTEXT_MAX_TOKENS_BY_MODEL", "{}"))
+CHAT_CONTEXT_SCORE_RATIO = float(os.environ.get("CHAT_CONTEXT_SCORE_RATIO", 0.5))
+
+# ---- ANN index (pgvector) ----
+ANN_INDEX_METHOD = os.environ.get("ANN_INDEX_METHOD", "hnsw")  # hnsw | ivfflat
+ANN_HNSW_M = int(os.environ.get("ANN_HNSW_M", 16))
+ANN_HNSW_EF_CONSTRUCTION = int(os.environ.get("ANN_HNSW_EF_CONSTRUCTION", 64))
+ANN_IVFFLAT_LISTS = int(os.environ.get("ANN_IVFFLAT_LISTS", 0))  # 0 = derive from row count
+ANN_HNSW_EF_SEARCH = int(os.environ.get("ANN_HNSW_EF_SEARCH", 40))
+ANN_IVFFLAT_PROBES = int(os.environ.get("ANN_IVFFLAT_PROBES", 10))
+# "relaxed_order" / "strict_order" (pgvector >= 0.8), empty to disable
+ANN_ITERATIVE_SCAN = os.environ.get("ANN_ITERATIVE_SCAN", "")
+ANN_BUILD_MAINTENANCE_WORK_MEM = os.environ.get("ANN_BUILD_MAINTENANCE_WORK_MEM", "")
+# What the ANN index holds: full | halfvec | binary (apps.documents.ann).
+# Build the matching index first: `ann_index build --storage halfvec`
+EMBEDDING_STORAGE = os.environ.get("EMBEDDING_STORAGE", "full")
+# candidates per result reranked at full precision; 0 = 4 (halfvec) / 10 (binary)
+EMBEDDING_RERANK_FACTOR = int(os.environ.get("EMBEDDING_RERANK_FACTOR", 0))
+# Two-stage Matryoshka retrieval: candidates by the first N embedding dims
+# (renormalized), rescored on the full vector. Orgs may override both
+# (Organization.retrieval_coarse_*). Each size in the choices needs its
+# index: `ann_index build --dims 256`. 0 = off.
+RETRIEVAL_COARSE_DIMS = int(os.environ.get("RETRIEVAL_COARSE_DIMS", 0))
+RETRIEVAL_COARSE_DIMS_CHOICES = json.loads(os.environ.get("RETRIEVAL_COARSE_DIMS_CHOICES", "[256, 512]"))
+RETRIEVAL_COARSE_FACTOR = int(os.environ.get("RETRIEVAL_COARSE_FACTOR", 8))
+# vector | lexical | hybrid (apps.documents.retrieval); per chatbot / request overrides
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "vector")
+RETRIEVAL_RRF_K = int(os.environ.get("RETRIEVAL_RRF_K", 60))
+# hybrid: candidates per result fetched from each side before fusion
+RETRIEVAL_HYBRID_DEPTH = int(os.environ.get("RETRIEVAL_HYBRID_DEPTH", 3))
+# hybrid: queries of up to this many terms with an identifier-like term go lexical first
+RETRIEVAL_KEYWORD_MAX_TERMS = int(os.environ.get("RETRIEVAL_KEYWORD_MAX_TERMS", 4))
+# Per-tenant chunk partitions (apps.documents.partitions), applied by
+# `manage.py chunk_partitions repartition`: hash buckets for most orgs, a
+# dedicated partition for orgs above CHUNK_DEDICATED_MIN_ROWS (0 = only
+# those named with --dedicated)
+CHUNK_PARTITION_BUCKETS = int(os.environ.get("CHUNK_PARTITION_BUCKETS", 16))
+CHUNK_DEDICATED_MIN_ROWS = int(os.environ.get("CHUNK_DEDICATED_MIN_ROWS", 0))
+CHUNK_PARTITION_LOCK_TIMEOUT = os.environ.get("CHUNK_PARTITION_LOCK_TIMEOUT", "5s")
 
 # ---- chunking ----
+# "token": structure-aware chunks within a token budget of EMBEDDING_MODEL;
+# "chars": fixed character windows (CHUNK_SIZE_CHARS / CHUNK_OVERLAP_CHARS)
+CHUNKER = os.environ.get("CHUNKER", "token")
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", 512))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 48))
 CHUNK_SIZE_CHARS = int(os.environ.get("CHUNK_SIZE_CHARS", 1500))
 CHUNK_OVERLAP_CHARS = int(os.environ.get("CHUNK_OVERLAP_CHARS", 200))
 
 # ---- Idempotency / SSE ----
 IDEMPOTENCY_REDIS_URL = os.environ.get("IDEMPOTENCY_REDIS_URL", CELERY_BROKER_URL)
 IDEMPOTENCY_TTL_S = int(os.environ.get("IDEMPOTENCY_TTL_S", 3600))
+EMBEDDING_CACHE_REDIS_URL = os.environ.get("EMBEDDING_CACHE_REDIS_URL", IDEMPOTENCY_REDIS_URL)
 
 # Timezone (explicit; Django defaults to UTC with USE_TZ=True)
 TIME_ZONE = os.environ.get("TIME_ZONE", "UTC")
 USE_TZ = True
 
 API_KEY_HMAC_SECRET = os.environ.get("API_KEY_HMAC_SECRET", ENCRYPTION_SECRET_KEY)
+# Resolved X-API-Key records cached in Redis by HMAC (apps.api_keys.cache)
+API_KEY_CACHE_TTL_S = int(os.environ.get("API_KEY_CACHE_TTL_S", 300))
 
 # Document extraction caps
 MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", 25))
 MAX_PDF_PAGES = int(os.environ.get("MAX_PDF_PAGES", 500))
+# PDF page extraction process pool per ingest task; 0 extracts in-process.
+# Falls back to in-process inside daemonic (prefork) workers.
+EXTRACT_PDF_WORKERS = int(os.environ.get("EXTRACT_PDF_WORKERS", min(4, os.cpu_count() or 1)))
+EXTRACT_PDF_PAGES_PER_TASK = int(os.environ.get("EXTRACT_PDF_PAGES_PER_TASK", 8))
+# Chunks per embedding call while extraction is still streaming
+INGEST_EMBED_BATCH_CHUNKS = int(os.environ.get("INGEST_EMBED_BATCH_CHUNKS", 128))
+INGEST_EMBED_MAX_INFLIGHT = int(os.environ.get("INGEST_EMBED_MAX_INFLIGHT", 2))
+# PDFs with at least this many pages are ingested as a chord of page-range
+# slices spread over the worker fleet; 0 disables fan-out
+INGEST_FANOUT_MIN_PAGES = int(os.environ.get("INGEST_FANOUT_MIN_PAGES", 64))
+INGEST_SLICE_PAGES = int(os.environ.get("INGEST_SLICE_PAGES", 32))
+# Fair-share scheduling across orgs (apps.documents.scheduler): documents
+# wait in per-org queues and at most INGEST_MAX_INFLIGHT run at once
+INGEST_FAIR_SHARE = os.environ.get("INGEST_FAIR_SHARE", "1") == "1"
+INGEST_MAX_INFLIGHT = int(os.environ.get("INGEST_MAX_INFLIGHT", 16))
+INGEST_ORG_MAX_INFLIGHT = int(os.environ.get("INGEST_ORG_MAX_INFLIGHT", 4))
+# {"<org id>": weight}; documents started per round-robin turn, default 1
+INGEST_ORG_WEIGHTS = json.loads(os.environ.get("INGEST_ORG_WEIGHTS", "{}"))
+# a slot not released by then (worker died) is reclaimed; never less than the
+# visibility timeout, since the broker may still redeliver the job until then
+INGEST_RUNNING_TTL_S = int(os.environ.get("INGEST_RUNNING_TTL_S", CELERY_VISIBILITY_TIMEOUT_S + 3600))
+# shadow chunk generations of runs that failed before flipping are swept by
+# gc_chunk_generations once no generation was allocated for this long (a
+# redelivered run may still be writing until the visibility timeout)
+# a PENDING slice touched this recently is still queued or running in its
+# chord, and resuming the ingest does not dispatch it again
+INGEST_SLICE_LEASE_S = int(os.environ.get("INGEST_SLICE_LEASE_S", CELERY_VISIBILITY_TIMEOUT_S))
+CHUNK_SHADOW_GRACE_S = int(os.environ.get("CHUNK_SHADOW_GRACE_S", INGEST_RUNNING_TTL_S))
+# Ingest progress (apps.documents.progress): worker publish interval, ids per
+# status/stream request, and how long one SSE stream stays open
+INGEST_PROGRESS_INTERVAL_S = float(os.environ.get("INGEST_PROGRESS_INTERVAL_S", 1.0))
+INGEST_PROGRESS_MAX_IDS = int(os.environ.get("INGEST_PROGRESS_MAX_IDS", 100))
+INGEST_PROGRESS_STREAM_MAX_S = int(os.environ.get("INGEST_PROGRESS_STREAM_MAX_S", 300))
+INGEST_PROGRESS_KEEPALIVE_S = int(os.environ.get("INGEST_PROGRESS_KEEPALIVE_S", 15))
+# Shared embedding budget for the API key, tokens per minute (0 = unlimited)
+EMBEDDING_TPM_LIMIT = int(os.environ.get("EMBEDDING_TPM_LIMIT", 0))
+EMBEDDING_TPM_MAX_WAIT_S = float(os.environ.get("EMBEDDING_TPM_MAX_WAIT_S", 120))
 
 # CORS settings
 CORS_ALLOWED_ORIGINS = os.environ.get("CORS_ALLOWED_ORIGINS", "").split(",") if os.environ.get("CORS_ALLOWED_ORIGINS") else []